@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
+import json
 import os
 
+from corsheaders.defaults import default_headers
+
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -45,6 +48,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "croupier.middleware.CompressionMiddleware",
+    "croupier.middleware.ReplicaRoutingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
@@ -79,12 +84,54 @@ WSGI_APPLICATION = "api.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# SQLite mode for several workers (see croupier/sqlite.py): journal mode and synchronous level of the connections,
+# seconds a writer waits for the lock held by another one, and writes per transaction of the synchronizations
+SQLITE_JOURNAL_MODE = os.environ.get("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT = float(os.environ.get("SQLITE_BUSY_TIMEOUT", "20"))
+SQLITE_WRITE_BATCH_SIZE = int(os.environ.get("SQLITE_WRITE_BATCH_SIZE", "200"))
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": os.path.join(BASE_DIR, "db.sqlite3"),
+        "OPTIONS": {"timeout": SQLITE_BUSY_TIMEOUT},
+        # File database for the tests too, so they run in WAL mode with concurrent connections
+        "TEST": {"NAME": os.path.join(BASE_DIR, "test_db.sqlite3")},
+    }
+}
+
+# Read replicas of the default database (kept up to date by the database replication), given as a JSON object
+# of database settings by alias. List, change feed and analytics reads are sent to them, except for a user who
+# has written in the last DATABASE_READ_YOUR_WRITES_WINDOW seconds, or when their replication lag (seconds,
+# measured with the replication heartbeat) is over DATABASE_REPLICA_MAX_LAG. The last writes of the users are kept
+# in the default cache (CACHES below), which has to be shared by all the processes serving requests
+DATABASE_REPLICAS = json.loads(os.environ.get("DATABASE_REPLICAS", "{}"))
+DATABASES.update(DATABASE_REPLICAS)
+DATABASE_ROUTERS = ["croupier.routers.ReplicaRouter"]
+DATABASE_READ_YOUR_WRITES_WINDOW = int(os.environ.get("DATABASE_READ_YOUR_WRITES_WINDOW", "10"))
+DATABASE_REPLICA_MAX_LAG = int(os.environ.get("DATABASE_REPLICA_MAX_LAG", "30"))
+DATABASE_REPLICA_LAG_CHECK_INTERVAL = int(os.environ.get("DATABASE_REPLICA_LAG_CHECK_INTERVAL", "10"))
+
+
+# Cache shared by the workers (L2 of the croupier.cache namespaces, with an in-process L1 in front). By default in
+# the file system, shared by the workers of the host (a Memcached or Redis backend is needed for several hosts)
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get("CACHE_BACKEND", "django.core.cache.backends.filebased.FileBasedCache"),
+        "LOCATION": os.environ.get("CACHE_LOCATION", os.path.join(BASE_DIR, ".cache", "croupier")),
+        "OPTIONS": {"MAX_ENTRIES": int(os.environ.get("CACHE_MAX_ENTRIES", "10000"))},
     }
 }
+# Entries and seconds the values are kept in L1 (the delay for invalidations made by other workers to be seen),
+# and seconds a worker waits for a value being computed by another one before computing it too
+CACHE_L1_MAX_ENTRIES = int(os.environ.get("CACHE_L1_MAX_ENTRIES", "1024"))
+CACHE_L1_TTL = int(os.environ.get("CACHE_L1_TTL", "5"))
+CACHE_LOCK_WAIT = int(os.environ.get("CACHE_LOCK_WAIT", "10"))
+# Seconds the blueprint plans (inputs and job nodes, dropped when the catalog synchronization finds blueprints removed
+# or updated) and the marketplace orders of the users are cached
+BLUEPRINT_PLAN_CACHE_TTL = int(os.environ.get("BLUEPRINT_PLAN_CACHE_TTL", "3600"))
+MARKETPLACE_ORDERS_CACHE_TTL = int(os.environ.get("MARKETPLACE_ORDERS_CACHE_TTL", "300"))
 
 
 # Password validation
@@ -128,12 +175,27 @@ OIDC_OP_AUTHORIZATION_ENDPOINT = os.environ["OIDC_OP_AUTHORIZATION_ENDPOINT"]
 OIDC_OP_TOKEN_ENDPOINT = os.environ["OIDC_OP_TOKEN_ENDPOINT"]
 OIDC_OP_USER_ENDPOINT = os.environ["OIDC_OP_USER_ENDPOINT"]
 
+# Access tokens are verified locally with the public keys of the realm (JWKS), refreshed periodically (seconds)
+# and whenever a token is signed with an unknown key (at most once per OIDC_JWKS_MIN_REFRESH seconds)
+OIDC_RP_SIGN_ALGO = os.environ.get("OIDC_RP_SIGN_ALGO", "RS256")
+OIDC_OP_ISSUER = os.environ.get(
+    "OIDC_OP_ISSUER", OIDC_OP_TOKEN_ENDPOINT.replace("/protocol/openid-connect/token", ""))
+OIDC_OP_JWKS_ENDPOINT = os.environ.get(
+    "OIDC_OP_JWKS_ENDPOINT", OIDC_OP_TOKEN_ENDPOINT.replace("/openid-connect/token", "/openid-connect/certs"))
+OIDC_TOKEN_AUDIENCE = os.environ.get("OIDC_TOKEN_AUDIENCE", OIDC_RP_CLIENT_ID)
+OIDC_TOKEN_LEEWAY = int(os.environ.get("OIDC_TOKEN_LEEWAY", "30"))
+OIDC_JWKS_REFRESH_INTERVAL = int(os.environ.get("OIDC_JWKS_REFRESH_INTERVAL", "3600"))
+OIDC_JWKS_MIN_REFRESH = int(os.environ.get("OIDC_JWKS_MIN_REFRESH", "30"))
+# Authenticated users are kept in memory (seconds), instead of being queried on every request
+OIDC_USER_CACHE_TTL = int(os.environ.get("OIDC_USER_CACHE_TTL", "300"))
+
 # LOGIN_REDIRECT_URL = "<URL path to redirect to after login>"
 # LOGOUT_REDIRECT_URL = "<URL path to redirect to after logout>"
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "mozilla_django_oidc.contrib.drf.OIDCAuthentication",
+        # Local verification of the access tokens (introspection if the realm keys are not available)
+        "keycloak.auth.KeycloakJWTAuthentication",
         # other authentication classes, if needed
     ]
 }
@@ -155,7 +217,102 @@ ORCHESTRATOR_USER = os.environ["ORCHESTRATOR_USER"]
 ORCHESTRATOR_PASS = os.environ["ORCHESTRATOR_PASS"]
 ORCHESTRATOR_TENANT = os.environ["ORCHESTRATOR_TENANT"]
 
+# Registry of Cloudify managers (and tenants), by name. By default, the single manager configured above. Others
+# are given as a JSON object in ORCHESTRATOR_MANAGERS: {"name": {"host", "user", "password", "tenant"}, ...}
+ORCHESTRATOR_DEFAULT_MANAGER = os.environ.get("ORCHESTRATOR_DEFAULT_MANAGER", "default")
+ORCHESTRATOR_MANAGERS = json.loads(os.environ.get("ORCHESTRATOR_MANAGERS", "{}")) or {
+    ORCHESTRATOR_DEFAULT_MANAGER: {
+        "host": ORCHESTRATOR_HOST,
+        "user": ORCHESTRATOR_USER,
+        "password": ORCHESTRATOR_PASS,
+        "tenant": ORCHESTRATOR_TENANT,
+    },
+}
+if ORCHESTRATOR_DEFAULT_MANAGER not in ORCHESTRATOR_MANAGERS:
+    ORCHESTRATOR_DEFAULT_MANAGER = next(iter(ORCHESTRATOR_MANAGERS))
+# Placement of new applications (and so of their instances) on the managers: least_loaded (fewest instances),
+# round_robin, or affinity (all the applications of a user on the same manager)
+ORCHESTRATOR_PLACEMENT_POLICY = os.environ.get("ORCHESTRATOR_PLACEMENT_POLICY", "least_loaded")
+
+# Protection against a slow or unavailable orchestrator: timeouts (seconds), maximum concurrent calls of all the
+# worker processes (slots kept in the database) and how long to wait for a free slot, and circuit breaker
+# (consecutive failures to open it, shared by the processes through the cache, and seconds before a probe call is
+# allowed)
+ORCHESTRATOR_CONNECT_TIMEOUT = float(os.environ.get("ORCHESTRATOR_CONNECT_TIMEOUT", "5"))
+ORCHESTRATOR_READ_TIMEOUT = float(os.environ.get("ORCHESTRATOR_READ_TIMEOUT", "60"))
+ORCHESTRATOR_MAX_CONCURRENT_CALLS = int(os.environ.get("ORCHESTRATOR_MAX_CONCURRENT_CALLS", "8"))
+ORCHESTRATOR_BULKHEAD_WAIT = float(os.environ.get("ORCHESTRATOR_BULKHEAD_WAIT", "2"))
+ORCHESTRATOR_BREAKER_FAILURES = int(os.environ.get("ORCHESTRATOR_BREAKER_FAILURES", "5"))
+ORCHESTRATOR_BREAKER_RESET = float(os.environ.get("ORCHESTRATOR_BREAKER_RESET", "30"))
+
+# Access to the metrics endpoint (scraped without Keycloak): bearer token of the scraper, and client addresses
+# allowed without it (comma separated, only the local host by default)
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.environ.get("METRICS_ALLOWED_IPS", "127.0.0.1,::1").split(",")
+                       if ip.strip()]
+
+# Freshness policy (seconds) of the catalog data copied from the orchestrator: data younger than max_age is
+# served directly, data within the stale_while_revalidate window is served while refreshed in background
+CATALOG_FRESHNESS = {
+    "blueprints": {
+        "max_age": int(os.environ.get("CATALOG_BLUEPRINTS_MAX_AGE", "60")),
+        "stale_while_revalidate": int(os.environ.get("CATALOG_BLUEPRINTS_STALE_WHILE_REVALIDATE", "600")),
+    },
+    "deployments": {
+        "max_age": int(os.environ.get("CATALOG_DEPLOYMENTS_MAX_AGE", "30")),
+        "stale_while_revalidate": int(os.environ.get("CATALOG_DEPLOYMENTS_STALE_WHILE_REVALIDATE", "300")),
+    },
+}
+
+# Catalog mirror (mirror_catalog command): when enabled, the list endpoints are database reads, and they only
+# synchronize with the orchestrator if the mirror is more than CATALOG_MIRROR_MAX_STALENESS seconds behind. The
+# mirror gets the changes every CATALOG_MIRROR_INTERVAL seconds, and the whole catalog (to remove what was deleted
+# from the orchestrator) every CATALOG_MIRROR_FULL_INTERVAL seconds
+CATALOG_MIRROR = os.environ.get("CATALOG_MIRROR", "false").lower() == "true"
+CATALOG_MIRROR_MAX_STALENESS = int(os.environ.get("CATALOG_MIRROR_MAX_STALENESS", "120"))
+CATALOG_MIRROR_INTERVAL = int(os.environ.get("CATALOG_MIRROR_INTERVAL", "15"))
+CATALOG_MIRROR_FULL_INTERVAL = int(os.environ.get("CATALOG_MIRROR_FULL_INTERVAL", "600"))
+
+# Maximum duration (seconds) of a catalog synchronization lease, and how long concurrent requests wait for it
+CATALOG_SYNC_LOCK_TIMEOUT = int(os.environ.get("CATALOG_SYNC_LOCK_TIMEOUT", "300"))
+CATALOG_SYNC_WAIT = int(os.environ.get("CATALOG_SYNC_WAIT", "60"))
+
+# Archive of the event logs of finished executions: events per compressed chunk, maximum events archived per
+# execution, days the archives are kept after the execution finished, and total size (bytes) of the archive
+EXECUTION_LOG_CHUNK_SIZE = int(os.environ.get("EXECUTION_LOG_CHUNK_SIZE", "100"))
+EXECUTION_LOG_MAX_EVENTS = int(os.environ.get("EXECUTION_LOG_MAX_EVENTS", "100000"))
+EXECUTION_LOG_RETENTION_DAYS = int(os.environ.get("EXECUTION_LOG_RETENTION_DAYS", "90"))
+EXECUTION_LOG_MAX_BYTES = int(os.environ.get("EXECUTION_LOG_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Maximum size (bytes) of the inputs file of a new deployment, parsed in memory and validated before calling the
+# orchestrator
+DEPLOYMENT_INPUTS_MAX_SIZE = int(os.environ.get("DEPLOYMENT_INPUTS_MAX_SIZE", str(1024 * 1024)))
+
+# Requests with an Idempotency-Key header (instance creation and execution): seconds their response is replayed
+# to retries with the same key, lease (seconds) of the worker running them, and seconds a concurrent retry waits
+# for the original request to finish (kept short, the waiting retry holds a worker: afterwards it is answered 409
+# with Retry-After)
+IDEMPOTENCY_KEY_TTL = int(os.environ.get("IDEMPOTENCY_KEY_TTL", str(24 * 3600)))
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.environ.get("IDEMPOTENCY_LOCK_TIMEOUT", "600"))
+IDEMPOTENCY_WAIT = int(os.environ.get("IDEMPOTENCY_WAIT", "3"))
+
+# Outbound HTTP calls to the integrations (Vault, marketplace, CKAN...): timeouts (seconds), connections kept
+# alive per host, and retries (with exponential backoff) of idempotent requests
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", "30"))
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "10"))
+HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", "3"))
+HTTP_RETRY_BACKOFF = float(os.environ.get("HTTP_RETRY_BACKOFF", "0.3"))
+
 CORS_ORIGIN_ALLOW_ALL = True
+# The frontend sends Idempotency-Key headers, and reads whether a response was replayed, the age of the catalog
+# data served and the total number of results of the searches
+CORS_ALLOW_HEADERS = list(default_headers) + ["idempotency-key"]
+CORS_EXPOSE_HEADERS = ["Idempotent-Replayed", "X-Data-Age", "X-Total-Count"]
+
+# Responses smaller than this size (in bytes) are sent uncompressed
+RESPONSE_COMPRESSION_MIN_SIZE = int(os.environ.get("RESPONSE_COMPRESSION_MIN_SIZE", "1024"))
+
 LOGGING = {
         'version': 1,
         'disable_existing_loggers': False,
@@ -27,5 +27,9 @@ urlpatterns = [
     path("", include("croupier.urls")),
     path("credentials/", views.UserCredentialsViewSet.as_view()),
     path("credentials/<str:pk>/", views.CredentialViewSet.as_view()),
-    path("ckan/", views.CKANViewSet.as_view())
+    path("ckan/", views.CKANViewSet.as_view()),
+    path("changes/", views.ChangesViewSet.as_view()),
+    path("logs/", views.ExecutionLogSearchViewSet.as_view()),
+    path("analytics/", views.AnalyticsViewSet.as_view()),
+    path("metrics/", views.MetricsViewSet.as_view())
 ]
@@ -0,0 +1,130 @@
+""" Execution analytics, from daily rollups of the finished executions maintained incrementally """
+import bisect
+import logging
+from datetime import timedelta
+
+from cloudify_rest_client.executions import Execution
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from croupier.models import ExecutionDailyStats, InstanceExecution
+
+# Get an instance of a logger
+LOGGER = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the buckets of the execution time histograms, the last bucket has no upper bound
+TIME_BUCKETS = [1, 2, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200, 14400, 28800, 43200, 86400]
+
+
+def _bucket(execution_time):
+    return bisect.bisect_left(TIME_BUCKETS, execution_time or 0)
+
+
+def _stats_key(execution):
+    day = (execution.finished or execution.created).date()
+    return day, execution.instance.app.name, execution.owner_id, execution.status
+
+
+def record_execution(execution):
+    """ Count a final execution in the daily statistics, only once """
+    if not execution.is_final:
+        return
+
+    with transaction.atomic():
+        # The flag is set atomically, so concurrent refreshes of the same execution count it once
+        if not InstanceExecution.objects.filter(id=execution.id, in_stats=False).update(in_stats=True):
+            return
+        day, app, owner, status = _stats_key(execution)
+        stats, _ = ExecutionDailyStats.objects.select_for_update().get_or_create(
+            day=day, app=app, owner=owner, status=status
+        )
+        _add(stats, execution)
+        stats.save()
+    execution.in_stats = True
+
+
+def _add(stats, execution):
+    histogram = stats.time_histogram or [0] * (len(TIME_BUCKETS) + 1)
+    histogram[_bucket(execution.execution_time)] += 1
+    stats.time_histogram = histogram
+    stats.count += 1
+    stats.total_time += execution.execution_time or 0
+    if execution.has_errors:
+        stats.with_errors += 1
+
+
+def rebuild():
+    """ Recompute all the daily statistics from the executions. Returns the number of executions counted """
+    rollups = {}
+    executions = InstanceExecution.objects.filter(is_final=True).select_related("instance__app")
+    for execution in executions.iterator():
+        key = _stats_key(execution)
+        if key not in rollups:
+            day, app, owner, status = key
+            rollups[key] = ExecutionDailyStats(day=day, app=app, owner=owner, status=status, time_histogram=[])
+        _add(rollups[key], execution)
+
+    with transaction.atomic():
+        ExecutionDailyStats.objects.all().delete()
+        ExecutionDailyStats.objects.bulk_create(rollups.values(), batch_size=500)
+        InstanceExecution.objects.filter(is_final=True).update(in_stats=True)
+        InstanceExecution.objects.filter(is_final=False).update(in_stats=False)
+    counted = sum(stats.count for stats in rollups.values())
+    LOGGER.info("Execution statistics rebuilt: " + str(counted) + " executions, " + str(len(rollups)) + " rollups")
+    return counted
+
+
+def _percentile(histogram, fraction):
+    # Estimated by linear interpolation inside the bucket that contains the percentile
+    total = sum(histogram)
+    if not total:
+        return None
+    rank = fraction * total
+    accumulated = 0
+    for index, count in enumerate(histogram):
+        if count and accumulated + count >= rank:
+            lower = TIME_BUCKETS[index - 1] if index > 0 else 0
+            upper = TIME_BUCKETS[index] if index < len(TIME_BUCKETS) else TIME_BUCKETS[-1] * 2
+            return lower + (upper - lower) * (rank - accumulated) / count
+        accumulated += count
+    return None
+
+
+def summarize(rollups, group_field):
+    """ Aggregates of the rollups by application or by user: executions by status, error and failure rates, mean,
+    p50 and p95 execution time, and daily throughput """
+    groups = {}
+    for group, status, count, with_errors, total_time in rollups.values_list(
+            group_field, "status").annotate(Sum("count"), Sum("with_errors"), Sum("total_time")).order_by():
+        summary = groups.setdefault(group, {group_field: group, "executions": 0, "by_status": {},
+                                            "with_errors": 0, "total_time": 0})
+        summary["executions"] += count
+        summary["by_status"][status] = count
+        summary["with_errors"] += with_errors
+        summary["total_time"] += total_time
+
+    for group, day, count in rollups.values_list(group_field, "day").annotate(Sum("count")).order_by("day"):
+        groups[group].setdefault("daily", []).append({"day": day, "executions": count})
+
+    # Histograms are merged per group (bounded by the days and statuses of the period)
+    histograms = {}
+    for group, histogram in rollups.values_list(group_field, "time_histogram"):
+        merged = histograms.setdefault(group, [0] * (len(TIME_BUCKETS) + 1))
+        for index, count in enumerate(histogram):
+            merged[index] += count
+
+    result_list = []
+    for group, summary in sorted(groups.items()):
+        executions = summary["executions"]
+        summary["error_rate"] = summary.pop("with_errors") / executions
+        summary["failure_rate"] = summary["by_status"].get(Execution.FAILED, 0) / executions
+        summary["mean_time"] = summary.pop("total_time") / executions
+        summary["p50_time"] = _percentile(histograms[group], 0.5)
+        summary["p95_time"] = _percentile(histograms[group], 0.95)
+        result_list.append(summary)
+    return result_list
+
+
+def period_rollups(days):
+    return ExecutionDailyStats.objects.filter(day__gte=timezone.now().date() - timedelta(days=days - 1))
@@ -1,5 +1,17 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
 
 
 class CroupierConfig(AppConfig):
     name = 'croupier'
+
+    def ready(self):
+        from croupier import changes, sqlite
+        from keycloak import auth
+        changes.connect_signals()
+        connection_created.connect(sqlite.configure_connection)
+        # Changed users are not served from the cache of authenticated users
+        post_save.connect(auth.forget_user, sender=settings.AUTH_USER_MODEL)
+        post_delete.connect(auth.forget_user, sender=settings.AUTH_USER_MODEL)
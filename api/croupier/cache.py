@@ -0,0 +1,271 @@
+""" Caching helpers: in-process caches and the two-tier cache shared by the workers """
+import functools
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache as django_cache
+
+from croupier import metrics
+
+# Get an instance of a logger
+LOGGER = logging.getLogger(__name__)
+
+# Seconds between checks while waiting for a value computed by another worker
+LOCK_POLL_INTERVAL = 0.1
+
+
+class LRUCache:
+    """ Thread-safe cache bounded in number of entries (least recently used are evicted first), whose
+    entries expire after a time to live (seconds) """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """ Coalesces concurrent calls with the same key: only the first one runs, the others wait for it and
+    get the same result (or exception) """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def do(self, key, function):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = function()
+            return flight.result
+        except Exception as err:
+            flight.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+
+# Marker of the values not found in a cache (None can be cached)
+_MISSING = object()
+
+
+def _no_error(result):
+    # Results of the (data, error) functions are cached only when there was no error
+    if isinstance(result, tuple) and len(result) == 2:
+        return result[1] is None
+    return result is not None
+
+
+class Namespace:
+    """ Two-tier cache of a kind of values: an in-process LRU (L1) in front of the cache shared by all the workers
+    (L2, Django's default cache).
+
+    Keys are prefixed with the version of the namespace, kept in L2: invalidating the namespace moves it to a new
+    version, so no worker reads the previous values again (other workers notice it within CACHE_L1_TTL seconds,
+    the longest time an L1 entry, version included, is served without going to L2). Namespaces that are not shared
+    keep their values in L1 only (e.g. values not meant to leave the process).
+
+    Values missing in both tiers are computed once: concurrent callers of the process wait for the first one, and
+    the workers that do not get the L2 lock of the key wait (up to CACHE_LOCK_WAIT seconds) for the worker that
+    got it to store the value.
+    """
+
+    def __init__(self, name, ttl, shared=True, max_entries=None):
+        self.name = name
+        self.ttl = ttl
+        self.shared = shared
+        l1_ttl = min(ttl, settings.CACHE_L1_TTL) if shared else ttl
+        self._l1 = LRUCache(max_entries or settings.CACHE_L1_MAX_ENTRIES, l1_ttl)
+        self._flights = SingleFlight()
+        self._stats_lock = threading.Lock()
+        self._stats = {"l1": 0, "l2": 0, "miss": 0}
+        _namespaces[name] = self
+
+    def _version_key(self):
+        return "cache-version:" + self.name
+
+    def _version(self):
+        version = self._l1.get(self._version_key())
+        if version is None:
+            version = django_cache.get(self._version_key())
+            if version is None:
+                version = uuid.uuid4().hex
+                if not django_cache.add(self._version_key(), version, None):
+                    version = django_cache.get(self._version_key(), version)
+            self._l1.set(self._version_key(), version)
+        return version
+
+    def _l2_key(self, key):
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return "cache:" + self.name + ":" + self._version() + ":" + digest
+
+    def _count(self, tier):
+        with self._stats_lock:
+            self._stats[tier] += 1
+            requests = sum(self._stats.values())
+            hit_ratio = (self._stats["l1"] + self._stats["l2"]) / requests
+        metrics.increment("cache_requests_total", {"namespace": self.name, "tier": tier})
+        metrics.set_gauge("cache_hit_ratio", round(hit_ratio, 4), {"namespace": self.name})
+
+    def _lookup(self, key):
+        value = self._l1.get(key, _MISSING)
+        if value is not _MISSING:
+            return "l1", value
+        if self.shared:
+            value = django_cache.get(self._l2_key(key), _MISSING)
+            if value is not _MISSING:
+                self._l1.set(key, value)
+                return "l2", value
+        return "miss", _MISSING
+
+    def get(self, key, default=None):
+        tier, value = self._lookup(key)
+        self._count(tier)
+        return default if value is _MISSING else value
+
+    def set(self, key, value):
+        self._l1.set(key, value)
+        if self.shared:
+            django_cache.set(self._l2_key(key), value, self.ttl)
+
+    def delete(self, key):
+        # Other workers may serve the value from their L1 for up to CACHE_L1_TTL seconds
+        self._l1.delete(key)
+        if self.shared:
+            django_cache.delete(self._l2_key(key))
+
+    def invalidate(self):
+        """ Drop all the values of the namespace, in all the workers """
+        django_cache.set(self._version_key(), uuid.uuid4().hex, None)
+        self._l1.clear()
+        LOGGER.info("Cache namespace invalidated: " + self.name)
+
+    def _wait_for_l2(self, key):
+        deadline = time.monotonic() + settings.CACHE_LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_INTERVAL)
+            value = django_cache.get(self._l2_key(key), _MISSING)
+            if value is not _MISSING:
+                return value
+        return _MISSING
+
+    def _compute(self, key, function, cacheable):
+        # The value may have been stored while waiting to compute it
+        tier, value = self._lookup(key)
+        if value is not _MISSING:
+            return value
+
+        lock_key = None
+        if self.shared:
+            lock_key = self._l2_key(key) + ":lock"
+            if not django_cache.add(lock_key, True, settings.CACHE_LOCK_WAIT):
+                # Another worker is computing the value
+                value = self._wait_for_l2(key)
+                if value is not _MISSING:
+                    self._l1.set(key, value)
+                    return value
+                lock_key = None
+
+        try:
+            value = function()
+            if cacheable(value):
+                self.set(key, value)
+            return value
+        finally:
+            if lock_key is not None:
+                django_cache.delete(lock_key)
+
+    def get_or_compute(self, key, function, cacheable=_no_error):
+        """ Return the cached value of the key, or compute it with the function (stored if cacheable) """
+        tier, value = self._lookup(key)
+        self._count(tier)
+        if value is not _MISSING:
+            return value
+        return self._flights.do(key, lambda: self._compute(key, function, cacheable))
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats)
+
+
+# Namespaces by name
+_namespaces = {}
+
+
+def namespace(name):
+    return _namespaces[name]
+
+
+def cached(name, ttl, shared=True, cacheable=_no_error):
+    """ Decorator caching the results of a function in a namespace, by the values of its arguments. The namespace
+    is available as the namespace attribute of the decorated function (e.g. to invalidate it) """
+
+    def decorator(function):
+        cache_namespace = Namespace(name, ttl, shared)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            return cache_namespace.get_or_compute(key, lambda: function(*args, **kwargs), cacheable)
+
+        wrapper.namespace = cache_namespace
+        return wrapper
+
+    return decorator
@@ -0,0 +1,650 @@
+""" Synchronization of the orchestrator catalog (blueprints, deployments and executions) with the internal model """
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import IntegrityError, connection
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from croupier import analytics, cfy, metrics, sqlite
+from croupier.models import Application, AppInstance, CatalogSync, InstanceExecution
+from croupier.serializers import ApplicationSerializer, AppInstanceSerializer
+
+# Get an instance of a logger
+LOGGER = logging.getLogger(__name__)
+
+# Catalog resources, each one with its own freshness policy (settings.CATALOG_FRESHNESS)
+BLUEPRINTS = "blueprints"
+DEPLOYMENTS = "deployments"
+EXECUTIONS = "executions"
+
+# Date of the items used as watermark of the changes of each resource
+WATERMARK_FIELDS = {BLUEPRINTS: "updated_at", DEPLOYMENTS: "updated_at", EXECUTIONS: "created_at"}
+
+# Seconds between checks while waiting for a synchronization run by another worker
+SYNC_POLL_INTERVAL = 0.5
+
+# Resources being refreshed in background by this process
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+# Only one thread per process takes part in the synchronization of each resource
+_process_locks = {BLUEPRINTS: threading.Lock(), DEPLOYMENTS: threading.Lock(), EXECUTIONS: threading.Lock()}
+
+
+def serialize_blueprint_list(blueprints):
+    data = []
+    for blueprint in blueprints:
+        entry = {
+            'name': blueprint["id"],
+            'description': blueprint["description"],
+            'created': blueprint["created_at"],
+            'updated': blueprint["updated_at"],
+            'owner': blueprint["created_by"],
+            'main_blueprint_file': blueprint["main_file_name"],
+            'inputs': cfy.extract_blueprint_inputs(blueprint),
+            'manager': blueprint["manager"]}
+        data.append(entry)
+        # LOGGER.info("Blueprint received: " + str(entry))
+    return data
+
+
+def serialize_deployment_list(deployments):
+    data = []
+    for deployment in deployments:
+        entry = {
+            'name': deployment["id"],
+            'description': deployment["description"],
+            'created': deployment["created_at"],
+            'updated': deployment["updated_at"],
+            'owner': deployment["created_by"],
+            'blueprint': deployment["blueprint_id"],
+            'inputs': cfy.extract_deployment_inputs(deployment),
+            'manager': deployment["manager"]}
+        data.append(entry)
+    return data
+
+
+def synchronize_user_in_model(username):
+    # Check if user exist, if not create it
+    queryset = User.objects.all().filter(username=username)
+    if len(queryset) == 0:
+        user = User.objects.create_user(username=username,
+                                        email='not given',
+                                        password=username)
+        LOGGER.info("User Created: " + str(user))
+        return user
+    else:
+        LOGGER.info("User " + username + " found!")
+        return queryset[0]
+
+
+def _invalidate_blueprint_plans():
+    # Blueprints removed or updated in the orchestrator console do not go through cfy.remove_blueprint
+    cfy.invalidate_blueprint_plans()
+    return True
+
+
+def synchronize_blueprint_list_in_model(blueprints, managers=None):
+    LOGGER.info("Number of blueprints found: " + str(len(blueprints)))
+
+    # The changes are computed first (calls to the orchestrator included) and written afterwards in short write
+    # transactions, so the database is not locked while the orchestrator answers
+    stored_apps = {app.name: app for app in Application.objects.all()}
+    writes = []
+    plans_invalidated = False
+
+    # Take the full list of blueprints in the DDBB and check which ones should be removed
+    # This is crucial, since blueprints in the DDBB, not present in Cloudify would fail execution
+    # Only the blueprints of the managers listed are considered (the others could not be reached)
+    blueprint_names = set(str(blueprint_properties['name']) for blueprint_properties in blueprints)
+    for internal_app in stored_apps.values():
+        if managers is not None and internal_app.manager not in managers:
+            continue
+        if internal_app.name not in blueprint_names:
+            LOGGER.info("Remove blueprint: " + str(internal_app))
+            writes.append(internal_app.delete)
+            plans_invalidated = plans_invalidated or _invalidate_blueprint_plans()
+
+    # Go through the complete list of the orchestrator, in order to add and/or modify blueprints
+    for blueprint in blueprints:
+        # Check if blueprint exists in apps data model
+        actual_object = stored_apps.get(blueprint['name'])
+
+        if actual_object is None:
+            # If not, create an app from the blueprint and save it in the model
+            # create blueprint on database
+            # create user in user model if it does not exist
+            synchronize_user_in_model(blueprint["owner"])
+            blueprint.update({"included": str(datetime.now(timezone.utc))})
+            blueprint.update({"is_new": "True"})
+            blueprint.update({"is_updated": "False"})
+            blueprint.update({"is_advertised": "False"})
+            LOGGER.info("Add blueprint: " + str(blueprint))
+
+            serializer = ApplicationSerializer(data=blueprint)
+            if serializer.is_valid():
+                inputs = blueprint["inputs"]
+                if inputs is None:
+                    inputs, _ = cfy.list_blueprint_inputs(blueprint["name"], blueprint["manager"])
+                writes.append(partial(serializer.save, inputs=inputs, manager=blueprint["manager"]))
+            else:
+                LOGGER.info(str(serializer.errors))
+        else:
+            # Check if the blueprint cannot be considered 'new' anymore (new < 10 days) or if it was updated
+            inclusion_date = actual_object.included
+            update_date = actual_object.updated
+            today_date = datetime.now(timezone.utc)
+            is_change = False
+
+            # Change status from new to not new?
+            if actual_object.is_new and (inclusion_date + timedelta(days=10)) < today_date:
+                actual_object.is_new = False
+                is_change = True
+                LOGGER.info("Blueprint not new anymore.")
+
+            # Update fields if it was updated in the Cloudify instance
+            if update_date < datetime.strptime(blueprint["updated"], "%Y-%m-%dT%H:%M:%S.%f%z"):
+                actual_object.is_updated = True
+                actual_object.description = blueprint["description"]
+                actual_object.main_blueprint_file = blueprint["main_blueprint_file"]
+                actual_object.updated = blueprint["updated"]
+                actual_object.inputs = None
+                is_change = True
+                LOGGER.info("Blueprint updated.")
+                # The plan may have changed (e.g. blueprint uploaded again with the same id in the console)
+                plans_invalidated = plans_invalidated or _invalidate_blueprint_plans()
+
+            # The blueprint could have been moved to another manager
+            if actual_object.manager != blueprint["manager"]:
+                actual_object.manager = blueprint["manager"]
+                is_change = True
+                LOGGER.info("Blueprint moved to manager " + blueprint["manager"])
+
+            # Refresh the inputs schema only if the blueprint changed (or it was never stored)
+            if actual_object.inputs is None:
+                actual_object.inputs = blueprint["inputs"]
+                if actual_object.inputs is None:
+                    actual_object.inputs, _ = cfy.list_blueprint_inputs(blueprint["name"], actual_object.manager)
+                is_change = actual_object.inputs is not None or is_change
+
+            # Update the blueprint information in the model (if there are changes)
+            if is_change:
+                LOGGER.info("Update blueprint info: " + actual_object.name)
+                writes.append(actual_object.save)
+
+    sqlite.write_in_batches(writes)
+    LOGGER.info("Blueprint changes written: " + str(len(writes)))
+    return len(writes)
+
+
+def synchronize_deployment_list_in_model(deployments, managers=None):
+    LOGGER.info("Number of deployments found: " + str(len(deployments)))
+
+    # The changes are computed first (calls to the orchestrator included) and written afterwards in short write
+    # transactions, so the database is not locked while the orchestrator answers
+    stored_instances = {instance.name: instance for instance in AppInstance.objects.all()}
+    stored_apps = {app.name: app for app in Application.objects.all()}
+    writes = []
+
+    # Take the full list of deployments in the DDBB and check which ones should be removed
+    # This is crucial, since deployments in the DDBB, not present in Cloudify would fail execution
+    # Only the deployments of the managers listed are considered (the others could not be reached)
+    LOGGER.info("Number of deployments stored: " + str(len(stored_instances)))
+    deployment_names = set(str(deployment_properties['name']) for deployment_properties in deployments)
+    for internal_app_instance in stored_instances.values():
+        if managers is not None and internal_app_instance.manager not in managers:
+            continue
+        if internal_app_instance.name not in deployment_names:
+            LOGGER.info("Remove deployment: " + str(internal_app_instance))
+            writes.append(internal_app_instance.delete)
+
+    # Go through the complete list of the orchestrator, in order to add and/or modify deployments
+    for deployment in deployments:
+        # Check if blueprint exists in apps data model
+        actual_object = stored_instances.get(deployment['name'])
+
+        if actual_object is None:
+            # If not, create an appInstance from the deployment and save it in the model
+            # create deployment on database
+            # create user in user model if it does not exist
+            synchronize_user_in_model(deployment["owner"])
+
+            # Link with the corresponding blueprint
+            # get associated app
+            app = stored_apps.get(deployment["blueprint"])
+            if app is None:
+                LOGGER.warning("Blueprint " + str(deployment["blueprint"]) + " not found, deployment not added")
+                continue
+            deployment.update({"is_new": "True"})
+            LOGGER.info("Add deployment: " + str(deployment))
+
+            serializer = AppInstanceSerializer(data=deployment)
+            if serializer.is_valid():
+                inputs = deployment["inputs"]
+                if inputs is None:
+                    inputs, _ = cfy.list_deployment_inputs(deployment["name"], deployment["manager"])
+                writes.append(partial(serializer.save, app=app, inputs=inputs, manager=deployment["manager"]))
+            else:
+                LOGGER.info(str(serializer.errors))
+        else:
+            # Check if the deployment cannot be considered 'new' anymore (new < 10 days) or if it was updated
+            inclusion_date = actual_object.created
+            update_date = actual_object.updated
+            today_date = datetime.now(timezone.utc)
+            is_change = False
+
+            # Change status from new to not new?
+            if actual_object.is_new and (inclusion_date + timedelta(days=10)) < today_date:
+                actual_object.is_new = False
+                is_change = True
+                LOGGER.info("Deployment not new anymore.")
+
+            # Update fields if it was updated in the Cloudify instance
+            if update_date < datetime.strptime(deployment["updated"], "%Y-%m-%dT%H:%M:%S.%f%z"):
+                actual_object.is_updated = True
+                actual_object.description = deployment["description"]
+                actual_object.updated = deployment["updated"]
+                actual_object.inputs = None
+                is_change = True
+                LOGGER.info("Deployment updated.")
+
+            if actual_object.manager != deployment["manager"]:
+                actual_object.manager = deployment["manager"]
+                is_change = True
+                LOGGER.info("Deployment moved to manager " + deployment["manager"])
+
+            # Refresh the inputs only if the deployment changed (or they were never stored)
+            if actual_object.inputs is None:
+                actual_object.inputs = deployment["inputs"]
+                if actual_object.inputs is None:
+                    actual_object.inputs, _ = cfy.list_deployment_inputs(deployment["name"], actual_object.manager)
+                is_change = actual_object.inputs is not None or is_change
+
+            # Update the deployment information in the model (if there are changes)
+            if is_change:
+                LOGGER.info("Update deployment info: " + actual_object.name)
+                writes.append(actual_object.save)
+
+    sqlite.write_in_batches(writes)
+    LOGGER.info("Deployment changes written: " + str(len(writes)))
+    return len(writes)
+
+
+def _merge_manager_lists(resource, results):
+    # Merge the lists returned by the managers that could be reached, keeping the first item with each id
+    # (ids are unique in the model). Returns the items and the managers merged
+    items = {}
+    managers = []
+    for manager, (manager_items, err) in results.items():
+        if err:
+            LOGGER.warning(resource + " of manager " + manager + " not synchronized: " + err)
+            continue
+        managers.append(manager)
+        for item in manager_items:
+            if item["id"] in items:
+                LOGGER.warning("Duplicated id in manager " + manager + ", ignored: " + item["id"])
+                continue
+            items[item["id"]] = item
+    return list(items.values()), managers
+
+
+def refresh_execution(execution):
+    # Finished executions are immutable, so they never contact the orchestrator again
+    if execution.is_final:
+        return execution
+
+    try:
+        exec_full_info = cfy.get_execution(execution.id, execution.instance.manager)
+    except cfy.ORCHESTRATOR_ERRORS as err:
+        # Keep serving the last known state of the execution
+        LOGGER.warning("Execution " + execution.id + " could not be updated: " + str(err))
+        return execution
+    LOGGER.info("Execution Info: " + str(exec_full_info))
+
+    # Update progress, task, status, time...
+    values = {
+        'status': exec_full_info['status'],
+        'execution_time': exec_full_info['execution_time'],
+        'current_task': exec_full_info['current_task'],
+        'current_operation': exec_full_info['current_operation'],
+        'progress': exec_full_info['progress'],
+        'num_errors': exec_full_info['num_errors'],
+        'error_message': exec_full_info['error_message'],
+        'job_progress': exec_full_info['job_progress'],
+    }
+    if exec_full_info['num_errors'] > 0:
+        values['has_errors'] = True
+    if cfy.has_execution_ended(exec_full_info['status']):
+        values['finished'] = parse_datetime(exec_full_info['end_time']) if exec_full_info['end_time'] else None
+        values['is_final'] = True
+
+    # Only write the fields that actually changed
+    changed_fields = [field for field, value in values.items() if getattr(execution, field) != value]
+    if changed_fields:
+        for field in changed_fields:
+            setattr(execution, field, values[field])
+        execution.save(update_fields=changed_fields + ['modified'])
+        LOGGER.info("Execution " + execution.id + " updated: " + str(changed_fields))
+
+    # Finished executions are added to the daily statistics
+    if execution.is_final:
+        analytics.record_execution(execution)
+
+    return execution
+
+
+def synchronize_execution_list_in_model(executions):
+    # Add the job executions started outside the backend (e.g. in the orchestrator console) on known deployments.
+    # Returns the number of rows changed, and the executions skipped because their deployment is not stored (yet)
+    run_executions = [execution for execution in executions if execution["workflow_id"] == cfy.RUN]
+    known_ids = set(InstanceExecution.objects.filter(
+        id__in=[execution["id"] for execution in run_executions]).values_list("id", flat=True))
+    instances = {instance.name: instance for instance in AppInstance.objects.filter(
+        name__in=[execution["deployment_id"] for execution in run_executions])}
+
+    writes = []
+    skipped = []
+    for execution in run_executions:
+        instance = instances.get(execution["deployment_id"])
+        if execution["id"] in known_ids:
+            continue
+        if instance is None:
+            skipped.append(execution)
+            continue
+        synchronize_user_in_model(execution["created_by"])
+        LOGGER.info("Add execution: " + execution["id"])
+        writes.append(InstanceExecution(id=execution["id"], instance=instance, owner_id=execution["created_by"],
+                                        created=parse_datetime(execution["created_at"])).save)
+    sqlite.write_in_batches(writes)
+    changes = len(writes)
+
+    # Update the executions that have not ended yet
+    for execution in InstanceExecution.objects.filter(is_final=False).select_related("instance"):
+        modified = execution.modified
+        refresh_execution(execution)
+        if execution.modified != modified:
+            changes += 1
+
+    LOGGER.info("Execution changes written: " + str(changes) + ", skipped: " + str(len(skipped)))
+    return changes, skipped
+
+
+def _list_changes(resource):
+    # Items of the resource changed since the watermarks of each manager (listed in parallel), and the new
+    # watermarks. Returns the items, the managers merged and the watermarks
+    sync_state = CatalogSync.objects.get(resource=resource)
+    watermarks = dict(sync_state.watermarks)
+    results = cfy.fan_out(lambda manager=None: cfy.list_changes(resource, watermarks.get(manager), manager))
+    items, managers = _merge_manager_lists(resource, results)
+
+    field = WATERMARK_FIELDS[resource]
+    for item in items:
+        if item[field] and item[field] > watermarks.get(item["manager"], ""):
+            watermarks[item["manager"]] = item[field]
+    LOGGER.info("Changes of " + resource + " since " + str(sync_state.watermarks) + ": " + str(len(items)))
+    return items, managers, watermarks
+
+
+def _hold_watermarks(resource, watermarks, skipped):
+    # Keep the watermark of each manager at its oldest item skipped, so it is listed again in the next runs. Items
+    # older than CATALOG_MIRROR_FULL_INTERVAL are not waited for anymore (a full synchronization of what they depend
+    # on has run since they were created), so the watermarks cannot stay behind forever
+    field = WATERMARK_FIELDS[resource]
+    limit = datetime.now(timezone.utc) - timedelta(seconds=settings.CATALOG_MIRROR_FULL_INTERVAL)
+    for item in skipped:
+        item_date = parse_datetime(item[field] or "")
+        if item_date is None or item_date < limit:
+            continue
+        if item[field] < watermarks.get(item["manager"], ""):
+            watermarks[item["manager"]] = item[field]
+    return watermarks
+
+
+def _save_watermarks(resource, watermarks):
+    CatalogSync.objects.filter(resource=resource).update(watermarks=watermarks)
+
+
+def synchronize_blueprints():
+    # All the managers are listed in parallel
+    blueprints, managers = _merge_manager_lists(BLUEPRINTS, cfy.fan_out(cfy.list_blueprints))
+    if not managers:
+        LOGGER.warning("Blueprints not synchronized: no manager available")
+        return None
+
+    # Synchronize blueprints returned from Cloudify with the internal model database of apps
+    # Rational: blueprints could be uploaded/removed in Cloudify using its console, not necessarily using
+    # the Hidalgo frontend
+    return synchronize_blueprint_list_in_model(serialize_blueprint_list(blueprints), managers)
+
+
+def synchronize_blueprint_changes():
+    blueprints, managers, watermarks = _list_changes(BLUEPRINTS)
+    if not managers:
+        LOGGER.warning("Blueprint changes not synchronized: no manager available")
+        return None
+
+    # No blueprint is removed (the full synchronizations find the blueprints removed from the orchestrator)
+    changes = synchronize_blueprint_list_in_model(serialize_blueprint_list(blueprints), managers=[])
+    _save_watermarks(BLUEPRINTS, watermarks)
+    return changes
+
+
+def synchronize_deployments():
+    # All the managers are listed in parallel
+    deployments, managers = _merge_manager_lists(DEPLOYMENTS, cfy.fan_out(cfy.list_deployments))
+    if not managers:
+        LOGGER.warning("Deployments not synchronized: no manager available")
+        return None
+
+    # Synchronize deployments returned from Cloudify with the internal model database of application instances
+    # Rational: deployments could be created in Cloudify using its console, not necessarily using
+    # the Hidalgo frontend
+    return synchronize_deployment_list_in_model(serialize_deployment_list(deployments), managers)
+
+
+def synchronize_deployment_changes():
+    deployments, managers, watermarks = _list_changes(DEPLOYMENTS)
+    if not managers:
+        LOGGER.warning("Deployment changes not synchronized: no manager available")
+        return None
+
+    # No deployment is removed (the full synchronizations find the deployments removed from the orchestrator)
+    changes = synchronize_deployment_list_in_model(serialize_deployment_list(deployments), managers=[])
+    _save_watermarks(DEPLOYMENTS, watermarks)
+    return changes
+
+
+def synchronize_executions():
+    executions, managers, watermarks = _list_changes(EXECUTIONS)
+    if not managers:
+        LOGGER.warning("Executions not synchronized: no manager available")
+        return None
+
+    # The executions of deployments not stored yet are listed again until their deployment is added
+    changes, skipped = synchronize_execution_list_in_model(executions)
+    _save_watermarks(EXECUTIONS, _hold_watermarks(EXECUTIONS, watermarks, skipped))
+    return changes
+
+
+# Synchronizers of the whole resource, and of its changes since the watermarks. They return the number of rows
+# changed, or None if no manager could be reached
+_SYNCHRONIZERS = {
+    BLUEPRINTS: synchronize_blueprints,
+    DEPLOYMENTS: synchronize_deployments,
+    EXECUTIONS: synchronize_executions,
+}
+_CHANGE_SYNCHRONIZERS = {
+    BLUEPRINTS: synchronize_blueprint_changes,
+    DEPLOYMENTS: synchronize_deployment_changes,
+    EXECUTIONS: synchronize_executions,
+}
+
+
+def _last_synced(resource):
+    sync_state = CatalogSync.objects.filter(resource=resource).first()
+    return sync_state.last_synced if sync_state is not None else None
+
+
+def _synced_after(resource, previous):
+    # True if a synchronization finished after the given one
+    last_synced = _last_synced(resource)
+    return last_synced is not None and (previous is None or last_synced > previous)
+
+
+def _acquire_sync_lock(resource, token):
+    # The lock is a lease on the resource row, so a crashed worker cannot keep it forever
+    try:
+        CatalogSync.objects.get_or_create(resource=resource)
+    except IntegrityError:
+        pass  # Created concurrently by another worker
+
+    now = datetime.now(timezone.utc)
+    return CatalogSync.objects.filter(resource=resource).filter(
+        Q(lock_expires__isnull=True) | Q(lock_expires__lt=now)
+    ).update(lock_owner=token, lock_expires=now + timedelta(seconds=settings.CATALOG_SYNC_LOCK_TIMEOUT)) == 1
+
+
+def _release_sync_lock(resource, token, **fields):
+    CatalogSync.objects.filter(resource=resource, lock_owner=token).update(lock_owner=None, lock_expires=None,
+                                                                            **fields)
+
+
+def _wait_for_sync(resource, previous):
+    # Wait for the synchronization run by another worker and share its result
+    deadline = time.monotonic() + settings.CATALOG_SYNC_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(SYNC_POLL_INTERVAL)
+        sync_state = CatalogSync.objects.filter(resource=resource).first()
+        if sync_state is None or sync_state.lock_owner is None:
+            break
+    return _synced_after(resource, previous)
+
+
+def synchronize(resource, wait=True, full=True):
+    """ Synchronize the resource with the orchestrator (only its changes since the last synchronization if full is
+    False) and record when it was done. A single synchronization per resource runs at a time across all the
+    workers: concurrent callers wait for it (unless wait is False) and share its result instead of listing the
+    orchestrator again """
+    previous = _last_synced(resource)
+    with _process_locks[resource]:
+        # Another thread of this process may have synchronized the resource while this one was waiting
+        if _synced_after(resource, previous):
+            return True
+
+        token = uuid.uuid4().hex
+        if not _acquire_sync_lock(resource, token):
+            LOGGER.info("Synchronization of " + resource + " already running in another worker")
+            return _wait_for_sync(resource, previous) if wait else False
+
+        try:
+            # The lock may have been acquired after another worker finished synchronizing
+            if _synced_after(resource, previous):
+                _release_sync_lock(resource, token)
+                return True
+
+            started = datetime.now(timezone.utc)
+            start = time.monotonic()
+            synchronizer = _SYNCHRONIZERS[resource] if full else _CHANGE_SYNCHRONIZERS[resource]
+            changes = synchronizer()
+            if changes is None:
+                _release_sync_lock(resource, token)
+                return False
+        except Exception:
+            _release_sync_lock(resource, token)
+            raise
+
+        duration = time.monotonic() - start
+        fields = {"last_synced": started, "last_duration": duration, "last_changes": changes}
+        if full:
+            fields["last_full_sync"] = started
+        _release_sync_lock(resource, token, **fields)
+
+        sync_type = "full" if full else "changes"
+        metrics.observe("catalog_sync_seconds", duration, {"resource": resource, "type": sync_type})
+        metrics.increment("catalog_sync_changes_total", {"resource": resource, "type": sync_type}, changes)
+        LOGGER.info("Synchronization of " + resource + " (" + sync_type + ") done in " + str(round(duration, 3)) +
+                    "s, rows changed: " + str(changes))
+        return True
+
+
+def data_age(resource):
+    # Seconds since the resource was last synchronized, or None if it never was
+    sync_state = CatalogSync.objects.filter(resource=resource).first()
+    if sync_state is None or sync_state.last_synced is None:
+        return None
+    return max((datetime.now(timezone.utc) - sync_state.last_synced).total_seconds(), 0)
+
+
+def _refresh(resource):
+    try:
+        synchronize(resource, wait=False)
+    except Exception as ex:
+        LOGGER.exception(ex)
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(resource)
+        # Threads get their own database connection, which must be closed explicitly
+        connection.close()
+
+
+def refresh_in_background(resource):
+    with _refreshing_lock:
+        if resource in _refreshing:
+            return
+        _refreshing.add(resource)
+
+    LOGGER.info("Refreshing " + resource + " in background")
+    threading.Thread(target=_refresh, args=(resource,), daemon=True).start()
+
+
+def ensure_fresh(resource):
+    """ Apply the freshness policy of the resource before serving it from the database, and return the age of
+    the data served (in seconds, None if it was never synchronized):
+    - fresh data (up to max_age) is served as it is
+    - stale data (up to max_age + stale_while_revalidate) is served while it is refreshed in background
+    - older data is synchronized before answering (or served as it is if the orchestrator is not available)
+    """
+    age = data_age(resource)
+
+    # The mirror keeps the data current, it is served from the database unless the mirror fell behind
+    if settings.CATALOG_MIRROR:
+        if age is not None and age <= settings.CATALOG_MIRROR_MAX_STALENESS:
+            return age
+        LOGGER.warning("Catalog mirror of " + resource + " behind (age: " + str(age) + "), synchronizing")
+        metrics.increment("catalog_mirror_fallback_total", {"resource": resource})
+        if synchronize(resource):
+            return 0
+        return age
+
+    policy = settings.CATALOG_FRESHNESS[resource]
+    if age is not None and age <= policy["max_age"]:
+        return age
+
+    if age is not None and age <= policy["max_age"] + policy["stale_while_revalidate"]:
+        refresh_in_background(resource)
+        return age
+
+    if synchronize(resource):
+        return 0
+    return age
+
+
+def report_metrics():
+    # Age (lag behind the orchestrator), duration and rows changed of the last synchronization of each resource,
+    # shared by all the processes through the database
+    for sync_state in CatalogSync.objects.all():
+        labels = {"resource": sync_state.resource}
+        if sync_state.last_synced is not None:
+            age = (datetime.now(timezone.utc) - sync_state.last_synced).total_seconds()
+            metrics.set_gauge("catalog_data_age_seconds", round(max(age, 0), 3), labels)
+        if sync_state.last_duration is not None:
+            metrics.set_gauge("catalog_last_sync_seconds", round(sync_state.last_duration, 3), labels)
+        if sync_state.last_changes is not None:
+            metrics.set_gauge("catalog_last_sync_changes", sync_state.last_changes, labels)
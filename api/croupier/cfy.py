@@ -1,6 +1,8 @@
 """ Cloudify python wrapper """
 import time
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse
 from django.conf import settings
 from datetime import *
@@ -12,6 +14,10 @@ from cloudify_rest_client.exceptions import (
     DeploymentEnvironmentCreationInProgressError,
     CloudifyClientError,
 )
+from requests.exceptions import RequestException
+
+from croupier.cache import cached
+from croupier.resilience import Bulkhead, CircuitBreaker, GuardedSession
 
 # Get an instance of a logger
 LOGGER = logging.getLogger(__name__)
@@ -33,118 +39,263 @@ STARTED = "started"
 CANCELLING = "cancelling"
 FORCE_CANCELLING = "force_cancelling"
 
+# Lifecycle of the jobs in the run_jobs workflow: operation, progress (percentage) of the job once the operation
+# succeeded and while it is running, from the last stage to the first one
+JOB_STAGES = (
+    ("croupier.interfaces.lifecycle.cleanup", 100.0, 94.0),
+    ("croupier.interfaces.lifecycle.publish", 94.0, 88.0),
+    ("croupier.interfaces.lifecycle.queue", 8.0, 0.0),
+)
+
+# Items requested per page when listing the changes of the catalog
+CHANGES_PAGE_SIZE = 100
+# Items requested per page when listing all the node instances of a deployment or operations of an execution
+LIST_PAGE_SIZE = 1000
+
+# States of the operations of a task graph
+OPERATION_SUCCEEDED = "succeeded"
+OPERATION_FAILED = "failed"
+OPERATION_RUNNING = ("sent", "started", "rescheduled")
+
+# Errors returned by the orchestrator, or raised when it cannot be reached (including calls rejected by the
+# circuit breaker or the bulkhead)
+ORCHESTRATOR_ERRORS = (CloudifyClientError, RequestException)
+
+# Deployment inputs whose name contains any of these markers are not exposed nor stored
+SECRET_INPUT_MARKERS = ("password", "passwd", "secret", "token", "private_key", "api_key", "credential", "auth")
+REDACTED_VALUE = "********"
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
 
-def _get_client():
+def managers():
+    # Names of the managers of the registry
+    return list(settings.ORCHESTRATOR_MANAGERS)
+
+
+def _manager_name(manager):
+    return manager or settings.ORCHESTRATOR_DEFAULT_MANAGER
+
+
+def _get_session(manager=None):
+    # All the calls to a manager share the same connection pool, concurrency limit and circuit breaker
+    manager = _manager_name(manager)
+    with _sessions_lock:
+        session = _sessions.get(manager)
+        if session is None:
+            breaker = CircuitBreaker("cloudify:" + manager, settings.ORCHESTRATOR_BREAKER_FAILURES,
+                                     settings.ORCHESTRATOR_BREAKER_RESET)
+            bulkhead = Bulkhead("cloudify:" + manager, settings.ORCHESTRATOR_MAX_CONCURRENT_CALLS,
+                                settings.ORCHESTRATOR_BULKHEAD_WAIT,
+                                settings.ORCHESTRATOR_CONNECT_TIMEOUT + settings.ORCHESTRATOR_READ_TIMEOUT)
+            session = GuardedSession(breaker, bulkhead)
+            _sessions[manager] = session
+    return session
+
+
+def is_available(manager=None):
+    # False while the circuit breaker of the manager is open (the manager is considered down). Without manager,
+    # whether any manager is available
+    if manager is None:
+        return any(is_available(name) for name in managers())
+    return not _get_session(manager).breaker.is_open()
+
+
+def _get_client(manager=None):
+    manager_settings = settings.ORCHESTRATOR_MANAGERS[_manager_name(manager)]
     client = CloudifyClient(
-        host=settings.ORCHESTRATOR_HOST,
-        username=settings.ORCHESTRATOR_USER,
-        password=settings.ORCHESTRATOR_PASS,
-        tenant=settings.ORCHESTRATOR_TENANT,
-        protocol="http"
+        host=manager_settings["host"],
+        username=manager_settings["user"],
+        password=manager_settings["password"],
+        tenant=manager_settings["tenant"],
+        protocol=manager_settings.get("protocol", "http"),
+        timeout=(settings.ORCHESTRATOR_CONNECT_TIMEOUT, settings.ORCHESTRATOR_READ_TIMEOUT),
+        session=_get_session(manager)
     )
     return client
 
 
-def upload_blueprint(path, blueprint_id, blueprint_file_name):
+def fan_out(function, *args):
+    """ Call the function (returning a (data, error) tuple) on all the managers in parallel, and return the results
+    by manager """
+    names = managers()
+    with ThreadPoolExecutor(max_workers=len(names)) as executor:
+        futures = {name: executor.submit(function, *args, manager=name) for name in names}
+        return {name: future.result() for name, future in futures.items()}
+
+
+def upload_blueprint(path, blueprint_id, blueprint_file_name, manager=None):
     error = None
     blueprint = None
     is_archive = bool(urlparse(path).scheme) or path.endswith(".tar.gz")
 
-    client = _get_client()
+    client = _get_client(manager)
     try:
         if is_archive:
             blueprint = client.blueprints.publish_archive(path, blueprint_id, blueprint_file_name)
         else:
             blueprint = client.blueprints.upload(path, blueprint_id)
-    except CloudifyClientError as err:
+    except ORCHESTRATOR_ERRORS as err:
         LOGGER.exception(err)
         error = str(err)
 
     return blueprint, error
 
 
-def list_blueprints():
+def list_blueprints(manager=None):
     error = None
     blueprints = None
-    client = _get_client()
+    client = _get_client(manager)
     try:
         blueprints = client.blueprints.list().items
-    except CloudifyClientError as err:
+        for blueprint in blueprints:
+            blueprint["manager"] = _manager_name(manager)
+    except ORCHESTRATOR_ERRORS as err:
         LOGGER.exception(err)
         error = str(err)
 
     return (blueprints, error)
 
 
-def list_blueprint_inputs(blueprint_id):
+def _list_since(list_function, field, since):
+    # Page through the items in descending order of the date field, down to the watermark. Items dated as the
+    # watermark are listed again, as others could have been dated the same after the previous listing
+    items = []
+    offset = 0
+    while True:
+        page = list_function(sort=field, is_descending=True, _offset=offset, _size=CHANGES_PAGE_SIZE).items
+        for item in page:
+            if since is not None and item[field] < since:
+                return items
+            items.append(item)
+        if len(page) < CHANGES_PAGE_SIZE:
+            return items
+        offset += len(page)
+
+
+def _list_all(list_function, **kwargs):
+    # Page through all the items of a list (the orchestrator returns at most a page of them per request)
+    items = []
+    while True:
+        page = list_function(_offset=len(items), _size=LIST_PAGE_SIZE, **kwargs).items
+        items.extend(page)
+        if len(page) < LIST_PAGE_SIZE:
+            return items
+
+
+def list_changes(resource, since, manager=None):
+    """ Items of the resource (blueprints, deployments or executions) updated (created, for executions) after the
+    watermark, a date as returned by the orchestrator (None for all of them) """
+    error = None
+    items = None
+    client = _get_client(manager)
+    try:
+        if resource == "blueprints":
+            items = _list_since(client.blueprints.list, "updated_at", since)
+        elif resource == "deployments":
+            items = _list_since(client.deployments.list, "updated_at", since)
+        else:
+            items = _list_since(client.executions.list, "created_at", since)
+        for item in items:
+            item["manager"] = _manager_name(manager)
+    except ORCHESTRATOR_ERRORS as err:
+        LOGGER.exception(err)
+        error = str(err)
+
+    return items, error
+
+
+def extract_blueprint_inputs(blueprint):
+    # Build the inputs schema from the plan included in a blueprint description, if any
+    plan = blueprint.get("plan") if blueprint else None
+    if not plan or "inputs" not in plan:
+        return None
+
+    return [
+        {
+            "name": name,
+            "type": input.get("type", "-"),
+            "default": input.get("default", "-"),
+            "description": input.get("description", "-"),
+            "required": "default" not in input,
+        }
+        for name, input in plan["inputs"].items()
+    ]
+
+
+@cached("blueprint-inputs", settings.BLUEPRINT_PLAN_CACHE_TTL)
+def list_blueprint_inputs(blueprint_id, manager=None):
     error = None
     data = None
-    client = _get_client()
+    client = _get_client(manager)
     try:
-        blueprint_dict = client.blueprints.get(blueprint_id)
-        # LOGGER.info("Blueprint Info: " + str(blueprint_dict))
-        LOGGER.info("Blueprint Info: " + str(blueprint_dict["plan"]["nodes"][1]["id"]))
-        nodes = client.nodes.list(_include=['id', 'type', 'host_id'])
-        for node in nodes:
-            LOGGER.info("Blueprint Node: " + str(node))
-
-        nodes_instances = client.node_instances.list(_include=['id', 'host_id'])
-        for node_instance in nodes_instances:
-            LOGGER.info("Blueprint Node Instance: " + str(node_instance))
-
-        events = client.events.list(execution_id="f92ebd85-5d4b-4258-ad1c-d7f04d6f2ab7", node_id="job1",
-                                    _include=['node_instance_id'])
-        for event in events:
-            LOGGER.info("Execute Event Node Instance: " + str(event))
-
-        inputs = blueprint_dict["plan"]["inputs"]
-        data = [
-            {
-                "name": name,
-                "type": input.get("type", "-"),
-                "default": input.get("default", "-"),
-                "description": input.get("description", "-"),
-            }
-            for name, input in inputs.items()
-        ]
-    except CloudifyClientError as err:
+        blueprint_dict = client.blueprints.get(blueprint_id, _include=['plan'])
+        data = extract_blueprint_inputs(blueprint_dict)
+    except ORCHESTRATOR_ERRORS as err:
         LOGGER.exception(err)
         error = str(err)
 
     return data, error
 
 
-def remove_blueprint(blueprint_id):
+@cached("blueprint-plans", settings.BLUEPRINT_PLAN_CACHE_TTL)
+def list_job_nodes(blueprint_id, manager=None):
+    # Job nodes of the plan of the blueprint (the plan of a blueprint never changes while it exists)
+    client = _get_client(manager)
+    blueprint_plan = client.blueprints.get(blueprint_id=blueprint_id, _include=['plan'])
+    # LOGGER.info("Nodes List: " + str(blueprint_plan))
+    LOGGER.info("Nodes List: " + str(blueprint_plan["plan"]["nodes"]))
+    nodes_in_plan = blueprint_plan["plan"]["nodes"]
+    nodes_list = []
+    for node in nodes_in_plan:
+        if node["type"] == "croupier.nodes.Job" or node["type"] == "croupier.nodes.PyCOMPSsJob":
+            nodes_list.append(node["id"])
+            LOGGER.info("Found job node: " + str(node["id"]) + " of type " + str(node["type"]))
+    return nodes_list
+
+
+def invalidate_blueprint_plans():
+    # A blueprint id can be reused after the blueprint is removed
+    list_blueprint_inputs.namespace.invalidate()
+    list_job_nodes.namespace.invalidate()
+
+
+def remove_blueprint(blueprint_id, manager=None):
     error = None
     blueprint = None
-    client = _get_client()
+    client = _get_client(manager)
     try:
         blueprint = client.blueprints.delete(blueprint_id)
-    except CloudifyClientError as err:
+        invalidate_blueprint_plans()
+    except ORCHESTRATOR_ERRORS as err:
         LOGGER.exception(err)
         error = str(err)
 
     return blueprint, error
 
 
-def list_deployments():
+def list_deployments(manager=None):
     error = None
     deployments = None
-    client = _get_client()
+    client = _get_client(manager)
     try:
         deployments = client.deployments.list().items
-    except CloudifyClientError as err:
+        for deployment in deployments:
+            deployment["manager"] = _manager_name(manager)
+    except ORCHESTRATOR_ERRORS as err:
         LOGGER.exception(err)
         error = str(err)
 
     return deployments, error
 
 
-def create_deployment(blueprint_id, instance_id, inputs):
+def create_deployment(blueprint_id, instance_id, inputs, manager=None):
     error = None
     deployment = None
 
-    client = _get_client()
+    client = _get_client(manager)
     try:
         deployment = client.deployments.create(
             blueprint_id,
@@ -152,54 +303,82 @@ def create_deployment(blueprint_id, instance_id, inputs):
             inputs=inputs,
             skip_plugins_validation=True,  # FIXME skip_plugins_validation
         )
-    except CloudifyClientError as err:
+    except ORCHESTRATOR_ERRORS as err:
         LOGGER.exception(err)
         error = str(err)
 
     return deployment, error
 
 
-def list_deployment_inputs(deployment_id):
+def _is_secret_input(name):
+    name = str(name).lower()
+    return any(marker in name for marker in SECRET_INPUT_MARKERS)
+
+
+def redact_inputs(inputs):
+    # Hide secret values, also in nested inputs (e.g. credentials dicts). References to Cloudify
+    # secrets ({"get_secret": ...}) are kept since they do not contain the secret itself
+    if isinstance(inputs, dict):
+        if "get_secret" in inputs:
+            return inputs
+        return {
+            name: REDACTED_VALUE if _is_secret_input(name) and not isinstance(value, (dict, list))
+            else redact_inputs(value)
+            for name, value in inputs.items()
+        }
+    if isinstance(inputs, list):
+        return [redact_inputs(value) for value in inputs]
+    return inputs
+
+
+def extract_deployment_inputs(deployment):
+    # Build the (redacted) list of inputs from a deployment description, if any
+    inputs = deployment.get("inputs") if deployment else None
+    if inputs is None:
+        return None
+
+    return [
+        {
+            "name": name,
+            "value": value,
+        }
+        for name, value in redact_inputs(inputs).items()
+    ]
+
+
+def list_deployment_inputs(deployment_id, manager=None):
     error = None
     data = None
-    client = _get_client()
+    client = _get_client(manager)
     try:
-        deployment_dict = client.deployments.get(deployment_id)
-        LOGGER.info("Deployment Info: " + str(deployment_dict))
-        inputs = deployment_dict["inputs"]
-        LOGGER.info("Available inputs: " + str(inputs))
-        data = [
-            {
-                "name": name,
-                "value": value,
-            }
-            for name, value in inputs.items()
-        ]
-    except CloudifyClientError as err:
+        deployment_dict = client.deployments.get(deployment_id, _include=['id', 'inputs'])
+        data = extract_deployment_inputs(deployment_dict)
+        LOGGER.info("Available inputs: " + str(data))
+    except ORCHESTRATOR_ERRORS as err:
         LOGGER.exception(err)
         error = str(err)
 
     return data, error
 
 
-def destroy_deployment(instance_id, force=False):
+def destroy_deployment(instance_id, force=False, manager=None):
     error = None
     deployment = None
-    client = _get_client()
+    client = _get_client(manager)
     try:
         deployment = client.deployments.delete(instance_id, ignore_live_nodes=force)
-    except CloudifyClientError as err:
+    except ORCHESTRATOR_ERRORS as err:
         LOGGER.exception(err)
         error = str(err)
 
     return deployment, error
 
 
-def execute_workflow(deployment_id, workflow, force=False, params=None):
+def execute_workflow(deployment_id, workflow, force=False, params=None, manager=None):
     error = None
     execution = None
 
-    client = _get_client()
+    client = _get_client(manager)
     while True:
         try:
             execution = client.executions.start(
@@ -213,7 +392,7 @@ def execute_workflow(deployment_id, workflow, force=False, params=None):
             LOGGER.warning(err)
             time.sleep(WAIT_FOR_EXECUTION_SLEEP_INTERVAL)
             continue
-        except CloudifyClientError as err:
+        except ORCHESTRATOR_ERRORS as err:
             error = str(err)
             LOGGER.exception(err)
         break
@@ -221,22 +400,26 @@ def execute_workflow(deployment_id, workflow, force=False, params=None):
     return (execution, error)
 
 
-def get_execution_events(execution_id, offset):
-    client = _get_client()
+def get_execution_events(execution_id, offset, size=100, manager=None):
+    client = _get_client(manager)
 
     # TODO: manage errors
     cfy_execution = client.executions.get(execution_id)
     LOGGER.info("Execution: " + str(cfy_execution))
-    events = client.events.list(
-        execution_id=execution_id, _offset=offset, _size=100, include_logs=True
-    )
-    last_message = events.metadata.pagination.total
+    events, last_message = list_execution_events(execution_id, offset, size, manager)
     LOGGER.info("Events msg: " + str(last_message))
-    return {"logs": events.items, "last": last_message, "status": cfy_execution.status}
+    return {"logs": events, "last": last_message, "status": cfy_execution.status}
 
 
-def get_execution_status(execution_id):
-    client = _get_client()
+def list_execution_events(execution_id, offset, size, manager=None):
+    # Page of the events (and logs) of an execution, in order, with the total number of events
+    client = _get_client(manager)
+    events = client.events.list(execution_id=execution_id, _offset=offset, _size=size, include_logs=True)
+    return events.items, events.metadata.pagination.total
+
+
+def get_execution_status(execution_id, manager=None):
+    client = _get_client(manager)
     LOGGER.info("Checking last execution id: " + str(execution_id))
 
     # exec_list = client.executions.list()
@@ -251,8 +434,60 @@ def get_execution_status(execution_id):
     return cfy_execution.status, cfy_execution.workflow_id
 
 
-def get_execution(execution_id):
-    client = _get_client()
+def _operation_context(operation):
+    # Cloudify context of the task run by an operation of a task graph (node instance, operation name...)
+    task_kwargs = (operation.get("parameters") or {}).get("task_kwargs") or {}
+    return (task_kwargs.get("kwargs") or {}).get("__cloudify_context") or {}
+
+
+def _job_stage_progress(operations):
+    # Progress (percentage) of a job given the state of its lifecycle operations (by name): queued (submitted to
+    # the HPC and running), outputs published, and cleaned up
+    for name, done, running in JOB_STAGES:
+        state = operations.get(name)
+        if state == OPERATION_SUCCEEDED:
+            return done
+        if state in OPERATION_RUNNING:
+            return running
+    return 0.0
+
+
+def get_jobs_progress(client, cfy_execution, nodes_list):
+    """ Progress of the job instances of an execution, by node instance id, computed from the node instances of the
+    deployment and the operations of the execution (its cost does not depend on the number of events) """
+    node_instances = _list_all(client.node_instances.list, deployment_id=cfy_execution.deployment_id,
+                               _include=["id", "node_id"])
+    jobs = {
+        node_instance["id"]: {"node": node_instance["node_id"], "progress": 0.0, "operation": 'None', "errors": 0}
+        for node_instance in node_instances
+        if node_instance["node_id"] in nodes_list
+    }
+
+    # Last state of each lifecycle operation of each job instance
+    job_operations = {job_id: {} for job_id in jobs}
+    operations = _list_all(client.operations.list, execution_id=cfy_execution.id, skip_internal=True,
+                           _include=["id", "name", "state", "parameters"])
+    for operation in operations:
+        context = _operation_context(operation)
+        job_id = context.get("node_id")
+        if job_id not in jobs:
+            continue
+        name = (context.get("operation") or {}).get("name") or operation.get("name")
+        job_operations[job_id][name] = operation.get("state")
+        if operation.get("state") == OPERATION_FAILED:
+            jobs[job_id]["errors"] += 1
+        if operation.get("state") in OPERATION_RUNNING:
+            jobs[job_id]["operation"] = name
+
+    for job_id, job in jobs.items():
+        job["progress"] = _job_stage_progress(job_operations[job_id])
+        if job["operation"] == 'None' and 0 < job["progress"] < 100:
+            job["operation"] = 'Executing task'
+    return jobs
+
+
+def get_execution(execution_id, manager=None):
+    client = _get_client(manager)
     LOGGER.info("Execution id: " + str(execution_id))
 
     # Check if the deployment was never executed
@@ -268,95 +503,26 @@ def get_execution(execution_id):
     LOGGER.info("Error: " + str(cfy_execution.error))
 
     # Obtain plan information from the Blueprint (Nodes)
-    blueprint_plan = client.blueprints.get(blueprint_id=cfy_execution.blueprint_id, _include=['plan'])
-    # LOGGER.info("Nodes List: " + str(blueprint_plan))
-    LOGGER.info("Nodes List: " + str(blueprint_plan["plan"]["nodes"]))
-    nodes_in_plan = blueprint_plan["plan"]["nodes"]
-    nodes_list = []
-    for node in nodes_in_plan:
-        if node["type"] == "croupier.nodes.Job" or node["type"] == "croupier.nodes.PyCOMPSsJob":
-            nodes_list.append(node["id"])
-            LOGGER.info("Found job node: " + str(node["id"]) + " of type " + str(node["type"]))
-
-    # Obtain the Node Instances, corresponding to the Nodes for the current Execution Id (from Events)
-    node_instances = set([])
-    tasks_done = set([])
-    ongoing_operation = 'None'
-    ongoing_task = 'None'
-
-    # instances_in_events = client.events.list(execution_id=execution_id, node_id=node,
-    #                                         _include=['node_instance_id'])
-    instances_in_events = client.events.list(execution_id=execution_id, sort='timestamp')
-
-    # Let's iterate through all the events and detect tasks and operations status
-    operations_done = set([])
-    task_progress = 0.0
-    num_errors = 0
-    for node_instance in instances_in_events:
-        node_instance_id = node_instance["node_instance_id"]
-        LOGGER.info("Full node instance info: " + str(node_instance))
-        LOGGER.info("Found node instance: " + str(node_instance_id))
-        node_instances.add(node_instance_id)
-
-        # Look at the operations and see which one is completed: queue, publish, cleanup
-        node_event = node_instance["event_type"]
-        node_operation = node_instance["operation"]
-        LOGGER.info("Event: " + str(node_event) + " for operation: " + str(node_operation))
-
-        if node_event == 'sending_task':
-            ongoing_task = node_instance["node_name"]
-            ongoing_operation = node_operation
-            if node_operation == 'croupier.interfaces.lifecycle.publish':
-                task_progress = 88.0
-            elif node_operation == 'croupier.interfaces.lifecycle.cleanup':
-                task_progress = 94.0
-        elif node_event == 'task_succeeded':
-            if node_operation == 'croupier.interfaces.lifecycle.queue':
-                ongoing_operation = 'Executing task'
-                operations_done.add(node_operation)
-                LOGGER.info("Task " + ongoing_task + " was queued and is executing or waiting for execution.")
-                task_progress = 8.0
-            else:
-                ongoing_operation = 'None'
-                operations_done.add(node_operation)
-                task_progress = 94.0
-                if node_operation == 'croupier.interfaces.lifecycle.cleanup':
-                    tasks_done.add(node_instance["node_name"])
-                    ongoing_task = 'None'
-                    task_progress = 100.0
-        elif node_event == 'workflow_failed':
-            num_errors = num_errors + 1
-
-    LOGGER.info("Total list: " + str(nodes_list))
-    LOGGER.info("Task progress: " + str(task_progress))
-    LOGGER.info("Number of tasks: " + str(len(nodes_list)))
-
-    # for node_instance in node_instances:
-    #     # node_instance_info = client.node_instances.list(id=node_instance, _include=['id', 'host_id'])
-    #     node_instance_info = client.node_instances.list(id=node_instance)
-    #     LOGGER.info("Node Instance info: " + str(node_instance_info[0]))
-
-    # operations_list = client.nodes.list(id=nodes_list[0], _include=['operations'])
-    # task_graphs = client.tasks_graphs.list(execution_id, "run_jobs")
-    # LOGGER.info("Number of workflows: " + str(len(task_graphs)))
-    # for task_graph in task_graphs:
-    #     LOGGER.info("Available workflow: " + str(task_graph))
-
-    # for operation in operations_list:
-    #    LOGGER.info("Node Operation info: " + str(operation["operations"]))
-
-    # deployment_dict = client.deployments.get(cfy_execution["deployment_id"])
-    # LOGGER.info("Deployment Info: " + str(deployment_dict))
-    # workflows = deployment_dict["workflows"]
-    # LOGGER.info("Available workflows: " + str(workflows))
-
-    # operations_list = client.operations.list()
-    # LOGGER.info("Operations Info: " + str(operations_list))
+    nodes_list = list_job_nodes(cfy_execution.blueprint_id, manager)
+
+    # Progress of every job instance, from the state of the operations of the task graph of the execution
+    # (jobs of a DAG run concurrently, so each one progresses on its own)
+    jobs = get_jobs_progress(client, cfy_execution, nodes_list)
+    LOGGER.info("Jobs progress: " + str(jobs))
+
+    running_jobs = [job for job in jobs.values() if job["operation"] != 'None']
+    tasks_done = [job for job in jobs.values() if job["progress"] >= 100]
+    ongoing_task = ", ".join(sorted(set(job["node"] for job in running_jobs)))[:50] or 'None'
+    ongoing_operation = running_jobs[0]["operation"] if len(running_jobs) == 1 else \
+        (str(len(running_jobs)) + " jobs running" if running_jobs else 'None')
+    num_errors = sum(job["errors"] for job in jobs.values())
+    if cfy_execution.status == FAILED and num_errors == 0:
+        num_errors = 1
 
     # Calculate percentage of execution
     workflow_progress = 100.0
-    if cfy_execution.status != 'terminated':
-        workflow_progress = (100/len(nodes_list))*len(tasks_done) + task_progress/len(nodes_list)
+    if cfy_execution.status != TERMINATED:
+        workflow_progress = sum(job["progress"] for job in jobs.values()) / len(jobs) if jobs else 0.0
     LOGGER.info("Total progress: " + str(workflow_progress))
 
     # Calculate total execution time of the instance
@@ -380,6 +546,7 @@ def get_execution(execution_id):
     execution_result['progress'] = workflow_progress
     execution_result['num_errors'] = num_errors
     execution_result['error_message'] = cfy_execution.error
+    execution_result['job_progress'] = jobs
     LOGGER.info("Execution info result: " + str(execution_result))
 
     return execution_result
@@ -0,0 +1,71 @@
+""" Change feed of the applications, instances and executions, so clients can keep a local copy up to date """
+import logging
+
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+
+from croupier.models import Application, AppInstance, InstanceExecution, Change
+
+# Get an instance of a logger
+LOGGER = logging.getLogger(__name__)
+
+# Name of each tracked model in the feed
+TRACKED_MODELS = {
+    Application: "application",
+    AppInstance: "instance",
+    InstanceExecution: "execution",
+}
+
+# Maximum number of changes returned at once
+MAX_CHANGES = 500
+
+
+def record_change(instance, deleted=False):
+    model = TRACKED_MODELS[type(instance)]
+    object_id = str(instance.pk)
+    name = instance.name if model == TRACKED_MODELS[Application] else None
+
+    # The new change is stored before removing the previous one, so the sequence never goes back (SQLite reuses
+    # the highest id if the last row is deleted)
+    change = Change.objects.create(model=model, object_id=object_id, owner=instance.owner_id, name=name,
+                                   deleted=deleted)
+    Change.objects.filter(model=model, object_id=object_id, id__lt=change.id).delete()
+
+
+def _on_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        record_change(instance)
+
+
+def _on_delete(sender, instance, **kwargs):
+    record_change(instance, deleted=True)
+
+
+def connect_signals():
+    for model in TRACKED_MODELS:
+        post_save.connect(_on_save, sender=model, dispatch_uid="changes_save_" + model.__name__)
+        post_delete.connect(_on_delete, sender=model, dispatch_uid="changes_delete_" + model.__name__)
+
+
+def list_changes(user_name, since, limit=MAX_CHANGES):
+    """ Changes after the cursor (a change id) visible to the user: the user's instances and executions, and all the
+    applications (the caller filters the visible ones, deleted included). Returns the changes, the next cursor and
+    whether there are more changes after it """
+    changes = list(
+        Change.objects.filter(id__gt=since)
+        .filter(Q(owner=user_name) | Q(model=TRACKED_MODELS[Application]))
+        .order_by("id")[:limit + 1]
+    )
+    more = len(changes) > limit
+    changes = changes[:limit]
+    next_cursor = changes[-1].id if changes else since
+    return changes, next_cursor, more
+
+
+def load_objects(changes):
+    """ Current version of the objects changed (not deleted), by model name and id """
+    objects = {}
+    for model, model_name in TRACKED_MODELS.items():
+        ids = [change.object_id for change in changes if change.model == model_name and not change.deleted]
+        objects[model_name] = {str(pk): obj for pk, obj in model.objects.in_bulk(ids).items()} if ids else {}
+    return objects
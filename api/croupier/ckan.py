@@ -0,0 +1,96 @@
+""" CKAN data catalogue python wrapper """
+from os import getenv
+
+import logging
+
+from croupier import transport
+from croupier.cache import LRUCache, SingleFlight
+
+# Get an instance of a logger
+LOGGER = logging.getLogger(__name__)
+
+# General variables
+ckan_url = getenv("CKAN_URL", "https://ckan.hidalgo-project.eu")
+package_search_endpoint = ckan_url + "/api/3/action/package_search"
+
+# Paging of the search results
+DEFAULT_ROWS = 10
+MAX_ROWS = 100
+
+# Datasets requested per page when harvesting the catalogue (maximum allowed by CKAN)
+HARVEST_ROWS = 1000
+
+# Only the fields returned to the frontend are requested to CKAN
+SEARCH_FIELDS = "id,name"
+
+# Search results are cached for a while, and identical searches running at the same time are sent only once
+search_cache_ttl = int(getenv("CKAN_SEARCH_CACHE_TTL", "300"))
+_search_cache = LRUCache(max_entries=512, ttl=search_cache_ttl)
+_search_flights = SingleFlight()
+
+
+def _package_search(keywords, rows, start):
+    ckan_payload = {'q': keywords, 'fl': SEARCH_FIELDS, 'rows': rows, 'start': start}
+    response = transport.get(package_search_endpoint, params=ckan_payload)
+    if not response.ok:
+        return None, "CKAN search failed with HTTP code " + str(response.status_code)
+
+    ckan_response = response.json()
+    results_list = ckan_response["result"]["results"]
+    data = {
+        "count": ckan_response["result"]["count"],
+        "results": [
+            {
+                "name": dataset["name"],
+                "dataset_id": dataset["id"],
+            }
+            for dataset in results_list
+        ],
+    }
+    return data, None
+
+
+def search_datasets(keywords, rows=DEFAULT_ROWS, start=0):
+    # Normalize the query so equivalent searches share the cache entry
+    keywords = " ".join((keywords or "").lower().split())
+    rows = max(1, min(rows, MAX_ROWS))
+    start = max(0, start)
+    key = (keywords, rows, start)
+
+    data = _search_cache.get(key)
+    if data is not None:
+        return data, None
+
+    def search():
+        # The search may have been cached while waiting to run it
+        cached_data = _search_cache.get(key)
+        if cached_data is not None:
+            return cached_data, None
+        data, error = _package_search(keywords or None, rows, start)
+        if error is None:
+            _search_cache.set(key, data)
+        LOGGER.info("CKAN search '" + keywords + "': " + str(data["count"] if data else error))
+        return data, error
+
+    return _search_flights.do(key, search)
+
+
+def list_modified_datasets(since=None, after_id=None, rows=HARVEST_ROWS):
+    # Page of the datasets of the catalogue in modification order (ties by id), from the given date (if any), or
+    # after the dataset with the given id and date: pages follow the last dataset read instead of an offset, which
+    # the datasets modified while paging would shift
+    ckan_payload = {'q': '*:*', 'sort': 'metadata_modified asc, id asc', 'rows': rows}
+    if since is not None:
+        since_date = since.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + 'Z'
+        if after_id is None:
+            ckan_payload['fq'] = 'metadata_modified:[' + since_date + ' TO *]'
+        else:
+            ckan_payload['fq'] = 'metadata_modified:{' + since_date + ' TO *] OR (metadata_modified:"' + \
+                since_date + '" AND id:{' + after_id + ' TO *])'
+
+    response = transport.get(package_search_endpoint, params=ckan_payload)
+    if not response.ok:
+        return None, "CKAN search failed with HTTP code " + str(response.status_code)
+
+    ckan_response = response.json()
+    return ckan_response["result"], None
@@ -0,0 +1,52 @@
+""" Conditional GET support for the list endpoints """
+import hashlib
+import logging
+
+from django.db.models import Count, Max
+from rest_framework import status
+from rest_framework.response import Response
+
+from croupier import routers
+
+# Get an instance of a logger
+LOGGER = logging.getLogger(__name__)
+
+
+def list_etag(queryset, *scope):
+    # The watermark (last local change and number of rows) changes whenever a row of the list is created,
+    # modified or deleted, so it identifies the representation without serializing it
+    watermark = queryset.aggregate(last_modified=Max("modified"), total=Count("pk"))
+    key = "|".join(str(value) for value in scope + (watermark["last_modified"], watermark["total"]))
+    return '"' + hashlib.sha1(key.encode("utf-8")).hexdigest() + '"'
+
+
+def etag_matches(request, etag):
+    if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+    if not if_none_match:
+        return False
+
+    # Compressed responses carry a weak version of the ETag, so the comparison ignores the weak prefix
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return any(candidate == "*" or candidate.replace("W/", "", 1) == etag for candidate in candidates)
+
+
+class ConditionalListMixin:
+    """ Answers list requests with 304 Not Modified when the client already has the current version """
+
+    @routers.replica_reads
+    def conditional_list(self, request, queryset, user_name):
+        etag = list_etag(queryset, user_name, request.get_full_path())
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Authorization"}
+
+        if etag_matches(request, etag):
+            LOGGER.info("List not modified: " + etag)
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data, headers=headers)
+
+    def with_data_age(self, response, data_age):
+        # Age (in seconds) of the data served from the database, since its last synchronization
+        if data_age is not None:
+            response["X-Data-Age"] = str(int(data_age))
+        return response
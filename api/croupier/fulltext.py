@@ -0,0 +1,106 @@
+""" Full-text indexes on model tables, using the native support of the database
+
+- SQLite: FTS5 external content table, kept up to date by triggers on the indexed table
+- PostgreSQL: GIN index on the tsvector of the indexed columns
+- Other databases: no index, searches fall back to (unranked) substring matching
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+# Text search configuration used by PostgreSQL (no stemming, catalogue and logs are multilingual)
+PG_CONFIG = "simple"
+
+
+def _fts_table(table):
+    return table + "_fts"
+
+
+def _pg_document(table, fields):
+    return " || ' ' || ".join("coalesce({0}.{1}, '')".format(table, field) for field in fields)
+
+
+def create_index(schema_editor, table, fields):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        fts = _fts_table(table)
+        columns = ", ".join(fields)
+        new_values = ", ".join("new." + field for field in fields)
+        old_values = ", ".join("old." + field for field in fields)
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE {0} USING fts5({1}, content='{2}', content_rowid='id')".format(fts, columns, table))
+        schema_editor.execute(
+            "CREATE TRIGGER {0}_ai AFTER INSERT ON {1} BEGIN "
+            "INSERT INTO {0}(rowid, {2}) VALUES (new.id, {3}); END".format(fts, table, columns, new_values))
+        schema_editor.execute(
+            "CREATE TRIGGER {0}_ad AFTER DELETE ON {1} BEGIN "
+            "INSERT INTO {0}({0}, rowid, {2}) VALUES ('delete', old.id, {3}); END".format(fts, table, columns,
+                                                                                      old_values))
+        schema_editor.execute(
+            "CREATE TRIGGER {0}_au AFTER UPDATE ON {1} BEGIN "
+            "INSERT INTO {0}({0}, rowid, {2}) VALUES ('delete', old.id, {3}); "
+            "INSERT INTO {0}(rowid, {2}) VALUES (new.id, {4}); END".format(fts, table, columns, old_values,
+                                                                           new_values))
+        # Index the rows already stored
+        schema_editor.execute("INSERT INTO {0}({0}) VALUES ('rebuild')".format(fts))
+    elif vendor == "postgresql":
+        schema_editor.execute(
+            "CREATE INDEX {0} ON {1} USING GIN (to_tsvector('{2}', {3}))".format(
+                _fts_table(table), table, PG_CONFIG, _pg_document(table, fields)))
+
+
+def drop_index(schema_editor, table, fields):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        fts = _fts_table(table)
+        for trigger in ("ai", "ad", "au"):
+            schema_editor.execute("DROP TRIGGER IF EXISTS {0}_{1}".format(fts, trigger))
+        schema_editor.execute("DROP TABLE IF EXISTS {0}".format(fts))
+    elif vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS {0}".format(_fts_table(table)))
+
+
+def query_terms(text):
+    return re.findall(r"\w+", text or "", re.UNICODE)
+
+
+def search(queryset, fields, text):
+    """ Filter the queryset to the rows matching all the terms of the text (as prefixes), ordered by relevance. A text
+    without terms does not filter the queryset (callers searching for something check query_terms first) """
+    terms = query_terms(text)
+    if not terms:
+        return queryset
+
+    table = queryset.model._meta.db_table
+    vendor = connection.vendor
+    if vendor == "sqlite":
+        fts = _fts_table(table)
+        match = " ".join('"{0}"*'.format(term) for term in terms)
+        return queryset.extra(
+            select={"rank": "bm25({0})".format(fts)},
+            tables=[fts],
+            where=["{0}.rowid = {1}.id".format(fts, table), "{0} MATCH %s".format(fts)],
+            params=[match],
+            order_by=["rank"],
+        )
+
+    if vendor == "postgresql":
+        document = "to_tsvector('{0}', {1})".format(PG_CONFIG, _pg_document(table, fields))
+        tsquery = "to_tsquery('{0}', %s)".format(PG_CONFIG)
+        match = " & ".join(term + ":*" for term in terms)
+        return queryset.extra(
+            select={"rank": "ts_rank({0}, {1})".format(document, tsquery)},
+            select_params=[match],
+            where=["{0} @@ {1}".format(document, tsquery)],
+            params=[match],
+            order_by=["-rank"],
+        )
+
+    condition = Q()
+    for term in terms:
+        term_condition = Q()
+        for field in fields:
+            term_condition |= Q(**{field + "__icontains": term})
+        condition &= term_condition
+    return queryset.filter(condition)
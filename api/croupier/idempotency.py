@@ -0,0 +1,181 @@
+""" Idempotency-Key support for the endpoints starting workflows in the orchestrator
+
+The first request made with a key runs, and its response is stored: the retries of the request with the same key
+(within IDEMPOTENCY_KEY_TTL seconds) get the same response without running it again, and the retries arriving
+while it is still running wait for it (IDEMPOTENCY_WAIT seconds at most, then they are answered 409 with
+Retry-After) instead of racing it.
+"""
+import functools
+import hashlib
+import json
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import Q
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from croupier import metrics
+from croupier.models import IdempotencyKey
+
+# Get an instance of a logger
+LOGGER = logging.getLogger(__name__)
+
+HEADER = "HTTP_IDEMPOTENCY_KEY"
+MAX_KEY_LENGTH = 255
+
+# Seconds between checks while waiting for the original request
+POLL_INTERVAL = 0.25
+
+# Seconds between removals of the expired keys (per process)
+PRUNE_INTERVAL = 3600
+_last_prune = 0.0
+
+
+def _fingerprint(request):
+    # Hash of the fields and files of the request, computed before the view modifies them
+    digest = hashlib.sha256(request.method.encode("utf-8") + b" " + request.path.encode("utf-8"))
+    for field in sorted(request.data.keys()):
+        digest.update(b"\0" + field.encode("utf-8") + b"=")
+        value = request.data[field]
+        if hasattr(value, "chunks"):
+            for chunk in value.chunks():
+                digest.update(chunk)
+            value.seek(0)
+        else:
+            digest.update(str(value).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _prune():
+    global _last_prune
+    if time.monotonic() - _last_prune < PRUNE_INTERVAL:
+        return
+    _last_prune = time.monotonic()
+    expired = datetime.now(timezone.utc) - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    deleted, _ = IdempotencyKey.objects.filter(created__lt=expired, status_code__isnull=False).delete()
+    if deleted:
+        LOGGER.info("Expired idempotency keys removed: " + str(deleted))
+
+
+def _claim(owner, key, endpoint, fingerprint):
+    # Returns the stored key and whether this request has to run it
+    now = datetime.now(timezone.utc)
+    lock_expires = now + timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT)
+    try:
+        return IdempotencyKey.objects.create(owner=owner, key=key, endpoint=endpoint, fingerprint=fingerprint,
+                                             created=now, lock_expires=lock_expires), True
+    except IntegrityError:
+        pass  # Used before, or by a concurrent request
+
+    record = IdempotencyKey.objects.filter(owner=owner, key=key).first()
+    if record is None:
+        # Removed meanwhile (failed request), try again
+        return _claim(owner, key, endpoint, fingerprint)
+
+    if record.status_code is not None and record.created + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL) < now:
+        # The key expired, it can be used for a new request
+        IdempotencyKey.objects.filter(pk=record.pk, created=record.created).delete()
+        return _claim(owner, key, endpoint, fingerprint)
+
+    return record, False
+
+
+def _take_over(record):
+    # The original request did not finish before its lease expired (the worker crashed): run it again
+    now = datetime.now(timezone.utc)
+    return IdempotencyKey.objects.filter(pk=record.pk, status_code__isnull=True).filter(
+        Q(lock_expires__isnull=True) | Q(lock_expires__lt=now)
+    ).update(lock_expires=now + timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT)) == 1
+
+
+def _wait(record):
+    # Wait for the original request to finish. Returns the stored key (None if the request failed and it was
+    # removed), and whether this request has to run it (taking over a crashed one)
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        record = IdempotencyKey.objects.filter(pk=record.pk).first()
+        if record is None or record.status_code is not None:
+            return record, False
+        if _take_over(record):
+            return record, True
+    return record, False
+
+
+def _replay(record):
+    metrics.increment("idempotency_requests_total", {"result": "replayed"})
+    return Response(record.response, status=record.status_code, headers={"Idempotent-Replayed": "true"})
+
+
+def _run(record, view_method, view, request, *args, **kwargs):
+    try:
+        response = view_method(view, request, *args, **kwargs)
+    except Exception:
+        IdempotencyKey.objects.filter(pk=record.pk).delete()
+        raise
+
+    # Server errors (e.g. orchestrator not available) are not stored, the request can be retried
+    if response.status_code >= 500:
+        IdempotencyKey.objects.filter(pk=record.pk).delete()
+        return response
+
+    try:
+        data = json.loads(JSONRenderer().render(response.data) or b"null")
+    except (TypeError, ValueError) as err:
+        LOGGER.warning("Response of idempotency key " + record.key + " not stored: " + str(err))
+        IdempotencyKey.objects.filter(pk=record.pk).delete()
+        return response
+
+    IdempotencyKey.objects.filter(pk=record.pk).update(status_code=response.status_code, response=data,
+                                                        lock_expires=None)
+    metrics.increment("idempotency_requests_total", {"result": "executed"})
+    return response
+
+
+def idempotent(view_method):
+    """ Decorator of a view method making it idempotent for the requests with an Idempotency-Key header """
+
+    @functools.wraps(view_method)
+    def wrapper(view, request, *args, **kwargs):
+        key = request.META.get(HEADER)
+        if not key:
+            return view_method(view, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response("Idempotency-Key longer than " + str(MAX_KEY_LENGTH) + " characters",
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        owner = request.user.username
+        endpoint = request.method + " " + request.path
+        fingerprint = _fingerprint(request)
+        _prune()
+
+        record, claimed = _claim(owner, key, endpoint, fingerprint)
+        if not claimed:
+            if record.endpoint != endpoint or record.fingerprint != fingerprint:
+                return Response("Idempotency-Key already used for a different request",
+                                status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+            if record.status_code is None:
+                claimed = _take_over(record)
+                if not claimed:
+                    LOGGER.info("Waiting for the request with idempotency key " + key)
+                    metrics.increment("idempotency_requests_total", {"result": "waited"})
+                    record, claimed = _wait(record)
+                    if record is None:
+                        # The original request failed, this one runs instead
+                        return wrapper(view, request, *args, **kwargs)
+
+        if not claimed:
+            if record.status_code is None:
+                return Response("Request with the same Idempotency-Key still in progress",
+                                status=status.HTTP_409_CONFLICT, headers={"Retry-After": "1"})
+            return _replay(record)
+
+        return _run(record, view_method, view, request, *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,97 @@
+""" Validation of the inputs of a new deployment against the inputs schema of its blueprint
+
+The inputs file is parsed in memory and checked (unknown inputs, required inputs, types) before calling the
+orchestrator, so bad submissions are rejected at once with the list of problems found, each one as
+{"input": name, "error": code, "message": text}.
+"""
+import logging
+
+import yaml
+from django.conf import settings
+
+# Get an instance of a logger
+LOGGER = logging.getLogger(__name__)
+
+# Error codes
+SIZE = "size"
+SYNTAX = "syntax"
+UNKNOWN = "unknown"
+REQUIRED = "required"
+TYPE = "type"
+
+# Types of the schema checked (other types, e.g. data types of the blueprint, are left to the orchestrator)
+_TYPE_CHECKS = {
+    "string": lambda value: isinstance(value, (str, int, float, bool)),
+    "integer": lambda value: isinstance(value, int) and not isinstance(value, bool),
+    "float": lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    "boolean": lambda value: isinstance(value, bool),
+    "list": lambda value: isinstance(value, list),
+    "dict": lambda value: isinstance(value, dict),
+}
+
+# Intrinsic functions resolved by the orchestrator, whose values cannot be checked here
+INTRINSIC_FUNCTIONS = ("get_secret", "get_capability", "get_environment_capability", "get_sys", "get_label")
+
+
+def _error(name, code, message):
+    return {"input": name, "error": code, "message": message}
+
+
+def parse_inputs_file(inputs_file):
+    """ Parse the uploaded inputs file (YAML), returning (inputs, errors) """
+    if inputs_file is None:
+        return {}, []
+
+    if inputs_file.size > settings.DEPLOYMENT_INPUTS_MAX_SIZE:
+        return None, [_error(None, SIZE, "Inputs file larger than " + str(settings.DEPLOYMENT_INPUTS_MAX_SIZE) +
+                             " bytes")]
+
+    try:
+        inputs = yaml.safe_load(inputs_file.read())
+    except yaml.YAMLError as err:
+        mark = getattr(err, "problem_mark", None)
+        position = " (line " + str(mark.line + 1) + ", column " + str(mark.column + 1) + ")" if mark else ""
+        return None, [_error(None, SYNTAX, "Inputs file is not valid YAML" + position)]
+
+    if inputs is None:
+        return {}, []
+    if not isinstance(inputs, dict):
+        return None, [_error(None, SYNTAX, "Inputs file must be a mapping of input names to values")]
+    return inputs, []
+
+
+def _is_intrinsic_function(value):
+    return isinstance(value, dict) and len(value) == 1 and next(iter(value)) in INTRINSIC_FUNCTIONS
+
+
+def _is_required(definition):
+    # Schemas stored before the required flag was kept: the inputs without a default value are required
+    if "required" in definition:
+        return definition["required"]
+    return definition.get("default", "-") == "-"
+
+
+def validate_inputs(inputs, schema):
+    """ Check the inputs against the inputs schema of the blueprint (as stored in Application.inputs), returning
+    the list of errors found """
+    definitions = {definition["name"]: definition for definition in schema}
+    errors = []
+
+    for name in inputs:
+        if name not in definitions:
+            errors.append(_error(name, UNKNOWN, "Input not defined in the blueprint"))
+
+    for name, definition in definitions.items():
+        if name not in inputs:
+            if _is_required(definition):
+                errors.append(_error(name, REQUIRED, "Input required by the blueprint"))
+            continue
+
+        value = inputs[name]
+        input_type = definition.get("type")
+        type_check = _TYPE_CHECKS.get(input_type)
+        if type_check is not None and not _is_intrinsic_function(value) and not type_check(value):
+            errors.append(_error(name, TYPE, "Input must be of type " + input_type + ", got " +
+                                 type(value).__name__))
+
+    return errors
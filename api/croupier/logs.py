@@ -0,0 +1,195 @@
+""" Local archive of the event logs of finished executions, and full-text index of the logs
+
+The events of an execution are stored in chunks of consecutive events (zlib compressed JSON), keyed by their
+offset in the log, so any range of the log is read by decompressing only the chunks it overlaps.
+
+Every event read from the orchestrator (when archiving or reading the log of a running execution) is also added
+to the full-text index of the logs of its owner, once.
+"""
+import json
+import logging
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.db.models.functions import Length
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from croupier import cfy
+from croupier import fulltext
+from croupier.cache import SingleFlight
+from croupier.models import ExecutionLogChunk, ExecutionLogEntry, InstanceExecution
+
+# Get an instance of a logger
+LOGGER = logging.getLogger(__name__)
+
+# Events requested to the orchestrator per call while archiving
+FETCH_SIZE = 1000
+
+_archiving = SingleFlight()
+
+
+def _compress(events):
+    return zlib.compress(json.dumps(events, separators=(",", ":")).encode("utf-8"), 9)
+
+
+def _decompress(data):
+    return json.loads(zlib.decompress(bytes(data)).decode("utf-8"))
+
+
+def _log_entry(execution, offset, event):
+    context = event.get("context") or {}
+    timestamp = event.get("timestamp") or event.get("reported_timestamp")
+    return ExecutionLogEntry(
+        execution=execution,
+        instance_id=execution.instance_id,
+        owner=execution.owner_id,
+        offset=offset,
+        timestamp=parse_datetime(timestamp) if timestamp else None,
+        node=(event.get("node_name") or context.get("node_name") or "")[:100] or None,
+        level=event.get("level"),
+        event_type=event.get("event_type"),
+        message=str(event.get("message") or ""),
+    )
+
+
+def index_events(execution, events, offset):
+    """ Add the events (read from the given offset of the log) to the full-text index. Events already indexed are
+    ignored, so overlapping reads can be indexed safely """
+    if not events:
+        return
+    ExecutionLogEntry.objects.bulk_create(
+        [_log_entry(execution, offset + position, event) for position, event in enumerate(events)],
+        ignore_conflicts=True,
+    )
+
+
+def search_log_entries(owner, text, filters):
+    """ Events of the logs of the user matching all the terms of the text, the most relevant first. The filters
+    (lookups of ExecutionLogEntry) restrict the search to some applications, instances, nodes, periods... """
+    entries = ExecutionLogEntry.objects.filter(owner=owner, **filters)
+    # A text without terms matches nothing (not the whole log)
+    if not fulltext.query_terms(text):
+        return entries.none()
+    return fulltext.search(entries, ExecutionLogEntry.SEARCH_FIELDS, text)
+
+
+def _fetch_events(execution_id, manager):
+    events = []
+    while len(events) < settings.EXECUTION_LOG_MAX_EVENTS:
+        size = min(FETCH_SIZE, settings.EXECUTION_LOG_MAX_EVENTS - len(events))
+        page, total = cfy.list_execution_events(execution_id, len(events), size, manager)
+        events.extend(page)
+        if not page or len(events) >= total:
+            break
+    if len(events) >= settings.EXECUTION_LOG_MAX_EVENTS:
+        LOGGER.warning("Log of execution " + execution_id + " truncated to " + str(len(events)) + " events")
+    return events
+
+
+def _archive(execution):
+    events = _fetch_events(execution.id, execution.instance.manager)
+    chunk_size = settings.EXECUTION_LOG_CHUNK_SIZE
+    chunks = [
+        ExecutionLogChunk(execution=execution, offset=offset, count=len(events[offset:offset + chunk_size]),
+                          data=_compress(events[offset:offset + chunk_size]))
+        for offset in range(0, len(events), chunk_size)
+    ]
+
+    with transaction.atomic():
+        ExecutionLogChunk.objects.filter(execution=execution).delete()
+        ExecutionLogChunk.objects.bulk_create(chunks)
+        index_events(execution, events, 0)
+        execution.log_events = len(events)
+        execution.save(update_fields=["log_events"])
+    LOGGER.info("Log of execution " + execution.id + " archived: " + str(len(events)) + " events in " +
+                str(len(chunks)) + " chunks")
+    return execution
+
+
+def _retention_limit():
+    return timezone.now() - timedelta(days=settings.EXECUTION_LOG_RETENTION_DAYS)
+
+
+def is_archivable(execution):
+    # Finished executions whose log was never archived, nor removed from the archive, within the retention period
+    return execution.is_final and execution.log_events is None and not execution.log_pruned and \
+        (execution.finished is None or execution.finished >= _retention_limit())
+
+
+def archivable_executions():
+    """ Executions whose log has to be archived, the oldest first """
+    return InstanceExecution.objects.filter(is_final=True, log_events__isnull=True, log_pruned=False).filter(
+        Q(finished__isnull=True) | Q(finished__gte=_retention_limit())
+    ).order_by("finished")
+
+
+def archive_execution_log(execution):
+    """ Archive the log of a finished execution (once, concurrent calls share the work). Orchestrator errors are
+    raised to the caller """
+    if not is_archivable(execution):
+        return execution
+    archived = _archiving.do(execution.id, lambda: _archive(execution))
+    execution.log_events = archived.log_events
+    return execution
+
+
+def read_archived_events(execution, offset, size):
+    """ Events of the archived log of the execution in the range [offset, offset + size) """
+    end = min(offset + size, execution.log_events)
+    if offset >= end:
+        return []
+
+    events = []
+    chunks = ExecutionLogChunk.objects.filter(
+        execution=execution, offset__lt=end, offset__gte=offset - settings.EXECUTION_LOG_CHUNK_SIZE + 1
+    ).order_by("offset")
+    for chunk in chunks:
+        # Only the chunks that overlap the range are decompressed
+        if chunk.offset + chunk.count <= offset:
+            continue
+        chunk_events = _decompress(chunk.data)
+        events.extend(chunk_events[max(0, offset - chunk.offset):end - chunk.offset])
+    return events
+
+
+def _drop_archives(execution_ids):
+    with transaction.atomic():
+        ExecutionLogChunk.objects.filter(execution_id__in=execution_ids).delete()
+        ExecutionLogEntry.objects.filter(execution_id__in=execution_ids).delete()
+        InstanceExecution.objects.filter(id__in=execution_ids).update(log_events=None, log_pruned=True)
+
+
+def prune_archives():
+    """ Remove the archives older than the retention period, and then the oldest ones until the archive fits in its
+    maximum size. Returns the number of archives removed """
+    expired_ids = list(
+        InstanceExecution.objects.filter(log_events__isnull=False, finished__lt=_retention_limit()).values_list(
+            "id", flat=True)
+    )
+    if expired_ids:
+        _drop_archives(expired_ids)
+
+    removed = len(expired_ids)
+    sizes = (
+        ExecutionLogChunk.objects.values("execution_id")
+        .annotate(size=Sum(Length("data")))
+        .order_by("execution__finished")
+    )
+    sizes = [(entry["execution_id"], entry["size"]) for entry in sizes]
+    total_size = sum(size for _, size in sizes)
+    oversized_ids = []
+    for execution_id, size in sizes:
+        if total_size <= settings.EXECUTION_LOG_MAX_BYTES:
+            break
+        oversized_ids.append(execution_id)
+        total_size -= size
+    if oversized_ids:
+        _drop_archives(oversized_ids)
+
+    removed += len(oversized_ids)
+    LOGGER.info("Execution log archives removed: " + str(removed))
+    return removed
@@ -0,0 +1,37 @@
+""" Archive the event logs of the finished executions, and prune the archive """
+import logging
+
+from django.core.management.base import BaseCommand
+
+from croupier import cfy
+from croupier import logs
+
+# Get an instance of a logger
+LOGGER = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Archive locally the logs of the finished executions, and remove the archives out of retention or size"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--prune-only", action="store_true", help="Only remove the archives out of retention")
+
+    def handle(self, *args, **options):
+        archived = 0
+        failed = 0
+        if not options["prune_only"]:
+            # Logs already pruned, or out of retention, are not archived (again)
+            for execution in logs.archivable_executions().iterator():
+                try:
+                    logs.archive_execution_log(execution)
+                    archived += 1
+                except cfy.ORCHESTRATOR_ERRORS as err:
+                    # The execution (or its deployment) might have been purged from the orchestrator
+                    LOGGER.warning("Log of execution " + execution.id + " could not be archived: " + str(err))
+                    failed += 1
+
+        removed = logs.prune_archives()
+
+        message = "Logs archived: {0}, failed: {1}, archives removed: {2}".format(archived, failed, removed)
+        LOGGER.info(message)
+        self.stdout.write(message)
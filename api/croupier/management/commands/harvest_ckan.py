@@ -0,0 +1,77 @@
+""" Harvest the metadata of the CKAN data catalogue into the local full-text index """
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from croupier import ckan
+from croupier.models import Dataset
+
+# Get an instance of a logger
+LOGGER = logging.getLogger(__name__)
+
+# Datasets removed per query when they are no longer in the catalogue
+DELETE_BATCH_SIZE = 500
+
+
+def _dataset_fields(package):
+    metadata_modified = parse_datetime(package["metadata_modified"])
+    if timezone.is_naive(metadata_modified):
+        # CKAN dates are expressed in UTC
+        metadata_modified = timezone.make_aware(metadata_modified, timezone.utc)
+
+    return {
+        "name": package["name"],
+        "title": package.get("title"),
+        "notes": package.get("notes"),
+        "tags": " ".join(tag["name"] for tag in package.get("tags") or []),
+        "organization": (package.get("organization") or {}).get("name"),
+        "metadata_modified": metadata_modified,
+    }
+
+
+class Command(BaseCommand):
+    help = "Harvest the datasets modified in CKAN since the last harvest into the local index"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true",
+                            help="Harvest the whole catalogue and remove the datasets no longer available")
+
+    def handle(self, *args, **options):
+        full = options["full"]
+        since = None
+        if not full:
+            since = Dataset.objects.aggregate(last=Max("metadata_modified"))["last"]
+
+        harvested_ids = set()
+        after_id = None
+        while True:
+            result, err = ckan.list_modified_datasets(since, after_id)
+            if err:
+                raise CommandError(err)
+
+            packages = result["results"]
+            with transaction.atomic():
+                for package in packages:
+                    Dataset.objects.update_or_create(dataset_id=package["id"], defaults=_dataset_fields(package))
+                    harvested_ids.add(package["id"])
+
+            if len(packages) < ckan.HARVEST_ROWS:
+                break
+            # The next page starts after the last dataset read (datasets modified meanwhile move to the end)
+            since = _dataset_fields(packages[-1])["metadata_modified"]
+            after_id = packages[-1]["id"]
+
+        removed = 0
+        if full:
+            stale_ids = list(set(Dataset.objects.values_list("dataset_id", flat=True)) - harvested_ids)
+            for offset in range(0, len(stale_ids), DELETE_BATCH_SIZE):
+                deleted, _ = Dataset.objects.filter(dataset_id__in=stale_ids[offset:offset + DELETE_BATCH_SIZE]).delete()
+                removed += deleted
+
+        message = "Datasets harvested: {0}, removed: {1}".format(len(harvested_ids), removed)
+        LOGGER.info(message)
+        self.stdout.write(message)
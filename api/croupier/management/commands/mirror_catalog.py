@@ -0,0 +1,65 @@
+""" Keep the local mirror of the orchestrator catalog (blueprints, deployments and executions) current """
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from croupier import catalog
+from croupier.models import CatalogSync
+
+# Get an instance of a logger
+LOGGER = logging.getLogger(__name__)
+
+# Resources mirrored, in order (deployments are linked to blueprints, executions to deployments)
+RESOURCES = (catalog.BLUEPRINTS, catalog.DEPLOYMENTS, catalog.EXECUTIONS)
+
+
+def _full_sync_due(resource):
+    sync_state = CatalogSync.objects.filter(resource=resource).first()
+    if sync_state is None or sync_state.last_full_sync is None:
+        return True
+    return sync_state.last_full_sync + timedelta(seconds=settings.CATALOG_MIRROR_FULL_INTERVAL) < \
+        datetime.now(timezone.utc)
+
+
+class Command(BaseCommand):
+    help = "Synchronize the changes of the orchestrator catalog into the database (once, or periodically with " \
+           "--interval), and the whole catalog every CATALOG_MIRROR_FULL_INTERVAL seconds"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=0,
+                            help="Seconds between synchronizations (run until the command is stopped)")
+        parser.add_argument("--full", action="store_true",
+                            help="Synchronize the whole catalog in the first run")
+
+    def mirror(self, force_full):
+        for resource in RESOURCES:
+            # Executions are always synchronized from their changes
+            full = resource != catalog.EXECUTIONS and (force_full or _full_sync_due(resource))
+            try:
+                synchronized = catalog.synchronize(resource, wait=False, full=full)
+            except Exception as ex:
+                LOGGER.exception(ex)
+                synchronized = False
+
+            sync_state = CatalogSync.objects.filter(resource=resource).first()
+            if synchronized and sync_state is not None:
+                self.stdout.write("{0} ({1}): {2} rows changed in {3:.3f}s".format(
+                    resource, "full" if full else "changes", sync_state.last_changes, sync_state.last_duration))
+            else:
+                self.stdout.write("{0}: not synchronized (orchestrator not available or synchronization running "
+                                  "in another process)".format(resource))
+
+    def handle(self, *args, **options):
+        force_full = options["full"]
+        while True:
+            self.mirror(force_full)
+            force_full = False
+            if not options["interval"]:
+                break
+            # Do not keep the connection open while sleeping
+            connection.close()
+            time.sleep(options["interval"])
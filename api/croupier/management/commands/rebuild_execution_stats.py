@@ -0,0 +1,12 @@
+""" Rebuild the daily statistics of the executions """
+from django.core.management.base import BaseCommand
+
+from croupier import analytics
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily statistics (rollups) of the finished executions from scratch"
+
+    def handle(self, *args, **options):
+        counted = analytics.rebuild()
+        self.stdout.write("Executions counted: {0}".format(counted))
@@ -0,0 +1,21 @@
+""" Write the replication heartbeat, used to measure the lag of the database replicas """
+import time
+
+from django.core.management.base import BaseCommand
+
+from croupier import routers
+
+
+class Command(BaseCommand):
+    help = "Write the replication heartbeat in the default database (once, or periodically with --interval)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=0,
+                            help="Seconds between heartbeats (written until the command is stopped)")
+
+    def handle(self, *args, **options):
+        while True:
+            routers.write_heartbeat()
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
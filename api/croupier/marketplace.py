@@ -1,9 +1,15 @@
-from woocommerce import API
+from woocommerce.oauth import OAuth
 from os import getenv
+from time import time
 import json
 
 import logging
 
+from django.conf import settings
+
+from croupier import transport
+from croupier.cache import cached
+
 # Get an instance of a logger
 LOGGER = logging.getLogger(__name__)
 
@@ -11,23 +17,34 @@ LOGGER = logging.getLogger(__name__)
 marketplace_url = getenv("MARKETPLACE_URL", "")
 market_consumer_key = getenv("M_CONSUMER_KEY", "")
 market_consumer_secret = getenv("M_CONSUMER_SECRET", "")
+market_api_version = "wc/v3"
 
 
-def check_orders_for_user(user_name):
-    # Create the WooCommerce client
-    wc_api = API(url=marketplace_url, consumer_key=market_consumer_key, consumer_secret=market_consumer_secret,
-                 version="wc/v3")
+def _wc_get(endpoint):
+    # Call the WooCommerce REST API through the shared transport, authenticating as the WooCommerce client does:
+    # basic authentication over HTTPS, OAuth 1.0a signed URLs otherwise
+    url = marketplace_url.rstrip("/") + "/wp-json/" + market_api_version + "/" + endpoint
+    headers = {"accept": "application/json"}
+    if url.startswith("https"):
+        return transport.get(url, auth=(market_consumer_key, market_consumer_secret), headers=headers)
 
+    oauth = OAuth(url=url + "?", consumer_key=market_consumer_key, consumer_secret=market_consumer_secret,
+                  version=market_api_version, method="GET", oauth_timestamp=int(time()))
+    return transport.get(oauth.get_oauth_url(), headers=headers)
+
+
+@cached("marketplace-orders", settings.MARKETPLACE_ORDERS_CACHE_TTL)
+def check_orders_for_user(user_name):
     LOGGER.info("Connecting with the WooCommerce...")
     # The API fails to list all customers, so we start iterating through all the orders
     ordered_apps_list = []
-    response_orders = wc_api.get("orders")
+    response_orders = _wc_get("orders")
     orders_list = response_orders.json()
     LOGGER.info("WooCommerce response orders: " + str(orders_list))
     for order_info in orders_list:
         # Detect if the order was made by our user
         order_customer = order_info["customer_id"]
-        response_user = wc_api.get("customers/"+str(order_customer))
+        response_user = _wc_get("customers/"+str(order_customer))
         user_info = response_user.json()
         # LOGGER.info("WooCommerce response customers: " + str(user_info))
         # If the order was made by our user, add to the list of allowed applications (extract blueprint name)
@@ -35,7 +52,7 @@ def check_orders_for_user(user_name):
             items_list = order_info["line_items"]
             for item_info in items_list:
                 item_id = item_info["product_id"]
-                item_response = wc_api.get("products/" + str(item_id))
+                item_response = _wc_get("products/" + str(item_id))
                 item_full_info = item_response.json()
                 item_name = item_full_info["name"]
                 LOGGER.info("User has access to item: " + item_name)
@@ -0,0 +1,59 @@
+""" In-process metrics registry, exposed in Prometheus text format
+
+Values are kept per process, they are not aggregated across processes: with several gunicorn workers, each scrape
+reports the series of the worker that served it.
+"""
+import threading
+
+_LOCK = threading.Lock()
+_COUNTERS = {}
+_GAUGES = {}
+_SUMMARIES = {}
+
+
+def _key(name, labels):
+    return name, tuple(sorted((labels or {}).items()))
+
+
+def increment(name, labels=None, value=1):
+    key = _key(name, labels)
+    with _LOCK:
+        _COUNTERS[key] = _COUNTERS.get(key, 0) + value
+
+
+def set_gauge(name, value, labels=None):
+    with _LOCK:
+        _GAUGES[_key(name, labels)] = value
+
+
+def observe(name, value, labels=None):
+    # Summaries keep the number of observations and their sum (e.g. to compute mean latencies)
+    key = _key(name, labels)
+    with _LOCK:
+        count, total = _SUMMARIES.get(key, (0, 0.0))
+        _SUMMARIES[key] = (count + 1, total + value)
+
+
+def _format(name, labels, value):
+    if labels:
+        label_list = ",".join('{0}="{1}"'.format(label, str(label_value).replace('"', '\\"'))
+                              for label, label_value in labels)
+        return "{0}{{{1}}} {2}".format(name, label_list, value)
+    return "{0} {1}".format(name, value)
+
+
+def render():
+    with _LOCK:
+        counters = dict(_COUNTERS)
+        gauges = dict(_GAUGES)
+        summaries = dict(_SUMMARIES)
+
+    lines = []
+    for (name, labels), value in sorted(counters.items()):
+        lines.append(_format(name, labels, value))
+    for (name, labels), value in sorted(gauges.items()):
+        lines.append(_format(name, labels, value))
+    for (name, labels), (count, total) in sorted(summaries.items()):
+        lines.append(_format(name + "_count", labels, count))
+        lines.append(_format(name + "_sum", labels, total))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,28 @@
+""" Croupier middlewares """
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+
+from croupier import routers
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """ Compress responses (gzip) only when they are big enough to be worth the CPU time """
+
+    def process_response(self, request, response):
+        if not response.streaming and len(response.content) < settings.RESPONSE_COMPRESSION_MIN_SIZE:
+            return response
+        return super().process_response(request, response)
+
+
+class ReplicaRoutingMiddleware:
+    """ Resets the database routing state (replica reads, user of the request) of the thread for each request """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        routers.reset()
+        try:
+            return self.get_response(request)
+        finally:
+            routers.reset()
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.1 on 2026-10-19 13:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('croupier', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='application',
+            name='inputs',
+            field=models.JSONField(null=True),
+        ),
+    ]
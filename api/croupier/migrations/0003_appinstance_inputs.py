@@ -0,0 +1,18 @@
+# Generated by Django 3.1.1 on 2026-10-19 13:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('croupier', '0002_application_inputs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appinstance',
+            name='inputs',
+            field=models.JSONField(null=True),
+        ),
+    ]
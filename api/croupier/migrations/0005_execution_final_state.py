@@ -0,0 +1,44 @@
+# Generated by Django 3.1.1 on 2026-10-19 13:32
+
+from django.db import migrations, models
+
+# Final states of the Cloudify executions (Execution.END_STATES)
+END_STATES = ['terminated', 'failed', 'cancelled']
+
+
+def mark_final_executions(apps, schema_editor):
+    # Executions already finished are not requested to the orchestrator again (the status is stored as returned by
+    # the orchestrator, or as the uppercase choices of the model)
+    InstanceExecution = apps.get_model('croupier', 'InstanceExecution')
+    final_states = END_STATES + [state.upper() for state in END_STATES]
+    InstanceExecution.objects.filter(status__in=final_states).update(is_final=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('croupier', '0004_modified'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='instanceexecution',
+            name='current_operation',
+            field=models.CharField(max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='instanceexecution',
+            name='error_message',
+            field=models.TextField(null=True),
+        ),
+        migrations.AddField(
+            model_name='instanceexecution',
+            name='is_final',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='instanceexecution',
+            index=models.Index(fields=['owner', 'is_final'], name='execution_owner_final_idx'),
+        ),
+        migrations.RunPython(mark_final_executions, migrations.RunPython.noop),
+    ]
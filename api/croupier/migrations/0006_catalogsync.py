@@ -0,0 +1,21 @@
+# Generated by Django 3.1.1 on 2026-10-19 13:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('croupier', '0005_execution_final_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogSync',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resource', models.CharField(max_length=50, unique=True)),
+                ('last_synced', models.DateTimeField(null=True)),
+            ],
+        ),
+    ]
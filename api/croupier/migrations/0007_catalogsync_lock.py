@@ -0,0 +1,23 @@
+# Generated by Django 3.1.1 on 2026-10-19 13:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('croupier', '0006_catalogsync'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='catalogsync',
+            name='lock_expires',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='catalogsync',
+            name='lock_owner',
+            field=models.CharField(max_length=32, null=True),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 3.1.1 on 2026-10-19 13:37
+
+from django.db import migrations, models
+
+from croupier import fulltext
+
+DATASET_SEARCH_FIELDS = ("name", "title", "notes", "tags")
+
+
+def create_dataset_index(apps, schema_editor):
+    fulltext.create_index(schema_editor, "croupier_dataset", DATASET_SEARCH_FIELDS)
+
+
+def drop_dataset_index(apps, schema_editor):
+    fulltext.drop_index(schema_editor, "croupier_dataset", DATASET_SEARCH_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('croupier', '0007_catalogsync_lock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Dataset',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dataset_id', models.CharField(max_length=100, unique=True)),
+                ('name', models.CharField(max_length=200)),
+                ('title', models.CharField(max_length=512, null=True)),
+                ('notes', models.TextField(null=True)),
+                ('tags', models.TextField(null=True)),
+                ('organization', models.CharField(max_length=200, null=True)),
+                ('metadata_modified', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.RunPython(create_dataset_index, drop_dataset_index),
+    ]
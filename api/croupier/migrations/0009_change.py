@@ -0,0 +1,41 @@
+# Generated by Django 3.1.1 on 2026-10-19 13:41
+
+from django.db import migrations, models
+
+
+def record_existing_objects(apps, schema_editor):
+    # Objects stored before the change feed are part of it from the start
+    Change = apps.get_model('croupier', 'Change')
+    for model_name, feed_name in (('Application', 'application'), ('AppInstance', 'instance'),
+                                  ('InstanceExecution', 'execution')):
+        model = apps.get_model('croupier', model_name)
+        Change.objects.bulk_create(
+            Change(model=feed_name, object_id=str(pk), owner=owner_id)
+            for pk, owner_id in model.objects.values_list('pk', 'owner_id')
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('croupier', '0008_dataset'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=50)),
+                ('object_id', models.CharField(max_length=50)),
+                ('owner', models.CharField(max_length=150, null=True)),
+                ('deleted', models.BooleanField(default=False)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['model', 'object_id'], name='change_object_idx'),
+        ),
+        migrations.RunPython(record_existing_objects, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.1.1 on 2026-10-19 13:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('croupier', '0009_change'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='instanceexecution',
+            name='log_events',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.CreateModel(
+            name='ExecutionLogChunk',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('offset', models.IntegerField()),
+                ('count', models.IntegerField()),
+                ('data', models.BinaryField()),
+                ('execution', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='log_chunks', to='croupier.instanceexecution')),
+            ],
+            options={
+                'unique_together': {('execution', 'offset')},
+            },
+        ),
+    ]
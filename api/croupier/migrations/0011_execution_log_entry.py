@@ -0,0 +1,50 @@
+# Generated by Django 3.1.1 on 2026-10-19 13:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from croupier import fulltext
+
+LOG_ENTRY_SEARCH_FIELDS = ("message",)
+
+
+def create_log_entry_index(apps, schema_editor):
+    fulltext.create_index(schema_editor, "croupier_executionlogentry", LOG_ENTRY_SEARCH_FIELDS)
+
+
+def drop_log_entry_index(apps, schema_editor):
+    fulltext.drop_index(schema_editor, "croupier_executionlogentry", LOG_ENTRY_SEARCH_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('croupier', '0010_execution_log_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExecutionLogEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner', models.CharField(max_length=150)),
+                ('offset', models.IntegerField()),
+                ('timestamp', models.DateTimeField(null=True)),
+                ('node', models.CharField(max_length=100, null=True)),
+                ('level', models.CharField(max_length=20, null=True)),
+                ('event_type', models.CharField(max_length=50, null=True)),
+                ('message', models.TextField(null=True)),
+                ('execution', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='log_entries', to='croupier.instanceexecution')),
+                ('instance', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='croupier.appinstance')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='executionlogentry',
+            index=models.Index(fields=['owner', 'timestamp'], name='log_entry_owner_time_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='executionlogentry',
+            unique_together={('execution', 'offset')},
+        ),
+        migrations.RunPython(create_log_entry_index, drop_log_entry_index),
+    ]
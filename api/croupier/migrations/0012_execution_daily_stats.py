@@ -0,0 +1,66 @@
+# Generated by Django 3.1.1 on 2026-10-19 13:45
+
+import bisect
+
+from django.db import migrations, models
+
+# Upper bounds (seconds) of the buckets of the execution time histograms (analytics.TIME_BUCKETS)
+TIME_BUCKETS = [1, 2, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200, 14400, 28800, 43200, 86400]
+
+
+def count_existing_executions(apps, schema_editor):
+    # Executions finished before the statistics are counted in them from the start (as rebuild_execution_stats)
+    InstanceExecution = apps.get_model('croupier', 'InstanceExecution')
+    ExecutionDailyStats = apps.get_model('croupier', 'ExecutionDailyStats')
+
+    rollups = {}
+    executions = InstanceExecution.objects.filter(is_final=True).select_related('instance__app')
+    for execution in executions.iterator():
+        key = ((execution.finished or execution.created).date(), execution.instance.app.name, execution.owner_id,
+               execution.status)
+        if key not in rollups:
+            day, app, owner, status = key
+            rollups[key] = ExecutionDailyStats(day=day, app=app, owner=owner, status=status,
+                                               time_histogram=[0] * (len(TIME_BUCKETS) + 1))
+        stats = rollups[key]
+        stats.time_histogram[bisect.bisect_left(TIME_BUCKETS, execution.execution_time or 0)] += 1
+        stats.count += 1
+        stats.total_time += execution.execution_time or 0
+        if execution.has_errors:
+            stats.with_errors += 1
+
+    ExecutionDailyStats.objects.bulk_create(rollups.values(), batch_size=500)
+    InstanceExecution.objects.filter(is_final=True).update(in_stats=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('croupier', '0011_execution_log_entry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='instanceexecution',
+            name='in_stats',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='ExecutionDailyStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('app', models.CharField(max_length=50)),
+                ('owner', models.CharField(max_length=150)),
+                ('status', models.CharField(max_length=17)),
+                ('count', models.IntegerField(default=0)),
+                ('with_errors', models.IntegerField(default=0)),
+                ('total_time', models.BigIntegerField(default=0)),
+                ('time_histogram', models.JSONField(default=list)),
+            ],
+            options={
+                'unique_together': {('day', 'app', 'owner', 'status')},
+            },
+        ),
+        migrations.RunPython(count_existing_executions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.1.1 on 2026-10-19 13:46
+
+import croupier.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('croupier', '0012_execution_daily_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appinstance',
+            name='manager',
+            field=models.CharField(default=croupier.models.default_manager, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='application',
+            name='manager',
+            field=models.CharField(default=croupier.models.default_manager, max_length=50),
+        ),
+    ]
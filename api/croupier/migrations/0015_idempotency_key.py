@@ -0,0 +1,30 @@
+# Generated by Django 3.1.1 on 2026-10-19 13:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('croupier', '0014_replication_heartbeat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner', models.CharField(max_length=150)),
+                ('key', models.CharField(max_length=255)),
+                ('endpoint', models.CharField(max_length=255)),
+                ('fingerprint', models.CharField(max_length=64)),
+                ('created', models.DateTimeField(db_index=True)),
+                ('status_code', models.IntegerField(null=True)),
+                ('response', models.JSONField(null=True)),
+                ('lock_expires', models.DateTimeField(null=True)),
+            ],
+            options={
+                'unique_together': {('owner', 'key')},
+            },
+        ),
+    ]
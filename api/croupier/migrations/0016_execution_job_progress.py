@@ -0,0 +1,18 @@
+# Generated by Django 3.1.1 on 2026-10-19 13:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('croupier', '0015_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='instanceexecution',
+            name='job_progress',
+            field=models.JSONField(null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.1.1 on 2026-10-19 13:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('croupier', '0016_execution_job_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='catalogsync',
+            name='last_changes',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='catalogsync',
+            name='last_duration',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='catalogsync',
+            name='last_full_sync',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='catalogsync',
+            name='watermarks',
+            field=models.JSONField(default=dict),
+        ),
+    ]
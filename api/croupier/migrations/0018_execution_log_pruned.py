@@ -0,0 +1,18 @@
+# Generated by Django 3.1.1 on 2026-10-19 14:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('croupier', '0017_catalog_mirror'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='instanceexecution',
+            name='log_pruned',
+            field=models.BooleanField(default=False),
+        ),
+    ]
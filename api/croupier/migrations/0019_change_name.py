@@ -0,0 +1,18 @@
+# Generated by Django 3.1.1 on 2026-10-19 14:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('croupier', '0018_execution_log_pruned'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='change',
+            name='name',
+            field=models.CharField(max_length=50, null=True),
+        ),
+    ]
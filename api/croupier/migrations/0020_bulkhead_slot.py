@@ -0,0 +1,26 @@
+# Generated by Django 3.1.1 on 2026-10-19 14:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('croupier', '0019_change_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BulkheadSlot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dependency', models.CharField(max_length=100)),
+                ('slot', models.IntegerField()),
+                ('holder', models.CharField(max_length=32, null=True)),
+                ('expires', models.DateTimeField(null=True)),
+            ],
+            options={
+                'unique_together': {('dependency', 'slot')},
+            },
+        ),
+    ]
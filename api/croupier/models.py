@@ -17,6 +17,10 @@ from django.db import models
 LOGGER = logging.getLogger(__name__)
 
 
+def default_manager():
+    return settings.ORCHESTRATOR_DEFAULT_MANAGER
+
+
 class Application(models.Model):
     name = models.CharField(max_length=50, unique=True)
     description = models.CharField(max_length=256, null=True)
@@ -28,6 +32,12 @@ class Application(models.Model):
     is_new = models.BooleanField(default=False)
     is_updated = models.BooleanField(default=False)
     is_advertised = models.BooleanField(default=False)
+    # Last local change of the row (used as watermark for conditional requests)
+    modified = models.DateTimeField(auto_now=True)
+    # Blueprint inputs schema, refreshed only when the blueprint is updated in the orchestrator
+    inputs = models.JSONField(null=True)
+    # Cloudify manager (of settings.ORCHESTRATOR_MANAGERS) where the blueprint is uploaded
+    manager = models.CharField(max_length=50, default=default_manager)
 
     @classmethod
     def create_blueprint_id(cls, name):
@@ -50,11 +60,16 @@ class AppInstance(models.Model):
     created = models.DateTimeField()
     updated = models.DateTimeField()
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, to_field='username')
-    # inputs = models.TextField(null=True)
+    # Deployment inputs (secret values redacted), as a list of {"name", "value"} entries
+    inputs = models.JSONField(null=True)
+    # Cloudify manager of the deployment (always the manager of its application)
+    manager = models.CharField(max_length=50, default=default_manager)
 
     app = models.ForeignKey(Application, on_delete=models.CASCADE)
     last_execution = models.CharField(max_length=50, null=True)
     is_new = models.BooleanField(default=False)
+    # Last local change of the row (used as watermark for conditional requests)
+    modified = models.DateTimeField(auto_now=True)
 
     @classmethod
     def create_deployment_id(cls, name):
@@ -125,6 +140,8 @@ class InstanceExecution(models.Model):
     created = models.DateTimeField()
     finished = models.DateTimeField(null=True)
     execution_time = models.IntegerField(null=True)
+    # Last local change of the row (used as watermark for conditional requests)
+    modified = models.DateTimeField(auto_now=True)
 
     # User who created the execution
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, to_field='username')
@@ -154,9 +171,200 @@ class InstanceExecution(models.Model):
     has_errors = models.BooleanField(default=False)
     num_errors = models.IntegerField(default=0)
     current_task = models.CharField(max_length=50, null=True)
+    current_operation = models.CharField(max_length=100, null=True)
+    error_message = models.TextField(null=True)
     progress = models.FloatField(default=0.0)
+    # Progress of each job instance (node, progress, current operation and errors, by node instance id)
+    job_progress = models.JSONField(null=True)
+
+    # Once the execution has ended, its summary is frozen and it is never requested to the orchestrator again
+    is_final = models.BooleanField(default=False)
+
+    # Number of events of the execution archived locally (None if its log is not archived)
+    log_events = models.IntegerField(null=True)
+    # Whether the archive of the log was removed (out of retention or size), so it is never archived again
+    log_pruned = models.BooleanField(default=False)
+
+    # Whether the (final) execution is already counted in the daily statistics
+    in_stats = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["owner", "is_final"], name="execution_owner_final_idx"),
+        ]
 
     @classmethod
     def getByName(cls, name):
         return InstanceExecution.objects.all().filter(id=name)[0]
 
+
+class ExecutionLogChunk(models.Model):
+    """ Consecutive events of the log of a finished execution, starting at an offset, as compressed JSON """
+
+    execution = models.ForeignKey(InstanceExecution, on_delete=models.CASCADE, related_name="log_chunks")
+    offset = models.IntegerField()
+    count = models.IntegerField()
+    data = models.BinaryField()
+
+    class Meta:
+        unique_together = [["execution", "offset"]]
+
+    def __str__(self):
+        return "Log of {0} from {1}".format(self.execution_id, self.offset)
+
+
+class ExecutionLogEntry(models.Model):
+    """ Event of an execution log, in the full-text index of the logs of each user """
+
+    execution = models.ForeignKey(InstanceExecution, on_delete=models.CASCADE, related_name="log_entries")
+    instance = models.ForeignKey(AppInstance, on_delete=models.CASCADE)
+    owner = models.CharField(max_length=150)
+    offset = models.IntegerField()
+    timestamp = models.DateTimeField(null=True)
+    node = models.CharField(max_length=100, null=True)
+    level = models.CharField(max_length=20, null=True)
+    event_type = models.CharField(max_length=50, null=True)
+    message = models.TextField(null=True)
+
+    # Columns included in the full-text index
+    SEARCH_FIELDS = ("message",)
+
+    class Meta:
+        unique_together = [["execution", "offset"]]
+        indexes = [
+            models.Index(fields=["owner", "timestamp"], name="log_entry_owner_time_idx"),
+        ]
+
+    def __str__(self):
+        return "Event {0} of {1}".format(self.offset, self.execution_id)
+
+
+class ExecutionDailyStats(models.Model):
+    """ Rollup of the finished executions of an application, by a user, ending in a status, on a day. The
+    execution times are summarized in a histogram (counts per bucket of ANALYTICS_TIME_BUCKETS) """
+
+    day = models.DateField()
+    app = models.CharField(max_length=50)
+    owner = models.CharField(max_length=150)
+    status = models.CharField(max_length=17)
+    count = models.IntegerField(default=0)
+    with_errors = models.IntegerField(default=0)
+    total_time = models.BigIntegerField(default=0)
+    time_histogram = models.JSONField(default=list)
+
+    class Meta:
+        unique_together = [["day", "app", "owner", "status"]]
+
+    def __str__(self):
+        return "Executions of {0} by {1} on {2}: {3}".format(self.app, self.owner, self.day, self.count)
+
+
+class CatalogSync(models.Model):
+    """ Synchronization state of a catalog resource (blueprints, deployments) with the orchestrator """
+
+    resource = models.CharField(max_length=50, unique=True)
+    last_synced = models.DateTimeField(null=True)
+
+    # Lease taken by the worker synchronizing the resource, so only one synchronization runs at a time
+    lock_owner = models.CharField(max_length=32, null=True)
+    lock_expires = models.DateTimeField(null=True)
+
+    # Last full synchronization (the others only get the changes since the watermarks), and duration (seconds)
+    # and rows changed of the last synchronization
+    last_full_sync = models.DateTimeField(null=True)
+    last_duration = models.FloatField(null=True)
+    last_changes = models.IntegerField(null=True)
+    # Latest update (or creation) date seen in each manager
+    watermarks = models.JSONField(default=dict)
+
+    def __str__(self):
+        return "Catalog {0} synchronized at {1}".format(self.resource, self.last_synced)
+
+
+class Dataset(models.Model):
+    """ Dataset of the data catalogue (CKAN), harvested in the local full-text index """
+
+    dataset_id = models.CharField(max_length=100, unique=True)
+    name = models.CharField(max_length=200)
+    title = models.CharField(max_length=512, null=True)
+    notes = models.TextField(null=True)
+    tags = models.TextField(null=True)
+    organization = models.CharField(max_length=200, null=True)
+    metadata_modified = models.DateTimeField(db_index=True)
+
+    # Columns included in the full-text index
+    SEARCH_FIELDS = ("name", "title", "notes", "tags")
+
+    def __str__(self):
+        return "Dataset {0}".format(self.name)
+
+
+class Change(models.Model):
+    """ Last change of an application, instance or execution. The id is the sequence of the change feed: every
+    write of an object replaces its previous change with a new one, with a higher id """
+
+    model = models.CharField(max_length=50)
+    object_id = models.CharField(max_length=50)
+    owner = models.CharField(max_length=150, null=True)
+    # Name of the application (the users who ordered it can see it, also once deleted)
+    name = models.CharField(max_length=50, null=True)
+    deleted = models.BooleanField(default=False)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["model", "object_id"], name="change_object_idx"),
+        ]
+
+    def __str__(self):
+        return "Change {0} of {1} {2}".format(self.id, self.model, self.object_id)
+
+
+class ReplicationHeartbeat(models.Model):
+    """ Timestamp written periodically in the default database, to measure how far behind the replicas are """
+
+    beat = models.DateTimeField()
+
+    def __str__(self):
+        return "Heartbeat at {0}".format(self.beat)
+
+
+class IdempotencyKey(models.Model):
+    """ Request made with an Idempotency-Key header, and its response once it finished, replayed to the retries of
+    the request with the same key """
+
+    owner = models.CharField(max_length=150)
+    key = models.CharField(max_length=255)
+    endpoint = models.CharField(max_length=255)
+    # Hash of the request body, the key cannot be reused for a different request
+    fingerprint = models.CharField(max_length=64)
+    created = models.DateTimeField(db_index=True)
+
+    # Response of the request, null while it is in progress
+    status_code = models.IntegerField(null=True)
+    response = models.JSONField(null=True)
+
+    # Lease of the worker running the request, so another one takes over if it crashed
+    lock_expires = models.DateTimeField(null=True)
+
+    class Meta:
+        unique_together = ["owner", "key"]
+
+    def __str__(self):
+        return "Idempotency key {0} of {1} for {2}".format(self.key, self.owner, self.endpoint)
+
+
+class BulkheadSlot(models.Model):
+    """ Slot of the concurrent calls allowed to a dependency, shared by all the worker processes """
+
+    dependency = models.CharField(max_length=100)
+    slot = models.IntegerField()
+    # Call holding the slot (null if it is free), until its lease expires
+    holder = models.CharField(max_length=32, null=True)
+    expires = models.DateTimeField(null=True)
+
+    class Meta:
+        unique_together = ["dependency", "slot"]
+
+    def __str__(self):
+        return "Slot {0} of {1}".format(self.slot, self.dependency)
@@ -0,0 +1,61 @@
+""" Placement of the new applications on the Cloudify managers (their instances follow them) """
+import hashlib
+import itertools
+import logging
+
+from django.conf import settings
+from django.db.models import Count
+
+from croupier import cfy
+from croupier.models import Application, AppInstance
+
+# Get an instance of a logger
+LOGGER = logging.getLogger(__name__)
+
+# Placement policies
+LEAST_LOADED = "least_loaded"
+ROUND_ROBIN = "round_robin"
+AFFINITY = "affinity"
+
+_round_robin = itertools.count()
+
+
+def _least_loaded(candidates, user_name):
+    # Manager with the fewest instances deployed
+    loads = dict(
+        AppInstance.objects.filter(manager__in=candidates).values_list("manager").annotate(Count("id")).order_by()
+    )
+    return min(candidates, key=lambda name: loads.get(name, 0))
+
+
+def _round_robin_manager(candidates, user_name):
+    return candidates[next(_round_robin) % len(candidates)]
+
+
+def _affinity(candidates, user_name):
+    # Manager of the other applications of the user, or a stable choice based on the user name
+    manager = (
+        Application.objects.filter(owner=user_name, manager__in=candidates)
+        .values_list("manager", flat=True).first()
+    )
+    if manager is None:
+        manager = candidates[int(hashlib.sha1(user_name.encode("utf-8")).hexdigest(), 16) % len(candidates)]
+    return manager
+
+
+_POLICIES = {
+    LEAST_LOADED: _least_loaded,
+    ROUND_ROBIN: _round_robin_manager,
+    AFFINITY: _affinity,
+}
+
+
+def choose_manager(user_name):
+    # Managers considered down (circuit breaker open) are skipped, unless all of them are
+    candidates = [name for name in cfy.managers() if cfy.is_available(name)] or cfy.managers()
+    if len(candidates) == 1:
+        return candidates[0]
+
+    manager = _POLICIES[settings.ORCHESTRATOR_PLACEMENT_POLICY](candidates, user_name)
+    LOGGER.info("Manager chosen for a new application of " + user_name + ": " + manager)
+    return manager
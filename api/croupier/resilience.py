@@ -0,0 +1,270 @@
+""" Bulkhead and circuit breaker protections for calls to remote dependencies """
+import threading
+import time
+import logging
+import uuid
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.db.utils import DatabaseError
+from django.utils import timezone
+from requests import Session
+from requests.exceptions import ConnectionError, Timeout
+
+from croupier import metrics
+
+# Get an instance of a logger
+LOGGER = logging.getLogger(__name__)
+
+# Breaker states (exported as gauge values)
+CLOSED = 0
+HALF_OPEN = 1
+OPEN = 2
+STATE_NAMES = {CLOSED: "closed", HALF_OPEN: "half_open", OPEN: "open"}
+
+# Seconds between checks while waiting for a free slot of a bulkhead
+SLOT_POLL_INTERVAL = 0.05
+
+
+class CircuitOpenError(ConnectionError):
+    """ The dependency is considered down, the call is rejected without trying it """
+
+
+class BulkheadFullError(ConnectionError):
+    """ Too many concurrent calls to the dependency, the call is rejected """
+
+
+class CircuitBreaker:
+    """ Fails fast after consecutive failures, and lets a single probe call through once the reset
+    timeout has passed (half-open) to check if the dependency is back. When it opens, the time is shared through
+    the cache, so the breakers of the other worker processes open too instead of finding out on their own """
+
+    def __init__(self, name, failure_threshold, reset_timeout):
+        self.name = name
+        self._shared_key = "circuit-breaker:" + name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        metrics.set_gauge("circuit_breaker_state", CLOSED, {"dependency": name})
+
+    @property
+    def state(self):
+        return self._state
+
+    def is_open(self):
+        if self._state == CLOSED:
+            self._adopt_shared_state()
+        return self._state == OPEN and time.monotonic() < self._opened_at + self.reset_timeout
+
+    def _shared_opened_at(self):
+        # Wall clock time the breaker was opened by any worker (None if it is not open)
+        try:
+            opened_at = cache.get(self._shared_key)
+        except Exception as err:
+            LOGGER.warning("Shared state of circuit breaker " + self.name + " not available: " + str(err))
+            return None
+        if opened_at is None or time.time() >= opened_at + self.reset_timeout:
+            return None
+        return opened_at
+
+    def _adopt_shared_state(self):
+        # Open the breaker if another worker opened it (keeping the time it was opened there)
+        opened_at = self._shared_opened_at()
+        if opened_at is not None:
+            with self._lock:
+                if self._state == CLOSED:
+                    self._opened_at = time.monotonic() - (time.time() - opened_at)
+                    self._set_state(OPEN)
+
+    def _share_state(self, state):
+        try:
+            if state == OPEN:
+                cache.set(self._shared_key, time.time(), self.reset_timeout)
+            else:
+                cache.delete(self._shared_key)
+        except Exception as err:
+            LOGGER.warning("Shared state of circuit breaker " + self.name + " not updated: " + str(err))
+
+    def _set_state(self, state):
+        if state != self._state:
+            LOGGER.warning("Circuit breaker " + self.name + " is now " + STATE_NAMES[state])
+            metrics.increment("circuit_breaker_transitions_total", {"dependency": self.name,
+                                                                    "state": STATE_NAMES[state]})
+        self._state = state
+        metrics.set_gauge("circuit_breaker_state", state, {"dependency": self.name})
+
+    def allow(self):
+        if self._state == CLOSED:
+            self._adopt_shared_state()
+        with self._lock:
+            if self._state == OPEN:
+                if time.monotonic() < self._opened_at + self.reset_timeout:
+                    return False
+                self._set_state(HALF_OPEN)
+            if self._state == HALF_OPEN:
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+
+    def release(self):
+        # The call was allowed but never performed
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            closing = self._state != CLOSED
+            self._failures = 0
+            self._probing = False
+            self._set_state(CLOSED)
+        if closing:
+            self._share_state(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            opening = self._state == HALF_OPEN or self._failures >= self.failure_threshold
+            if opening:
+                self._opened_at = time.monotonic()
+                self._set_state(OPEN)
+        if opening:
+            self._share_state(OPEN)
+
+
+class Bulkhead:
+    """ Limits the number of concurrent calls to a dependency, so slow calls cannot take all the workers. The limit
+    applies to all the worker processes: each call holds one of the max_concurrent slots of the dependency stored
+    in the database, leased for lease seconds (the slots of a crashed worker are freed when their lease expires).
+    The threads of the process also share a semaphore of the same size, so they do not poll the database for
+    slots the process could never get """
+
+    def __init__(self, name, max_concurrent, max_wait, lease):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_wait = max_wait
+        self.lease = lease
+        self._semaphore = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._slots_created = False
+
+    def _create_slots(self):
+        from croupier.models import BulkheadSlot
+
+        if not self._slots_created:
+            BulkheadSlot.objects.bulk_create([BulkheadSlot(dependency=self.name, slot=number)
+                                              for number in range(self.max_concurrent)], ignore_conflicts=True)
+            self._slots_created = True
+
+    def _claim_slot(self, token):
+        # Id of a free slot, taken for the token (None if all the slots are taken)
+        from croupier.models import BulkheadSlot
+
+        now = timezone.now()
+        free = Q(holder__isnull=True) | Q(expires__lt=now)
+        candidates = BulkheadSlot.objects.filter(free, dependency=self.name, slot__lt=self.max_concurrent)
+        for slot_id in candidates.values_list("id", flat=True):
+            # Taken only if it is still free (another worker may have taken it meanwhile)
+            if BulkheadSlot.objects.filter(free, id=slot_id).update(
+                    holder=token, expires=now + timedelta(seconds=self.lease)):
+                return slot_id
+        return None
+
+    def _acquire_slot(self, deadline):
+        # Lease of a slot, (slot id, token), waiting for one until the deadline (None if none was freed)
+        self._create_slots()
+        token = uuid.uuid4().hex
+        while True:
+            slot_id = self._claim_slot(token)
+            if slot_id is not None:
+                return slot_id, token
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(SLOT_POLL_INTERVAL)
+
+    def acquire(self):
+        """ Returns whether the call can be made, and the lease of its slot (to be released) """
+        deadline = time.monotonic() + self.max_wait
+        if not self._semaphore.acquire(timeout=self.max_wait):
+            return False, None
+        try:
+            lease = self._acquire_slot(deadline)
+        except DatabaseError as err:
+            # The limit of the process still applies
+            LOGGER.warning("Slots of bulkhead " + self.name + " not available: " + str(err))
+            lease = None
+        else:
+            if lease is None:
+                self._semaphore.release()
+                return False, None
+
+        with self._lock:
+            self._in_flight += 1
+            metrics.set_gauge("bulkhead_in_flight", self._in_flight, {"dependency": self.name})
+        return True, lease
+
+    def release(self, lease):
+        from croupier.models import BulkheadSlot
+
+        with self._lock:
+            self._in_flight -= 1
+            metrics.set_gauge("bulkhead_in_flight", self._in_flight, {"dependency": self.name})
+        self._semaphore.release()
+        if lease is not None:
+            slot_id, token = lease
+            try:
+                BulkheadSlot.objects.filter(id=slot_id, holder=token).update(holder=None, expires=None)
+            except DatabaseError as err:
+                LOGGER.warning("Slot of bulkhead " + self.name + " not released (freed when its lease expires): " +
+                               str(err))
+
+
+class GuardedSession(Session):
+    """ HTTP session whose requests go through a bulkhead and a circuit breaker. Connection errors,
+    timeouts and server errors (5xx) count as failures of the dependency """
+
+    def __init__(self, breaker, bulkhead):
+        super().__init__()
+        self.breaker = breaker
+        self.bulkhead = bulkhead
+
+    def request(self, method, url, *args, **kwargs):
+        labels = {"dependency": self.breaker.name}
+        if not self.breaker.allow():
+            metrics.increment("dependency_calls_rejected_total", dict(labels, reason="circuit_open"))
+            raise CircuitOpenError("Circuit breaker open for " + self.breaker.name + ", call rejected")
+
+        acquired, lease = self.bulkhead.acquire()
+        if not acquired:
+            self.breaker.release()
+            metrics.increment("dependency_calls_rejected_total", dict(labels, reason="bulkhead_full"))
+            raise BulkheadFullError("Too many concurrent calls to " + self.breaker.name + ", call rejected")
+
+        start = time.monotonic()
+        try:
+            response = super().request(method, url, *args, **kwargs)
+        except (ConnectionError, Timeout):
+            self.breaker.record_failure()
+            metrics.increment("dependency_calls_total", dict(labels, outcome="error"))
+            raise
+        except Exception:
+            self.breaker.release()
+            raise
+        finally:
+            metrics.observe("dependency_call_seconds", time.monotonic() - start, labels)
+            self.bulkhead.release(lease)
+
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+            metrics.increment("dependency_calls_total", dict(labels, outcome="error"))
+        else:
+            self.breaker.record_success()
+            metrics.increment("dependency_calls_total", dict(labels, outcome="success"))
+        return response
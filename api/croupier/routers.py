@@ -0,0 +1,163 @@
+""" Routing of read-only queries to the database replicas
+
+Reads are sent to the replicas only inside read_from_replicas() (list views, change feed, analytics), and never
+for a user right after a write of that user (read-your-writes), inside a transaction, or to a replica whose
+replication lag is too high. Everything else uses the default database.
+
+The last writes of the users (read-your-writes) are kept in the default cache, so it has to be shared by all the
+processes serving requests (the file based cache of the settings, or Memcached/Redis for several hosts).
+"""
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.utils import DatabaseError
+from django.utils import timezone
+
+from croupier import metrics
+
+# Get an instance of a logger
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_DB = "default"
+
+# Routing state of the thread (the request being served)
+_state = threading.local()
+
+_replica_cycle = itertools.count()
+
+# Replication lag (seconds) of each replica, and when it was measured
+_lag = {}
+_lag_lock = threading.Lock()
+
+
+def _last_write_key(user_name):
+    return "replica-routing:last-write:" + user_name
+
+
+def reset():
+    _state.replica_reads = False
+    _state.user_name = None
+
+
+def set_user(user_name):
+    # User of the request, whose writes are followed by reads from the default database
+    _state.user_name = user_name
+
+
+@contextmanager
+def read_from_replicas():
+    previous = getattr(_state, "replica_reads", False)
+    _state.replica_reads = True
+    try:
+        yield
+    finally:
+        _state.replica_reads = previous
+
+
+def replica_reads(method):
+    """ Run the (view) method with its read queries sent to the replicas """
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        with read_from_replicas():
+            return method(*args, **kwargs)
+    return wrapper
+
+
+def replicas():
+    return list(settings.DATABASE_REPLICAS)
+
+
+def _measure_lag(replica):
+    # Difference between the last heartbeat written in the default database and the one seen by the replica
+    from croupier.models import ReplicationHeartbeat
+
+    try:
+        primary = ReplicationHeartbeat.objects.using(DEFAULT_DB).order_by("-beat").values_list("beat", flat=True)
+        replicated = ReplicationHeartbeat.objects.using(replica).order_by("-beat").values_list("beat", flat=True)
+        primary, replicated = primary.first(), replicated.first()
+    except DatabaseError as err:
+        LOGGER.warning("Replica " + replica + " not available: " + str(err))
+        return None
+    if primary is None:
+        return 0.0
+    if replicated is None:
+        return None
+    return max(0.0, (primary - replicated).total_seconds())
+
+
+def replica_lag(replica):
+    """ Replication lag (seconds) of the replica, measured at most every DATABASE_REPLICA_LAG_CHECK_INTERVAL.
+    None if it is unknown (replica not available or not replicating) """
+    now = time.monotonic()
+    with _lag_lock:
+        lag, measured = _lag.get(replica, (None, None))
+        if measured is not None and now - measured < settings.DATABASE_REPLICA_LAG_CHECK_INTERVAL:
+            return lag
+        # Other threads keep using the last value while it is measured
+        _lag[replica] = (lag, now)
+
+    lag = _measure_lag(replica)
+    with _lag_lock:
+        _lag[replica] = (lag, now)
+    metrics.set_gauge("db_replica_lag_seconds", -1 if lag is None else lag, {"database": replica})
+    return lag
+
+
+def write_heartbeat():
+    """ Write the replication heartbeat in the default database """
+    from croupier.models import ReplicationHeartbeat
+
+    ReplicationHeartbeat.objects.using(DEFAULT_DB).update_or_create(id=1, defaults={"beat": timezone.now()})
+
+
+def _route(reason, database):
+    metrics.increment("db_read_routing_total", {"database": database, "reason": reason})
+    return database
+
+
+class ReplicaRouter:
+    """ Sends the opted-in reads to a replica in good shape, and all the writes to the default database """
+
+    def db_for_read(self, model, **hints):
+        if not getattr(_state, "replica_reads", False) or not settings.DATABASE_REPLICAS:
+            return DEFAULT_DB
+        if connections[DEFAULT_DB].in_atomic_block:
+            return _route("transaction", DEFAULT_DB)
+
+        user_name = getattr(_state, "user_name", None)
+        if user_name and cache.get(_last_write_key(user_name)):
+            return _route("read_your_writes", DEFAULT_DB)
+
+        candidates = replicas()
+        start = next(_replica_cycle)
+        for position in range(len(candidates)):
+            replica = candidates[(start + position) % len(candidates)]
+            lag = replica_lag(replica)
+            if lag is not None and lag <= settings.DATABASE_REPLICA_MAX_LAG:
+                return _route("replica", replica)
+        return _route("replica_lagging", DEFAULT_DB)
+
+    def db_for_write(self, model, **hints):
+        if not settings.DATABASE_REPLICAS:
+            return DEFAULT_DB
+
+        # The user reads the default database for a while, until the replicas have the write
+        user_name = getattr(_state, "user_name", None)
+        if user_name:
+            cache.set(_last_write_key(user_name), True, settings.DATABASE_READ_YOUR_WRITES_WINDOW)
+        return DEFAULT_DB
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the default database
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema through the replication
+        return db == DEFAULT_DB
@@ -17,7 +17,8 @@ class ApplicationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Application
         fields = ["id", "name", "description", "owner", "main_blueprint_file", "created", "included", "updated",
-                  "is_new", "is_updated", "is_advertised"]
+                  "is_new", "is_updated", "is_advertised", "manager"]
+        read_only_fields = ["manager"]
 
 
 class AppInstanceSerializer(serializers.ModelSerializer):
@@ -26,7 +27,9 @@ class AppInstanceSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = AppInstance
-        fields = ["id", "name", "description", "owner", "created", "updated", "app", "last_execution", "is_new"]
+        fields = ["id", "name", "description", "owner", "created", "updated", "app", "last_execution", "is_new",
+                  "manager"]
+        read_only_fields = ["manager"]
 
 
 class DataCatalogueKeySerializer(serializers.ModelSerializer):
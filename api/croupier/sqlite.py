@@ -0,0 +1,59 @@
+""" SQLite mode for deployments with several workers
+
+Every new connection is configured with:
+- WAL journaling: readers do not block the writer, nor the writer the readers
+- a busy timeout: a writer waits for the lock held by another one instead of failing with "database is locked"
+- synchronous=NORMAL: with WAL the database stays consistent after a crash, without a sync on every commit
+
+SQLite allows a single writer at a time, so writes are grouped in short write transactions (no calls to other
+services inside), which take the write lock when they start.
+"""
+import logging
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+# Get an instance of a logger
+LOGGER = logging.getLogger(__name__)
+
+# Table touched by the statement that takes the write lock (any table of the app would do)
+LOCK_TABLE = "croupier_catalogsync"
+
+
+def configure_connection(sender, connection, **kwargs):
+    """ connection_created signal receiver, sets the pragmas of the new SQLite connections """
+    if connection.vendor != "sqlite":
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA busy_timeout = " + str(int(settings.SQLITE_BUSY_TIMEOUT * 1000)))
+        cursor.execute("PRAGMA journal_mode = " + settings.SQLITE_JOURNAL_MODE)
+        journal_mode = cursor.fetchone()[0]
+        cursor.execute("PRAGMA synchronous = " + settings.SQLITE_SYNCHRONOUS)
+
+    # In-memory databases (tests) only support their own journal mode
+    if journal_mode.lower() not in (settings.SQLITE_JOURNAL_MODE.lower(), "memory"):
+        LOGGER.warning("SQLite journal mode not changed to " + settings.SQLITE_JOURNAL_MODE + ": " + journal_mode)
+
+
+@contextmanager
+def write_transaction(using=DEFAULT_DB_ALIAS):
+    """ Atomic block for a batch of writes. In SQLite, the write lock is taken (waiting up to the busy timeout)
+    when the block starts: a transaction that reads first and writes later fails at once with "database is
+    locked" if another connection wrote in between """
+    with transaction.atomic(using=using):
+        connection = connections[using]
+        if connection.vendor == "sqlite":
+            with connection.cursor() as cursor:
+                cursor.execute("UPDATE " + LOCK_TABLE + " SET id = id WHERE 0")
+        yield
+
+
+def write_in_batches(operations, batch_size=None, using=DEFAULT_DB_ALIAS):
+    """ Run the write operations (callables) in consecutive short write transactions """
+    batch_size = batch_size or settings.SQLITE_WRITE_BATCH_SIZE
+    for start in range(0, len(operations), batch_size):
+        with write_transaction(using):
+            for operation in operations[start:start + batch_size]:
+                operation()
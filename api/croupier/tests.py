@@ -1,3 +1,99 @@
-from django.test import TestCase
+import threading
+import time
+from datetime import datetime, timezone
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import OperationalError, connection
+from django.test import TransactionTestCase
+
+from croupier import sqlite
+from croupier.models import Application, CatalogSync
+
+
+class SQLiteConcurrencyTest(TransactionTestCase):
+    """ Stress test of the SQLite mode: readers are never blocked by a synchronization writing, and concurrent
+    writers wait for each other instead of failing with "database is locked" """
+
+    # Seconds the writers keep the write lock in each transaction
+    WRITE_HOLD = 0.3
+    WRITE_TRANSACTIONS = 5
+    READERS = 4
+
+    def setUp(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("SQLite only")
+        CatalogSync.objects.create(resource="blueprints")
+        self.owner = User.objects.create_user(username="owner", password="owner")
+        self.stop = threading.Event()
+        self.errors = []
+        self.read_times = []
+        self.lock = threading.Lock()
+
+    def _application(self, name):
+        now = datetime.now(timezone.utc)
+        return Application(name=name, owner=self.owner, main_blueprint_file="blueprint.yaml", created=now,
+                           included=now, updated=now)
+
+    def _run(self, target, *args):
+        try:
+            target(*args)
+        except Exception as err:
+            with self.lock:
+                self.errors.append(err)
+        finally:
+            # Threads get their own database connection, which must be closed explicitly
+            connection.close()
+
+    def _sync_writer(self, prefix):
+        for transaction_number in range(self.WRITE_TRANSACTIONS):
+            with sqlite.write_transaction():
+                for row in range(20):
+                    self._application(prefix + "-" + str(transaction_number) + "-" + str(row)).save()
+                time.sleep(self.WRITE_HOLD)
+
+    def _reader(self):
+        while not self.stop.is_set():
+            start = time.monotonic()
+            list(Application.objects.all()[:50])
+            Application.objects.count()
+            with self.lock:
+                self.read_times.append(time.monotonic() - start)
+
+    def _start(self, target, *args):
+        thread = threading.Thread(target=self._run, args=(target,) + args)
+        thread.start()
+        return thread
+
+    def test_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            self.assertEqual(cursor.fetchone()[0].lower(), "wal")
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertGreater(cursor.fetchone()[0], 0)
+
+    def test_readers_not_blocked_by_writer(self):
+        readers = [self._start(self._reader) for _ in range(self.READERS)]
+        writer = self._start(self._sync_writer, "app")
+        writer.join()
+        self.stop.set()
+        for reader in readers:
+            reader.join()
+
+        self.assertEqual(self.errors, [])
+        self.assertEqual(Application.objects.count(), self.WRITE_TRANSACTIONS * 20)
+        self.assertTrue(self.read_times)
+        # Reads are served while the writer keeps the lock, they never wait for its transactions
+        self.assertLess(max(self.read_times), self.WRITE_HOLD)
+
+    def test_concurrent_writers_wait(self):
+        readers = [self._start(self._reader) for _ in range(self.READERS)]
+        writers = [self._start(self._sync_writer, "writer" + str(number)) for number in range(3)]
+        for writer in writers:
+            writer.join()
+        self.stop.set()
+        for reader in readers:
+            reader.join()
+
+        self.assertFalse([err for err in self.errors if isinstance(err, OperationalError)], self.errors)
+        self.assertEqual(self.errors, [])
+        self.assertEqual(Application.objects.count(), 3 * self.WRITE_TRANSACTIONS * 20)
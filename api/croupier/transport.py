@@ -0,0 +1,82 @@
+""" Shared HTTP transport for the external integrations (Vault, marketplace, CKAN...)
+
+Each remote host gets its own session, so connections (and TLS sessions) are kept alive and reused between
+calls. All the requests have connect and read timeouts, and idempotent requests are retried with backoff
+when the connection fails or the server is temporarily unavailable.
+"""
+import threading
+import time
+import logging
+from urllib.parse import urlparse
+
+from django.conf import settings
+from requests import Session
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
+from urllib3.util.retry import Retry
+
+from croupier import metrics
+
+# Get an instance of a logger
+LOGGER = logging.getLogger(__name__)
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _create_session():
+    # Default retry methods are the idempotent ones (GET, HEAD, PUT, DELETE, OPTIONS, TRACE)
+    retry = Retry(
+        total=settings.HTTP_RETRIES,
+        backoff_factor=settings.HTTP_RETRY_BACKOFF,
+        status_forcelist=(502, 503, 504),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.HTTP_POOL_SIZE, max_retries=retry)
+    session = Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session(url):
+    host = urlparse(url).netloc
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = _create_session()
+            _sessions[host] = session
+    return session
+
+
+def request(method, url, **kwargs):
+    host = urlparse(url).netloc
+    kwargs.setdefault("timeout", (settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_READ_TIMEOUT))
+
+    start = time.monotonic()
+    try:
+        response = get_session(url).request(method, url, **kwargs)
+    except RequestException:
+        metrics.increment("http_client_errors_total", {"host": host})
+        raise
+    finally:
+        metrics.observe("http_client_request_seconds", time.monotonic() - start, {"host": host})
+
+    metrics.increment("http_client_requests_total", {"host": host, "status": response.status_code})
+    return response
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def put(url, **kwargs):
+    return request("PUT", url, **kwargs)
+
+
+def delete(url, **kwargs):
+    return request("DELETE", url, **kwargs)
@@ -1,41 +1,68 @@
 """ Vault python wrapper """
-from base64 import b64encode
 from os import getenv
-from requests import post, Session, adapters, get, delete
-from requests import request
+from cryptography.fernet import Fernet
 import json
 
 import logging
 
+from croupier import transport
+from croupier.cache import Namespace
+from keycloak.auth import get_token_user_name
+
 # Get an instance of a logger
 LOGGER = logging.getLogger(__name__)
 
 # General variables
-oidc_client_id = getenv("OIDC_RP_CLIENT_ID", "backend")
-oidc_client_secret = getenv("OIDC_RP_CLIENT_SECRET", "")
-oidc_introspection_endpoint = getenv("OIDC_OP_TOKEN_ENDPOINT", "") + "/introspect"
 vault_endpoint = getenv("VAULT_ADDRESS", "") + ":" + getenv("VAULT_PORT", "8200") + "/croupier"
 if not vault_endpoint.startswith('http'):
     vault_endpoint = 'http://' + vault_endpoint
 vault_admin_token = getenv("VAULT_ADMIN_TOKEN", "")
 
+# Credentials metadata (hosts and labels, never secret material) is cached per user for a short time, in the memory
+# of this process only (never in the shared cache). Entries are encrypted with a key that only lives in the memory
+# of this process
+credentials_cache_ttl = int(getenv("VAULT_CREDENTIALS_CACHE_TTL", "60"))
+_credentials_cache = Namespace("vault-credentials", credentials_cache_ttl, shared=False, max_entries=1024)
+_credentials_cipher = Fernet(Fernet.generate_key())
+
+# Fields of a credential holding secret material, never kept by the backend
+SECRET_FIELDS = ("private_key", "password", "auth-header", "token", "secret")
+
 
 def get_user_info(access_token):
-    token_info = _token_info(access_token)
-    LOGGER.info("Security token info: " + str(token_info))
-    user_name = token_info["preferred_username"]
+    user_name = get_token_user_name(access_token)
+    LOGGER.info("Security token user: " + str(user_name))
     return user_name
 
 
-def get_user_tokens(access_token):
+def _strip_secrets(credentials):
+    if isinstance(credentials, dict):
+        return {field: _strip_secrets(value) for field, value in credentials.items() if field not in SECRET_FIELDS}
+    if isinstance(credentials, list):
+        return [_strip_secrets(value) for value in credentials]
+    return credentials
+
+
+def invalidate_user_tokens(user_name):
+    _credentials_cache.delete(user_name)
+
+
+def get_user_tokens(access_token, user_name):
+    # Serve the credentials metadata from the cache, if still valid
+    cached_credentials = _credentials_cache.get(user_name)
+    if cached_credentials is not None:
+        return json.loads(_credentials_cipher.decrypt(cached_credentials))
+
     # Connect with the Vault_Secret_Uploader to get all the secrets
     # Prepare headers (authentication)
     vault_headers = {'Authorization': 'Bearer ' + access_token}
 
-    # Send request and get secrets
-    response = get(vault_endpoint, headers=vault_headers)
-    credentials_list = response.json()
-    LOGGER.info("Vault secrets: " + str(credentials_list))
+    # Send request and get secrets (only their metadata is kept)
+    response = transport.get(vault_endpoint, headers=vault_headers)
+    credentials_list = _strip_secrets(response.json())
+    LOGGER.info("Vault secrets found: " + str(len(credentials_list)))
+    if response.ok:
+        _credentials_cache.set(user_name, _credentials_cipher.encrypt(json.dumps(credentials_list).encode("utf-8")))
     return credentials_list
 
 
@@ -46,13 +73,13 @@ def get_user_token_info(access_token, host_name):
 
     # Send request and get secrets
     vault_token_endpoint = vault_endpoint + "/" + host_name
-    response = get(vault_token_endpoint, headers=vault_headers)
+    response = transport.get(vault_token_endpoint, headers=vault_headers)
     credential_info = response.json()
     LOGGER.info("Vault secret info: " + str(credential_info))
     return credential_info
 
 
-def upload_user_secret(access_token, credentials_dic):
+def upload_user_secret(access_token, credentials_dic, user_name):
     # Connect with the Vault_Secret_Uploader to upload the new secret
     # Prepare headers (authentication)
     vault_headers = {'Authorization': 'Bearer ' + access_token, 'Content-Type': 'application/json'}
@@ -62,18 +89,19 @@ def upload_user_secret(access_token, credentials_dic):
                    'user': credentials_dic["user"],
                    'auth-header': credentials_dic["auth-header"],
                    'auth-header-label': credentials_dic["auth-header-label"]}
-    LOGGER.info("Call: " + str(json.dumps(payload_dic)))
+    LOGGER.info("Uploading secret for host: " + str(credentials_dic["host"]))
 
     # Send request and POST the credential info as dict
-    response = post(vault_endpoint, headers=vault_headers, data=json.dumps(payload_dic))
-    LOGGER.info("Result: " + str(response.content))
+    response = transport.post(vault_endpoint, headers=vault_headers, data=json.dumps(payload_dic))
+    invalidate_user_tokens(user_name)
+    LOGGER.info("Result: " + str(response.status_code))
     upload_success = True
     if not response.ok:
         upload_success = False
     return upload_success
 
 
-def remove_user_secret(access_token, host_name):
+def remove_user_secret(access_token, host_name, user_name):
     # Connect with the Vault_Secret_Uploader to upload the new secret
     # Prepare headers (authentication)
     vault_headers = {'Authorization': 'Bearer ' + access_token}
@@ -81,29 +109,8 @@ def remove_user_secret(access_token, host_name):
     # Send request and POST the credential info as dict
     vault_delete_endpoint = vault_endpoint + "/" + host_name
     LOGGER.info("Delete endpoint: " + vault_delete_endpoint)
-    response = delete(vault_delete_endpoint, headers=vault_headers)
+    response = transport.delete(vault_delete_endpoint, headers=vault_headers)
+    invalidate_user_tokens(user_name)
     delete_response = response.json()
     LOGGER.info("Vault response: " + str(delete_response))
     return delete_response
-
-
-def _token_info(access_token) -> dict:
-    req = {'token': access_token}
-    headers = {'Content-type': 'application/x-www-form-urlencoded'}
-    if not oidc_introspection_endpoint:
-        raise Exception("No oidc_introspection_endpoint set on the server\n")
-
-    basic_auth_string = '{0}:{1}'.format(oidc_client_id, oidc_client_secret)
-    basic_auth_bytes = bytearray(basic_auth_string, 'utf-8')
-    headers['Authorization'] = 'Basic {0}'.format(b64encode(basic_auth_bytes).decode('utf-8'))
-
-    token_response = post(oidc_introspection_endpoint, data=req, headers=headers)
-    if not token_response.ok:
-        raise Exception("There was a problem trying to authenticate with keycloak:\n"
-                        " HTTP code: " + str(token_response.status_code) + "\n"
-                        " Content:" + str(token_response.content) + "\n")
-
-    json_response = token_response.json()
-    if "active" in json_response and json_response["active"] is False:
-        return {}
-    return json_response
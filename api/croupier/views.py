@@ -1,34 +1,48 @@
+import hmac
 import json
+import re
 import tempfile
 # import pdb
-import yaml
 import logging
 
-from django.http import JsonResponse
+from django.conf import settings
+from django.db.models import Q
+from django.http import HttpResponse, JsonResponse
 from rest_framework import status, viewsets
 from rest_framework.views import APIView
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import BasePermission, IsAuthenticated
 from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
-from django.contrib.auth.models import User
 from django.utils.dateparse import parse_datetime
 from rest_framework.parsers import MultiPartParser
 
-from requests import get
-
 from datetime import *
 
 from croupier import cfy
+from croupier import ckan
+from croupier import analytics
+from croupier import catalog
+from croupier import changes
+from croupier import fulltext
+from croupier import idempotency
+from croupier import inputs as deployment_inputs
+from croupier import logs
 from croupier import vault
 from croupier import marketplace
+from croupier import metrics
+from croupier import placement
+from croupier import routers
+from croupier.conditional import ConditionalListMixin
 from croupier.models import (
     Application,
     AppInstance,
+    CatalogSync,
     InstanceExecution,
     DataCatalogueKey,
     ComputingInfrastructure,
     ComputingInstance,
+    Dataset,
 )
 from croupier.serializers import (
     ApplicationSerializer,
@@ -38,55 +52,17 @@ from croupier.serializers import (
     ComputingInfrastructureSerializer,
     ComputingInstanceSerializer,
 )
+from keycloak.auth import TokenIsActive
 
 # Get an instance of a logger
 LOGGER = logging.getLogger(__name__)
 
+# Events of an execution log returned by default, and at most, per request
+EVENTS_PAGE_SIZE = 100
+MAX_EVENTS_PAGE_SIZE = 1000
+
 
-def serialize_blueprint_list(blueprints):
-    data = []
-    for blueprint in blueprints:
-        entry = {
-            'name': blueprint["id"],
-            'description': blueprint["description"],
-            'created': blueprint["created_at"],
-            'updated': blueprint["updated_at"],
-            'owner': blueprint["created_by"],
-            'main_blueprint_file': blueprint["main_file_name"]}
-        data.append(entry)
-        # LOGGER.info("Blueprint received: " + str(entry))
-    return data
-
-
-def serialize_deployment_list(deployments):
-    data = []
-    for deployment in deployments:
-        entry = {
-            'name': deployment["id"],
-            'description': deployment["description"],
-            'created': deployment["created_at"],
-            'updated': deployment["updated_at"],
-            'owner': deployment["created_by"],
-            'blueprint': deployment["blueprint_id"]}
-        data.append(entry)
-    return data
-
-
-def synchronize_user_in_model(username):
-    # Check if user exist, if not create it
-    queryset = User.objects.all().filter(username=username)
-    if len(queryset) == 0:
-        user = User.objects.create_user(username=username,
-                                        email='not given',
-                                        password=username)
-        LOGGER.info("User Created: " + str(user))
-        return user
-    else:
-        LOGGER.info("User " + username + " found!")
-        return queryset[0]
-
-
-class ApplicationViewSet(viewsets.ModelViewSet):
+class ApplicationViewSet(ConditionalListMixin, viewsets.ModelViewSet):
     queryset = Application.objects.all()
     serializer_class = ApplicationSerializer
     permission_classes = [IsAuthenticated]  # TODO use roles
@@ -94,45 +70,35 @@ class ApplicationViewSet(viewsets.ModelViewSet):
 
     def list(self, request, *args, **kwargs):
         LOGGER.info("Requesting the list of Applications")
-        blueprints = cfy.list_blueprints()
 
-        # Synchronize blueprints returned from Cloudify with the internal model database of apps
-        # Rational: blueprints could be uploaded/removed in Cloudify using its console, not necessarily using
-        # the Hidalgo frontend
-        data = serialize_blueprint_list(blueprints[0])
-        self.synchronize_blueprint_list_in_model(data)
+        # Applications are served from the database, synchronized with the blueprints of Cloudify according to
+        # their freshness policy. If the orchestrator is not available, the applications already stored are served
+        data_age = catalog.ensure_fresh(catalog.BLUEPRINTS)
 
         # Filter results by name, if filter available
         name_filter = self.request.query_params.get('name')
         LOGGER.info("Name filter: " + str(name_filter))
         if name_filter is not None:
             apps = Application.objects.all().filter(name__icontains=name_filter)
-            LOGGER.info("Number of apps to send: " + str(len(apps)))
         else:
             apps = Application.objects.all()
-            LOGGER.info("Number of apps to send: " + str(len(apps)))
 
         # Filter results by ordered applications (from WooCommerce marketplace)
-        auth_header = self.request.META.get('HTTP_AUTHORIZATION')
-        user_token = auth_header.replace('Bearer ', '', 1)
-        user_name = vault.get_user_info(user_token)
+        user_name = request.user.username
         LOGGER.info("User requesting: " + user_name)
         apps_allowed_list = marketplace.check_orders_for_user(user_name)
         LOGGER.info("Apps ordered: " + str(apps_allowed_list))
         apps = apps.filter(name__in=apps_allowed_list) | apps.filter(owner=user_name)
-        LOGGER.info("Number of apps to send: " + str(len(apps)))
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            LOGGER.debug("Number of apps to send: " + str(apps.count()))
 
-        serializer = ApplicationSerializer(apps, many=True)
-        return Response(serializer.data)
+        return self.with_data_age(self.conditional_list(request, apps, user_name), data_age)
 
     def create(self, request, *args, **kwargs):
 
-        # Determine which user created the application
-        auth_header = self.request.META.get('HTTP_AUTHORIZATION')
-        user_token = auth_header.replace('Bearer ', '', 1)
-        user_name = vault.get_user_info(user_token)
+        # Determine which user created the application (already stored by the authentication)
+        user_name = request.user.username
         LOGGER.info("App owner: " + user_name)
-        synchronize_user_in_model(user_name)
 
         # Request is immutable by default
         _mutable = request.data._mutable
@@ -159,15 +125,21 @@ class ApplicationViewSet(viewsets.ModelViewSet):
         # Create the application in the DDBB and upload the blueprint to Cloudify
         blueprint_yaml_file_name = request.data["main_blueprint_file"]
         blueprint_id = Application.create_blueprint_id(request.data["name"])
-        _, err = cfy.upload_blueprint(temp_file_path, blueprint_id, blueprint_yaml_file_name)
+        manager = placement.choose_manager(user_name)
+        blueprint, err = cfy.upload_blueprint(temp_file_path, blueprint_id, blueprint_yaml_file_name, manager)
 
         tmp_package_file.close()
 
         if err:
             return Response(err, status=status.HTTP_409_CONFLICT)
 
+        # Extract the inputs schema once, so that the details of the app can be served from the database
+        inputs = cfy.extract_blueprint_inputs(blueprint)
+        if inputs is None:
+            inputs, _ = cfy.list_blueprint_inputs(blueprint_id, manager)
+
         # create blueprint on database
-        self.perform_create(serializer)
+        serializer.save(inputs=inputs, manager=manager)
         headers = self.get_success_headers(serializer.data)
         return Response(
             serializer.data, status=status.HTTP_201_CREATED, headers=headers
@@ -178,14 +150,21 @@ class ApplicationViewSet(viewsets.ModelViewSet):
         instance = self.get_object()
         serializer = self.get_serializer(instance)
 
-        # Retrieve the list of inputs of the blueprint
-        inputs = cfy.list_blueprint_inputs(instance.blueprint_id())
+        # Retrieve the list of inputs of the blueprint, stored when the blueprint was uploaded or synchronized
+        inputs = instance.inputs
+        err = None
+        if inputs is None:
+            # Applications stored before inputs were kept in the database are completed on first access
+            inputs, err = cfy.list_blueprint_inputs(instance.blueprint_id(), instance.manager)
+            if inputs is not None:
+                instance.inputs = inputs
+                instance.save(update_fields=['inputs'])
         LOGGER.info("Inputs used: " + str(inputs))
 
-        # Build the response with all the data
+        # Build the response with all the data (inputs keep the (data, error) format sent by the orchestrator)
         complete_result = {}
         complete_result = serializer.data
-        complete_result['inputs'] = json.dumps(inputs)
+        complete_result['inputs'] = json.dumps((inputs, err))
         LOGGER.info("Complete result: " + str(complete_result))
 
         return Response(complete_result)
@@ -202,7 +181,7 @@ class ApplicationViewSet(viewsets.ModelViewSet):
         if instance.owner != request.user:
             return Response(status=status.HTTP_403_FORBIDDEN)
 
-        _, err = cfy.remove_blueprint(instance.blueprint_id())
+        _, err = cfy.remove_blueprint(instance.blueprint_id(), instance.manager)
 
         # If there's a disparity between Django and Cloudify we should delete no matter what
         self.perform_destroy(instance)
@@ -211,76 +190,14 @@ class ApplicationViewSet(viewsets.ModelViewSet):
 
         return Response(status=status.HTTP_204_NO_CONTENT)
 
-    def synchronize_blueprint_list_in_model(self, blueprints):
-        LOGGER.info("Number of blueprints found: " + str(len(blueprints)))
-
-        # Take the full list of blueprints in the DDBB and check which ones should be removed
-        # This is crucial, since blueprints in the DDBB, not present in Cloudify would fail execution
-        all_internal_apps = Application.objects.all()
-        for internal_app in all_internal_apps:
-            app_found = any(internal_app.name == str(blueprint_properties['name']) for blueprint_properties
-                            in blueprints)
-            if not app_found:
-                LOGGER.info("Remove blueprint: " + str(internal_app))
-                internal_app.delete()
-
-        # Go through the complete list of the orchestrator, in order to add and/or modify blueprints
-        for blueprint in blueprints:
-            # Check if blueprint exists in apps data model
-            queryset = Application.objects.all().filter(name=blueprint['name'])
-
-            if len(queryset) == 0:
-                # If not, create an app from the blueprint and save it in the model
-                # create blueprint on database
-                # create user in user model if it does not exist
-                synchronize_user_in_model(blueprint["owner"])
-                blueprint.update({"included": str(datetime.now(timezone.utc))})
-                blueprint.update({"is_new": "True"})
-                blueprint.update({"is_updated": "False"})
-                blueprint.update({"is_advertised": "False"})
-                LOGGER.info("Add blueprint: " + str(blueprint))
-
-                serializer = self.get_serializer(data=blueprint)
-                if serializer.is_valid():
-                    self.perform_create(serializer)
-                    LOGGER.info("Application added!")
-                else:
-                    LOGGER.info(str(serializer.errors))
-            else:
-                # Check if the blueprint cannot be considered 'new' anymore (new < 10 days) or if it was updated
-                actual_object = queryset[0]
-                inclusion_date = actual_object.included
-                update_date = actual_object.updated
-                today_date = datetime.now(timezone.utc)
-                is_change = False
-
-                # Change status from new to not new?
-                if actual_object.is_new and (inclusion_date + timedelta(days=10)) < today_date:
-                    actual_object.is_new = False
-                    is_change = True
-                    LOGGER.info("Blueprint not new anymore.")
-
-                # Update fields if it was updated in the Cloudify instance
-                if update_date < datetime.strptime(blueprint["updated"], "%Y-%m-%dT%H:%M:%S.%f%z"):
-                    actual_object.is_updated = True
-                    actual_object.description = blueprint["description"]
-                    actual_object.main_blueprint_file = blueprint["main_blueprint_file"]
-                    actual_object.updated = blueprint["updated"]
-                    is_change = True
-                    LOGGER.info("Blueprint updated.")
-
-                # Update the blueprint information in the model (if there are changes)
-                if is_change:
-                    actual_object.save()
-                    LOGGER.info("Updated blueprint info: " + actual_object.name)
-
     @action(detail=False)
     def reset(self, request, *args, **kwargs):
         Application.objects.all().delete()
+        CatalogSync.objects.filter(resource=catalog.BLUEPRINTS).delete()
         return Response("Applications (Blueprints) reset in database", status=status.HTTP_200_OK)
 
 
-class AppInstanceViewSet(viewsets.ModelViewSet):
+class AppInstanceViewSet(ConditionalListMixin, viewsets.ModelViewSet):
     queryset = AppInstance.objects.all()
     serializer_class = AppInstanceSerializer
     permission_classes = [IsAuthenticated]
@@ -288,15 +205,10 @@ class AppInstanceViewSet(viewsets.ModelViewSet):
 
     def list(self, request, *args, **kwargs):
         LOGGER.info("Requesting the list of Instances")
-        deployments = cfy.list_deployments()
-        # LOGGER.info("Deployments Available: " + str(deployments))
-        # Synchronize deployments returned from Cloudify with the internal model database of application instances
-        # For each returned deployment, check if the deployment exits in the internal database by name
-        # If not, create the app and store it in the database
-        # Rational: deployments could be created in Cloudify using its console, not necessarily using
-        # the Hidalgo frontend
-        data = serialize_deployment_list(deployments[0])
-        self.synchronize_deployment_list_in_model(data)
+
+        # Instances are served from the database, synchronized with the deployments of Cloudify according to
+        # their freshness policy. If the orchestrator is not available, the instances already stored are served
+        data_age = catalog.ensure_fresh(catalog.DEPLOYMENTS)
 
         # Filter results by name, if filter available
         name_filter = self.request.query_params.get('name')
@@ -307,9 +219,7 @@ class AppInstanceViewSet(viewsets.ModelViewSet):
         LOGGER.info("Created filter: " + str(created_filter))
 
         # Filter results by owner
-        auth_header = self.request.META.get('HTTP_AUTHORIZATION')
-        user_token = auth_header.replace('Bearer ', '', 1)
-        user_name = vault.get_user_info(user_token)
+        user_name = request.user.username
         LOGGER.info("Author filter: " + user_name)
 
         # Obtain all the instances as first query
@@ -318,29 +228,27 @@ class AppInstanceViewSet(viewsets.ModelViewSet):
         # Filter by name if available
         if name_filter is not None:
             instances = instances.filter(name__icontains=name_filter)
-            LOGGER.info("Name filter. Number of instances to send: " + str(len(instances)))
 
         # Filter by app if available
         if app_filter is not None:
             instances = instances.filter(app__name__icontains=app_filter)
-            LOGGER.info("App filter. Number of instances to send: " + str(len(instances)))
 
         if created_filter is not None:
             instances = instances.filter(created__gte=datetime.strptime(created_filter, "%Y-%m-%dT%H:%M:%S.%f%z"))
-            LOGGER.info("Date filter. Number of instances to send: " + str(len(instances)))
 
         # Filter by owner
         instances = instances.filter(owner=user_name)
-        LOGGER.info("Owner filter. Number of instances to send: " + str(len(instances)))
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            LOGGER.debug("Owner filter. Number of instances to send: " + str(instances.count()))
 
-        serializer = AppInstanceSerializer(instances, many=True)
-        return Response(serializer.data)
+        return self.with_data_age(self.conditional_list(request, instances, user_name), data_age)
 
     # def get_queryset(self):
     #    user = self.request.user
     #    LOGGER.info("User requesting actions: " + str(user))
     #    return AppInstance.objects.filter(owner=user)
 
+    @idempotency.idempotent
     def create(self, request, *args, **kwargs):
         # Check Application Instance with given name does not exist. Otherwise reject creation
         try:
@@ -351,46 +259,51 @@ class AppInstanceViewSet(viewsets.ModelViewSet):
         except Exception as ex:
             pass  # Instance does not exist, proceeding with creation
 
-        # Modify author's information and create the user if it doesn't exist
+        # Modify author's information (the user is stored by the authentication)
         request.data._mutable = True
-        auth_header = self.request.META.get('HTTP_AUTHORIZATION')
-        user_token = auth_header.replace('Bearer ', '', 1)
-        user_name = vault.get_user_info(user_token)
+        user_name = request.user.username
         request.data["owner"] = user_name
-        synchronize_user_in_model(user_name)
 
         # Retrieve basic information (for consistency checking)
         blueprint_id = request.data["app"]
         deployment_id = request.data["name"]
 
-        # Obtain the content from the uploaded file and leave it in temporary file
-        tmp_package_file = tempfile.NamedTemporaryFile(suffix=".yaml", delete=False)
-        temp_file_path = tmp_package_file.name
-        LOGGER.info("Temp YAML file: " + str(temp_file_path))
-        deployment_file = request.data["inputs_file"]
-        LOGGER.info("Iputs file: " + str(deployment_file))
-        # LOGGER.info("Iputs file content: " + str(deployment_file.read()))
-        with open(temp_file_path, 'wb+') as destination:
-            for chunk in deployment_file.chunks():
-                destination.write(chunk)
-
-        # Load the temporary file in order to obtain the YAML inputs in dict structure
-        inputs = None
-        # example_file = "C:\\HiDALGO\\Demo\\ECMWF\\ecmwf-publish-blueprint-inputs-basic.yaml"
-        with open(temp_file_path, 'r') as my_yaml_file:
-            inputs = yaml.safe_load(my_yaml_file)
-            LOGGER.info("Iputs from YAML: " + str(inputs))
+        # The deployment is created in the manager of the app
+        app = Application.objects.filter(name=blueprint_id).first()
+        if app is None:
+            return Response("Application " + str(blueprint_id) + " not found", status=status.HTTP_404_NOT_FOUND)
+
+        # Parse the uploaded inputs (YAML) in memory and check them against the inputs schema of the blueprint,
+        # so bad submissions are rejected before calling the orchestrator
+        inputs, errors = deployment_inputs.parse_inputs_file(request.data.get("inputs_file"))
+        if not errors:
+            schema = app.inputs
+            if schema is None:
+                schema, _ = cfy.list_blueprint_inputs(blueprint_id, app.manager)
+            if schema is not None:
+                errors = deployment_inputs.validate_inputs(inputs, schema)
+        if errors:
+            LOGGER.info("Inputs rejected: " + str(errors))
+            metrics.increment("deployment_inputs_rejected_total")
+            return Response({"errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+        LOGGER.info("Inputs accepted: " + str(sorted(inputs)))
 
         # Execute the call to create a new deployment with the information provided
-        _, err = cfy.create_deployment(
-            blueprint_id, deployment_id, inputs
+        manager = app.manager
+        deployment, err = cfy.create_deployment(
+            blueprint_id, deployment_id, inputs, manager=manager
         )
 
         if err:
             return Response(err, status=status.HTTP_409_CONFLICT)
 
+        # Keep the inputs of the deployment (with secrets redacted) to serve them without calling the orchestrator
+        stored_inputs = cfy.extract_deployment_inputs(deployment)
+        if stored_inputs is None:
+            stored_inputs = cfy.extract_deployment_inputs({"inputs": inputs or {}})
+
         # Execute install workflow
-        execution, err = cfy.execute_workflow(deployment_id, cfy.INSTALL)
+        execution, err = cfy.execute_workflow(deployment_id, cfy.INSTALL, manager=manager)
 
         if err:
             return Response(err, status=status.HTTP_409_CONFLICT)
@@ -401,13 +314,12 @@ class AppInstanceViewSet(viewsets.ModelViewSet):
             request.data["created"] = execution["created_at"]
             request.data["updated"] = execution["created_at"]
             request.data["is_new"] = True
-            app = Application.getByName(request.data["app"])
             serializer = self.get_serializer(data=request.data)
             serializer.is_valid(raise_exception=True)
-            serializer.save(app=app)
+            serializer.save(app=app, inputs=stored_inputs, manager=app.manager)
         except Exception as ex:
-            cfy.execute_workflow(deployment_id, cfy.UNINSTALL)
-            cfy.destroy_deployment(deployment_id)
+            cfy.execute_workflow(deployment_id, cfy.UNINSTALL, manager=manager)
+            cfy.destroy_deployment(deployment_id, manager=manager)
             return Response(ex, status=status.HTTP_409_CONFLICT)
         headers = self.get_success_headers(serializer.data)
         return Response(
@@ -418,12 +330,7 @@ class AppInstanceViewSet(viewsets.ModelViewSet):
         LOGGER.info("Requesting details of an instance...")
         instance = self.get_object()
 
-        # Retrieve user's token to check in Keycloak
-        auth_header = self.request.META.get('HTTP_AUTHORIZATION')
-        user_token = auth_header.replace('Bearer ', '', 1)
-        LOGGER.info("Security token: " + str(user_token))
-        token_info = vault.get_user_info(user_token)
-        LOGGER.info("User name: " + token_info)
+        LOGGER.info("User name: " + request.user.username)
 
         # Use security token to retrieve user name and check authorization for the object
         # if instance.owner != request.user:
@@ -432,14 +339,20 @@ class AppInstanceViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(instance)
         LOGGER.info("Instance info: " + str(serializer.data))
 
-        # Retrieve the list of inputs used in the deployment
-        inputs = cfy.list_deployment_inputs(instance.deployment_id())
-
-        # Build the response with all the data
+        # Retrieve the list of inputs used in the deployment, stored when the instance was created or synchronized
+        inputs = instance.inputs
+        err = None
+        if inputs is None:
+            # Instances stored before inputs were kept in the database are completed on first access
+            inputs, err = cfy.list_deployment_inputs(instance.deployment_id(), instance.manager)
+            if inputs is not None:
+                instance.inputs = inputs
+                instance.save(update_fields=['inputs'])
+
+        # Build the response with all the data (inputs keep the (data, error) format sent by the orchestrator)
         complete_result = {}
         complete_result = serializer.data
-        # complete_result['inputs'] = inputs
-        complete_result['inputs'] = json.dumps(inputs, ensure_ascii=False)
+        complete_result['inputs'] = json.dumps((inputs, err), ensure_ascii=False)
         LOGGER.info("Complete result: " + str(complete_result))
 
         return Response(complete_result)
@@ -451,20 +364,22 @@ class AppInstanceViewSet(viewsets.ModelViewSet):
         return Response(status=status.HTTP_403_FORBIDDEN)
 
     @action(methods=["post"], detail=True)
+    @idempotency.idempotent
     def execute(self, request, pk=None):
         # instance = self.get_object()
         instance = AppInstance.objects.get(pk=pk)
         LOGGER.info("Current instance for execution: " + str(self.get_serializer(instance).data))
 
         # Collect user info and check it's the adequate one
-        auth_header = self.request.META.get('HTTP_AUTHORIZATION')
-        user_token = auth_header.replace('Bearer ', '', 1)
-        user_name = vault.get_user_info(user_token)
+        user_name = request.user.username
         LOGGER.info("User executing: " + user_name)
         # if instance.owner != request.user:
         #    return Response(status=status.HTTP_403_FORBIDDEN)
 
-        current_status, wf_type = cfy.get_execution_status(instance.last_execution)
+        try:
+            current_status, wf_type = cfy.get_execution_status(instance.last_execution, instance.manager)
+        except cfy.ORCHESTRATOR_ERRORS as err:
+            return Response(str(err), status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
         if wf_type == cfy.INSTALL and cfy.is_execution_wrong(current_status):
             return Response(status=status.HTTP_424_FAILED_DEPENDENCY)
@@ -473,7 +388,7 @@ class AppInstanceViewSet(viewsets.ModelViewSet):
             return Response(status=status.HTTP_423_LOCKED)
 
         # execute run_jobs
-        execution, err = cfy.execute_workflow(instance.deployment_id(), cfy.RUN)
+        execution, err = cfy.execute_workflow(instance.deployment_id(), cfy.RUN, manager=instance.manager)
         if err:
             return Response(err, status=status.HTTP_409_CONFLICT)
 
@@ -487,7 +402,7 @@ class AppInstanceViewSet(viewsets.ModelViewSet):
         # create new execution element
         new_execution_id = execution["id"]
         new_execution_date = datetime.now(timezone.utc)
-        new_execution_owner = User.objects.get(username=user_name)
+        new_execution_owner = request.user
         new_execution = InstanceExecution(id=new_execution_id, instance=instance, created=new_execution_date,
                                           owner=new_execution_owner)
         new_execution.save()
@@ -502,10 +417,37 @@ class AppInstanceViewSet(viewsets.ModelViewSet):
         # if instance.owner != request.user:
         #    return Response(status=status.HTTP_403_FORBIDDEN)
 
-        # offset = request.data["offset"]
-        offset = 0
-
-        data = cfy.get_execution_events(instance.last_execution, offset)
+        # Range of the log to read (of the last execution, unless another one is requested)
+        execution_id = self.request.query_params.get('execution', instance.last_execution)
+        try:
+            offset = max(0, int(self.request.query_params.get('offset', 0)))
+            size = max(1, min(int(self.request.query_params.get('size', EVENTS_PAGE_SIZE)), MAX_EVENTS_PAGE_SIZE))
+        except ValueError:
+            return Response("offset and size must be integers", status=status.HTTP_400_BAD_REQUEST)
+
+        # Logs of finished executions are archived locally the first time, then served without the orchestrator
+        # (those pruned from the archive are read from the orchestrator, without archiving them again)
+        execution = InstanceExecution.objects.filter(id=execution_id, instance=instance).first()
+        if execution is None and execution_id != instance.last_execution:
+            # Only executions of the instance can be read (the last one may not be registered locally)
+            return Response("Execution " + str(execution_id) + " not found", status=status.HTTP_404_NOT_FOUND)
+        try:
+            if execution is not None and execution.is_final:
+                execution = logs.archive_execution_log(execution)
+            if execution is not None and execution.log_events is not None:
+                return Response({
+                    "logs": logs.read_archived_events(execution, offset, size),
+                    "last": execution.log_events,
+                    "status": execution.status,
+                })
+
+            data = cfy.get_execution_events(execution_id, offset, size, instance.manager)
+        except cfy.ORCHESTRATOR_ERRORS as err:
+            return Response(str(err), status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        # Events of running executions are indexed as they are read
+        if execution is not None and not execution.is_final:
+            logs.index_events(execution, data["logs"], offset)
         return Response(data)
 
     def destroy(self, request, *args, **kwargs):
@@ -516,85 +458,22 @@ class AppInstanceViewSet(viewsets.ModelViewSet):
 
         # execute uninstall
         _, err = cfy.execute_workflow(
-            instance.deployment_id(), cfy.UNINSTALL, force=True
+            instance.deployment_id(), cfy.UNINSTALL, force=True, manager=instance.manager
         )
         if err:
             return Response(err, status=status.HTTP_409_CONFLICT)
 
-        _, err = cfy.destroy_deployment(instance.deployment_id())
+        _, err = cfy.destroy_deployment(instance.deployment_id(), manager=instance.manager)
         if err:
             return Response(err, status=status.HTTP_409_CONFLICT)
 
         self.perform_destroy(instance)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
-    def synchronize_deployment_list_in_model(self, deployments):
-        LOGGER.info("Number of deployments found: " + str(len(deployments)))
-
-        # Take the full list of deployments in the DDBB and check which ones should be removed
-        # This is crucial, since deployments in the DDBB, not present in Cloudify would fail execution
-        all_internal_instances = AppInstance.objects.all()
-        LOGGER.info("Number of deployments stored: " + str(len(all_internal_instances)))
-        for internal_app_instance in all_internal_instances:
-            app_instance_found = any(internal_app_instance.name == str(deployment_properties['name']) for
-                                     deployment_properties in deployments)
-            if not app_instance_found:
-                LOGGER.info("Remove deployment: " + str(internal_app_instance))
-                internal_app_instance.delete()
-
-        # Go through the complete list of the orchestrator, in order to add and/or modify deployments
-        for deployment in deployments:
-            # Check if blueprint exists in apps data model
-            queryset = AppInstance.objects.all().filter(name=deployment['name'])
-
-            if len(queryset) == 0:
-                # If not, create an appInstance from the deployment and save it in the model
-                # create deployment on database
-                # create user in user model if it does not exist
-                synchronize_user_in_model(deployment["owner"])
-
-                # Link with the corresponding blueprint
-                # get associated app
-                app = Application.getByName(deployment["blueprint"])
-                deployment.update({"is_new": "True"})
-                LOGGER.info("Add deployment: " + str(deployment))
-
-                serializer = self.get_serializer(data=deployment)
-                if serializer.is_valid():
-                    serializer.save(app=app)
-                    LOGGER.info("Application Instance added!")
-                else:
-                    LOGGER.info(str(serializer.errors))
-            else:
-                # Check if the deployment cannot be considered 'new' anymore (new < 10 days) or if it was updated
-                actual_object = queryset[0]
-                inclusion_date = actual_object.created
-                update_date = actual_object.updated
-                today_date = datetime.now(timezone.utc)
-                is_change = False
-
-                # Change status from new to not new?
-                if actual_object.is_new and (inclusion_date + timedelta(days=10)) < today_date:
-                    actual_object.is_new = False
-                    is_change = True
-                    LOGGER.info("Deployment not new anymore.")
-
-                # Update fields if it was updated in the Cloudify instance
-                if update_date < datetime.strptime(deployment["updated"], "%Y-%m-%dT%H:%M:%S.%f%z"):
-                    actual_object.is_updated = True
-                    actual_object.description = deployment["description"]
-                    actual_object.updated = deployment["updated"]
-                    is_change = True
-                    LOGGER.info("Deployment updated.")
-
-                # Update the deployment information in the model (if there are changes)
-                if is_change:
-                    actual_object.save()
-                    LOGGER.info("Updated deployment info: " + actual_object.name)
-
     @action(detail=False)
     def reset(self, request, *args, **kwargs):
         AppInstance.objects.all().delete()
+        CatalogSync.objects.filter(resource=catalog.DEPLOYMENTS).delete()
         return Response("App instances (Deployments) reset in database", status=status.HTTP_200_OK)
 
 
@@ -698,7 +577,7 @@ class ComputingInstanceViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
 
-class InstanceExecutionViewSet(viewsets.ModelViewSet):
+class InstanceExecutionViewSet(ConditionalListMixin, viewsets.ModelViewSet):
     queryset = InstanceExecution.objects.all()
     serializer_class = InstanceExecutionSerializer
     permission_classes = [IsAuthenticated]  # TODO use roles
@@ -706,14 +585,15 @@ class InstanceExecutionViewSet(viewsets.ModelViewSet):
     def list(self, request, *args, **kwargs):
         LOGGER.info("Requesting the list of Executions...")
 
-        auth_header = self.request.META.get('HTTP_AUTHORIZATION')
-        user_token = auth_header.replace('Bearer ', '', 1)
-        user_name = vault.get_user_info(user_token)
+        user_name = request.user.username
         LOGGER.info("User listing (and filter): " + user_name)
 
-        # TODO We should get all the executions of existing deployments going through their events (sync)
-        # Update the information for all the executions that are not already registered aas 'terminated'
-        self.update_executions(user_name)
+        # Executions are kept current by the catalog mirror, if enabled. Otherwise (or if the mirror fell behind)
+        # update the information for all the executions of the user that have not ended yet
+        data_age = catalog.data_age(catalog.EXECUTIONS) if settings.CATALOG_MIRROR else None
+        if data_age is None or data_age > settings.CATALOG_MIRROR_MAX_STALENESS:
+            self.update_executions(user_name)
+            data_age = None
 
         # Filter results by name, status and date if filter available
         name_filter = self.request.query_params.get('name')
@@ -726,22 +606,19 @@ class InstanceExecutionViewSet(viewsets.ModelViewSet):
         execs = InstanceExecution.objects.all()
         if name_filter is not None:
             execs = execs.filter(instance__name__icontains=name_filter)
-            LOGGER.info("Instance name filter. Number of executions to send: " + str(len(execs)))
 
         if status_filter is not None:
             execs = execs.filter(status__icontains=status_filter)
-            LOGGER.info("Status filter. Number of executions to send: " + str(len(execs)))
 
         if created_filter is not None:
             execs = execs.filter(created__gte=datetime.strptime(created_filter, "%Y-%m-%dT%H:%M:%S.%f%z"))
-            LOGGER.info("Date filter. Number of executions to send: " + str(len(execs)))
 
         # Filter by owner
         execs = execs.filter(owner=user_name)
-        LOGGER.info("Owner filter. Number of executions to send: " + str(len(execs)))
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            LOGGER.debug("Owner filter. Number of executions to send: " + str(execs.count()))
 
-        serializer = InstanceExecutionSerializer(execs, many=True)
-        return Response(serializer.data)
+        return self.with_data_age(self.conditional_list(request, execs, user_name), data_age)
 
     def create(self, request, *args, **kwargs):
         return Response(status=status.HTTP_403_FORBIDDEN)
@@ -750,32 +627,17 @@ class InstanceExecutionViewSet(viewsets.ModelViewSet):
         LOGGER.info("Requesting details of an execution...")
         execution = self.get_object()
 
-        # Retrieve the list of inputs of the blueprint
-        inputs = cfy.list_deployment_inputs(execution.instance.deployment_id())
-        LOGGER.info("Inputs used: " + str(inputs))
-
-        # Retrieve current information about the execution
-        exec_full_info = cfy.get_execution(execution.id)
-
-        # Update execution object
-        execution.status = exec_full_info['status']
-        execution.execution_time = exec_full_info['execution_time']
-        execution.current_task = exec_full_info['current_task']
-        execution.progress = exec_full_info['progress']
-        execution.num_errors = exec_full_info['num_errors']
-        if exec_full_info['status'] == 'terminated' or exec_full_info['status'] == 'failed':
-            execution.finished = exec_full_info['end_time']
-        if exec_full_info['num_errors'] > 0:
-            execution.has_errors = True
-        execution.save()
+        # Retrieve current information about the execution (only while it is running)
+        catalog.refresh_execution(execution)
 
         # Build the response with all the data
         complete_result = {}
         serializer = self.get_serializer(execution)
         complete_result = serializer.data
-        # complete_result['inputs'] = json.dumps(inputs)
-        complete_result['current_operation'] = exec_full_info['current_operation']
-        complete_result['error_message'] = exec_full_info['error_message']
+        complete_result['inputs'] = json.dumps((execution.instance.inputs, None), ensure_ascii=False)
+        complete_result['current_operation'] = execution.current_operation
+        complete_result['error_message'] = execution.error_message
+        complete_result['job_progress'] = execution.job_progress
         LOGGER.info("Complete result: " + str(complete_result))
 
         return Response(complete_result)
@@ -792,68 +654,51 @@ class InstanceExecutionViewSet(viewsets.ModelViewSet):
     def update_executions(self, owner_user):
         LOGGER.info("Updating the status of the executions...")
 
-        # Take the full list of executions in the DDBB and update them one by one
-        # Executions cannot be deleted at Cloudify, so we go through all of them
-        all_executions = InstanceExecution.objects.filter(owner=owner_user)
-        for execution in all_executions:
-            if execution.status != 'terminated':
-                exec_full_info = cfy.get_execution(execution.id)
-                LOGGER.info("Execution Info: " + str(exec_full_info))
-
-                # Update progress, task, status, time...
-                execution.status = exec_full_info['status']
-                execution.execution_time = exec_full_info['execution_time']
-                execution.current_task = exec_full_info['current_task']
-                execution.progress = exec_full_info['progress']
-                execution.num_errors = exec_full_info['num_errors']
-                if exec_full_info['status'] == 'terminated' or exec_full_info['status'] == 'failed':
-                    execution.finished = exec_full_info['end_time']
-                if exec_full_info['num_errors'] > 0:
-                    execution.has_errors = True
-                execution.save()
+        # Only the executions still running are updated, finished ones are kept as they were frozen
+        active_executions = (
+            InstanceExecution.objects.filter(owner=owner_user, is_final=False).select_related("instance")
+        )
+        for execution in active_executions:
+            catalog.refresh_execution(execution)
 
 
 class UserCredentialsViewSet(APIView):
-    permission_classes = [IsAuthenticated]  # TODO use roles
+    # Credentials are sensitive: revoked tokens are rejected, even if not expired yet
+    permission_classes = [IsAuthenticated, TokenIsActive]  # TODO use roles
 
     def get(self, request):
-        # Retrieve user's token to check in Keycloak
-        auth_header = self.request.META.get('HTTP_AUTHORIZATION')
-        user_token = auth_header.replace('Bearer ', '', 1)
-        LOGGER.info("Security token: " + str(user_token))
-        token_info = vault.get_user_info(user_token)
+        # User and token resolved by the authentication
+        user_token = request.auth
+        token_info = request.user.username
         LOGGER.info("User name: " + token_info)
 
         # List all the credentials stored for the user with the token
-        vault_credentials = vault.get_user_tokens(user_token)
+        vault_credentials = vault.get_user_tokens(user_token, token_info)
 
         return Response(vault_credentials)
 
     def post(self, request, format=None):
-        # Retrieve user's token to check in Keycloak
-        auth_header = self.request.META.get('HTTP_AUTHORIZATION')
-        user_token = auth_header.replace('Bearer ', '', 1)
-        LOGGER.info("Security token credential: " + str(user_token))
-        token_info = vault.get_user_info(user_token)
+        # User and token resolved by the authentication
+        user_token = request.auth
+        token_info = request.user.username
         LOGGER.info("User name: " + token_info)
         credential_data = request.data
         LOGGER.info("New credential data host: " + credential_data["host"])
 
         # List all the credentials stored for the user with the token
-        vault_upload = vault.upload_user_secret(user_token, credential_data)
+        vault_upload = vault.upload_user_secret(user_token, credential_data, token_info)
 
         return Response(vault_upload)
 
 
 class CredentialViewSet(APIView):
-    permission_classes = [IsAuthenticated]  # TODO use roles
+    # Credentials are sensitive: revoked tokens are rejected, even if not expired yet
+    permission_classes = [IsAuthenticated, TokenIsActive]  # TODO use roles
 
     def get(self, request, pk, format=None):
-        # Retrieve user's token to check in Keycloak
-        auth_header = self.request.META.get('HTTP_AUTHORIZATION')
-        user_token = auth_header.replace('Bearer ', '', 1)
-        LOGGER.info("Security token credential: " + str(user_token))
-        token_info = vault.get_user_info(user_token)
+        # User and token resolved by the authentication
+        user_token = request.auth
+        token_info = request.user.username
         LOGGER.info("User name: " + token_info)
         LOGGER.info("Credential Id: " + pk)
 
@@ -863,16 +708,14 @@ class CredentialViewSet(APIView):
         return Response(token_info)
 
     def delete(self, request, pk, format=None):
-        # Retrieve user's token to check in Keycloak
-        auth_header = self.request.META.get('HTTP_AUTHORIZATION')
-        user_token = auth_header.replace('Bearer ', '', 1)
-        LOGGER.info("Security token credential: " + str(user_token))
-        token_info = vault.get_user_info(user_token)
+        # User and token resolved by the authentication
+        user_token = request.auth
+        token_info = request.user.username
         LOGGER.info("User name: " + token_info)
         LOGGER.info("Credential Id: " + pk)
 
         # List all the credentials stored for the user with the token
-        # vault_delete = vault.remove_user_secret(user_token, pk)
+        # vault_delete = vault.remove_user_secret(user_token, pk, token_info)
 
         return Response(token_info)
 
@@ -881,23 +724,197 @@ class CKANViewSet(APIView):
     permission_classes = [IsAuthenticated]  # TODO use roles
 
     def get(self, request, format=None):
-        # Prepare the CKAN endpoint
-        CKAN_endpoint = "https://ckan.hidalgo-project.eu/api/3/action/package_search"
+        # Search the datasets in CKAN (paged with rows/start), the total number of results is sent in a header
         ckan_filter = self.request.query_params.get('keywords')
-        ckan_payload = {'q': ckan_filter}
-        response = get(CKAN_endpoint, params=ckan_payload)
-        ckan_response = response.json()
+        try:
+            rows = int(self.request.query_params.get('rows', ckan.DEFAULT_ROWS))
+            start = int(self.request.query_params.get('start', 0))
+        except ValueError:
+            return Response("rows and start must be integers", status=status.HTTP_400_BAD_REQUEST)
 
-        results_list = ckan_response["result"]["results"]
-        LOGGER.info("CKAN Results: " + str(results_list))
+        # The local index (harvested with the harvest_ckan command) answers without depending on CKAN
+        if self.request.query_params.get('mode') == 'local':
+            return self.search_local(ckan_filter, rows, start)
 
-        ckan_result_list = [
+        ckan_result, err = ckan.search_datasets(ckan_filter, rows, start)
+        if err:
+            return Response(err, status=status.HTTP_502_BAD_GATEWAY)
+        LOGGER.info("CKAN Results: " + str(ckan_result["results"]))
+
+        response = Response(ckan_result["results"])
+        response["X-Total-Count"] = str(ckan_result["count"])
+        return response
+
+    def search_local(self, keywords, rows, start):
+        rows = max(1, min(rows, ckan.MAX_ROWS))
+        start = max(0, start)
+
+        datasets = Dataset.objects.all()
+        organization_filter = self.request.query_params.get('organization')
+        if organization_filter is not None:
+            datasets = datasets.filter(organization=organization_filter)
+        for tag in self.request.query_params.getlist('tags'):
+            datasets = datasets.filter(tags__iregex=r'(^|\s)' + re.escape(tag) + r'(\s|$)')
+
+        # Results ranked by relevance, each keyword matching as a prefix
+        datasets = fulltext.search(datasets, Dataset.SEARCH_FIELDS, keywords)
+        total = datasets.count()
+        result_list = [
             {
-                "name": dataset["name"],
-                "dataset_id": dataset["id"],
+                "name": name,
+                "dataset_id": dataset_id,
             }
-            for dataset in results_list
+            for name, dataset_id in datasets.values_list("name", "dataset_id")[start:start + rows]
         ]
-        LOGGER.info("CKAN Results: " + str(ckan_result_list))
 
-        return Response(ckan_result_list)
+        response = Response(result_list)
+        response["X-Total-Count"] = str(total)
+        return response
+
+
+class ChangesViewSet(APIView):
+    permission_classes = [IsAuthenticated]  # TODO use roles
+
+    # Serializer of the objects of each model of the feed
+    serializers = {
+        "application": ApplicationSerializer,
+        "instance": AppInstanceSerializer,
+        "execution": InstanceExecutionSerializer,
+    }
+
+    @routers.replica_reads
+    def get(self, request, format=None):
+        # Changes after the cursor (the "next" value of the previous response, 0 to start)
+        try:
+            since = int(self.request.query_params.get('since', 0))
+        except ValueError:
+            return Response("since must be an integer", status=status.HTTP_400_BAD_REQUEST)
+
+        user_name = request.user.username
+        change_list, next_cursor, more = changes.list_changes(user_name, since)
+        objects = changes.load_objects(change_list)
+        LOGGER.info("Changes since " + str(since) + " for " + user_name + ": " + str(len(change_list)))
+
+        # Applications (deleted included) are visible to their owner and to the users who ordered them
+        apps_allowed_list = None
+        if any(change.model == "application" and change.owner != user_name for change in change_list):
+            apps_allowed_list = marketplace.check_orders_for_user(user_name)
+
+        result_list = []
+        for change in change_list:
+            obj = objects[change.model].get(change.object_id)
+            if change.model == "application":
+                owner, name = (obj.owner_id, obj.name) if obj is not None else (change.owner, change.name)
+                if owner != user_name and name not in apps_allowed_list:
+                    continue
+            if change.deleted or obj is None:
+                result_list.append({"seq": change.id, "type": change.model, "id": change.object_id,
+                                    "deleted": True})
+                continue
+            result_list.append({"seq": change.id, "type": change.model, "id": change.object_id, "deleted": False,
+                                "data": self.serializers[change.model](obj).data})
+
+        return Response({"changes": result_list, "next": next_cursor, "more": more})
+
+
+class ExecutionLogSearchViewSet(APIView):
+    permission_classes = [IsAuthenticated]  # TODO use roles
+
+    # Query parameters restricting the search, and the lookup they filter
+    FILTERS = {
+        "app": "instance__app__name",
+        "instance": "instance__name",
+        "execution": "execution_id",
+        "node": "node",
+        "level": "level",
+    }
+
+    @routers.replica_reads
+    def get(self, request, format=None):
+        # Search the events of the logs of the user's executions (paged with rows/start), the most relevant first
+        query = self.request.query_params.get('q')
+        if not fulltext.query_terms(query):
+            return Response("q must contain words to search", status=status.HTTP_400_BAD_REQUEST)
+        try:
+            rows = max(1, min(int(self.request.query_params.get('rows', EVENTS_PAGE_SIZE)), MAX_EVENTS_PAGE_SIZE))
+            start = max(0, int(self.request.query_params.get('start', 0)))
+        except ValueError:
+            return Response("rows and start must be integers", status=status.HTTP_400_BAD_REQUEST)
+
+        filters = {
+            lookup: self.request.query_params.get(param)
+            for param, lookup in self.FILTERS.items()
+            if self.request.query_params.get(param) is not None
+        }
+        for param, lookup in (("since", "timestamp__gte"), ("until", "timestamp__lt")):
+            if self.request.query_params.get(param) is not None:
+                try:
+                    filters[lookup] = parse_datetime(self.request.query_params.get(param))
+                except ValueError:
+                    filters[lookup] = None
+                if filters[lookup] is None:
+                    return Response(param + " must be a date and time", status=status.HTTP_400_BAD_REQUEST)
+
+        entries = logs.search_log_entries(request.user.username, query, filters)
+        total = entries.count()
+        result_list = list(
+            entries.values("execution_id", "instance_id", "offset", "timestamp", "node", "level", "event_type",
+                           "message")[start:start + rows]
+        )
+        LOGGER.info("Log search for " + request.user.username + ": " + str(total) + " events")
+
+        response = Response(result_list)
+        response["X-Total-Count"] = str(total)
+        return response
+
+
+class AnalyticsViewSet(APIView):
+    permission_classes = [IsAuthenticated]  # TODO use roles
+
+    # Days of statistics returned by default, and at most
+    DEFAULT_DAYS = 30
+    MAX_DAYS = 366
+
+    @routers.replica_reads
+    def get(self, request, format=None):
+        # Aggregates of the finished executions, by application (default) or by user, over the last days
+        group = self.request.query_params.get('group', 'app')
+        if group not in ('app', 'user'):
+            return Response("group must be app or user", status=status.HTTP_400_BAD_REQUEST)
+        try:
+            days = max(1, min(int(self.request.query_params.get('days', self.DEFAULT_DAYS)), self.MAX_DAYS))
+        except ValueError:
+            return Response("days must be an integer", status=status.HTTP_400_BAD_REQUEST)
+
+        # Users see their executions and the executions of their applications (staff see everything)
+        rollups = analytics.period_rollups(days)
+        user_name = request.user.username
+        if not request.user.is_staff:
+            owned_apps = Application.objects.filter(owner=user_name).values_list("name", flat=True)
+            rollups = rollups.filter(Q(owner=user_name) | Q(app__in=owned_apps))
+
+        app_filter = self.request.query_params.get('app')
+        if app_filter is not None:
+            rollups = rollups.filter(app=app_filter)
+
+        return Response(analytics.summarize(rollups, 'app' if group == 'app' else 'owner'))
+
+
+class MetricsScraper(BasePermission):
+    """ Allows the monitoring system: requests with the METRICS_TOKEN bearer token, or from METRICS_ALLOWED_IPS """
+
+    def has_permission(self, request, view):
+        authorization = request.META.get("HTTP_AUTHORIZATION", "")
+        if settings.METRICS_TOKEN and hmac.compare_digest(authorization, "Bearer " + settings.METRICS_TOKEN):
+            return True
+        return request.META.get("REMOTE_ADDR") in settings.METRICS_ALLOWED_IPS
+
+
+class MetricsViewSet(APIView):
+    # Scraped by the monitoring system, which does not authenticate against Keycloak (metrics of this process)
+    authentication_classes = []
+    permission_classes = [MetricsScraper]
+
+    def get(self, request, format=None):
+        catalog.report_metrics()
+        return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4")
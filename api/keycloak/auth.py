@@ -1,5 +1,259 @@
+from base64 import b64encode
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS
+from josepy.errors import Error as JoseError
+from josepy.jwk import JWK
+from josepy.jws import JWS
 from mozilla_django_oidc.auth import OIDCAuthenticationBackend
-import pdb
+from requests.exceptions import RequestException
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.permissions import BasePermission
+
+from croupier import metrics
+from croupier import routers
+from croupier import transport
+from croupier.cache import LRUCache
+
+# Get an instance of a logger
+LOGGER = logging.getLogger(__name__)
+
+
+class InvalidTokenError(Exception):
+    """ The access token is malformed, not signed by the realm, expired or not issued for this client """
+
+
+class KeysUnavailableError(Exception):
+    """ The public keys of the realm could not be retrieved, so tokens cannot be verified locally """
+
+
+class JWKSCache:
+    """ Public keys of the realm, by key id. They are refreshed periodically, and on demand when a token is signed
+    with a key not known yet (key rotation), but not more often than the minimum refresh interval. A single thread
+    refreshes them, without holding the lock: the other threads keep verifying tokens with the keys already known """
+
+    def __init__(self, endpoint, refresh_interval, min_refresh):
+        self.endpoint = endpoint
+        self.refresh_interval = refresh_interval
+        self.min_refresh = min_refresh
+        self._lock = threading.Lock()
+        self._keys = {}
+        self._fetched = None
+        self._refreshing = False
+
+    def _claim_refresh(self, kid):
+        # Whether this thread has to refresh the keys. The time of the attempt is taken at once, so failed refreshes
+        # are rate limited too
+        with self._lock:
+            if self._refreshing:
+                return False
+            now = time.monotonic()
+            due = self._fetched is None or now - self._fetched >= self.refresh_interval
+            if not due and (kid in self._keys or now - self._fetched < self.min_refresh):
+                return False
+            self._refreshing = True
+            self._fetched = now
+            return True
+
+    def _refresh(self):
+        try:
+            response = transport.get(self.endpoint)
+            response.raise_for_status()
+            keys = {jwk["kid"]: jwk for jwk in response.json()["keys"] if jwk.get("use", "sig") == "sig"}
+        except (RequestException, ValueError, KeyError) as err:
+            # Keys already known are kept, so an outage of the identity provider does not stop authentication
+            LOGGER.warning("Could not retrieve the realm keys from " + self.endpoint + ": " + str(err))
+            metrics.increment("auth_jwks_refresh_total", {"result": "error"})
+            return
+        self._keys = keys
+        metrics.increment("auth_jwks_refresh_total", {"result": "ok"})
+        LOGGER.info("Realm keys refreshed: " + str(len(keys)))
+
+    def get(self, kid):
+        if self._claim_refresh(kid):
+            try:
+                self._refresh()
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        with self._lock:
+            keys = self._keys
+            refreshing = self._refreshing
+        if not keys:
+            raise KeysUnavailableError("No keys available from " + self.endpoint)
+        jwk = keys.get(kid)
+        if jwk is None:
+            if refreshing:
+                # The key may be in the keys being retrieved by another thread
+                raise KeysUnavailableError("Keys from " + self.endpoint + " being refreshed")
+            raise InvalidTokenError("Token signed with an unknown key")
+        return jwk
+
+
+_jwks = JWKSCache(settings.OIDC_OP_JWKS_ENDPOINT, settings.OIDC_JWKS_REFRESH_INTERVAL, settings.OIDC_JWKS_MIN_REFRESH)
+
+# Field values of the users already stored, by user name, so authenticated requests do not query (or upsert) them
+# every time. Every request gets its own user instance built from them
+_users = LRUCache(max_entries=1024, ttl=settings.OIDC_USER_CACHE_TTL)
+
+
+def _check_claims(claims):
+    now = time.time()
+    leeway = settings.OIDC_TOKEN_LEEWAY
+    if "exp" not in claims or claims["exp"] + leeway < now:
+        raise InvalidTokenError("Token expired")
+    if claims.get("nbf", 0) - leeway > now:
+        raise InvalidTokenError("Token not valid yet")
+    if claims.get("iss") != settings.OIDC_OP_ISSUER:
+        raise InvalidTokenError("Token issued by " + str(claims.get("iss")))
+
+    # Keycloak access tokens are addressed to the client through the authorized party, the audience might only
+    # list the resource servers
+    audience = claims.get("aud", [])
+    if not isinstance(audience, list):
+        audience = [audience]
+    if settings.OIDC_TOKEN_AUDIENCE not in audience and claims.get("azp") != settings.OIDC_TOKEN_AUDIENCE:
+        raise InvalidTokenError("Token not issued for " + settings.OIDC_TOKEN_AUDIENCE)
+    if claims.get("typ", "Bearer") != "Bearer":
+        raise InvalidTokenError("Not an access token")
+
+
+def verify_access_token(access_token):
+    """ Verify the signature and the claims of the access token with the cached realm keys, and return its claims.
+    Raises InvalidTokenError if the token is not valid, or KeysUnavailableError if it could not be verified """
+    try:
+        jws = JWS.from_compact(access_token.encode("utf-8"))
+        header = jws.signature.combined
+        alg = header.alg.name if header.alg else None
+        kid = header.kid
+    except (JoseError, ValueError, TypeError) as err:
+        raise InvalidTokenError("Malformed token: " + str(err))
+
+    # The algorithm is fixed by configuration, never taken from the token
+    if alg != settings.OIDC_RP_SIGN_ALGO:
+        raise InvalidTokenError("Unexpected signature algorithm: " + str(alg))
+
+    try:
+        if not jws.verify(JWK.from_json(_jwks.get(kid))):
+            raise InvalidTokenError("Invalid token signature")
+        claims = json.loads(jws.payload.decode("utf-8"))
+    except (JoseError, ValueError) as err:
+        raise InvalidTokenError("Invalid token: " + str(err))
+
+    _check_claims(claims)
+    return claims
+
+
+def introspect_token(access_token):
+    """ Ask Keycloak about the token (revocation included). Returns its info, or an empty dict if not active """
+    introspection_endpoint = settings.OIDC_OP_TOKEN_ENDPOINT + "/introspect"
+    basic_auth_string = '{0}:{1}'.format(settings.OIDC_RP_CLIENT_ID, settings.OIDC_RP_CLIENT_SECRET)
+    headers = {
+        'Content-type': 'application/x-www-form-urlencoded',
+        'Authorization': 'Basic {0}'.format(b64encode(basic_auth_string.encode('utf-8')).decode('utf-8')),
+    }
+
+    token_response = transport.post(introspection_endpoint, data={'token': access_token}, headers=headers)
+    if not token_response.ok:
+        raise Exception("There was a problem trying to authenticate with keycloak:\n"
+                        " HTTP code: " + str(token_response.status_code) + "\n"
+                        " Content:" + str(token_response.content) + "\n")
+
+    json_response = token_response.json()
+    if "active" in json_response and json_response["active"] is False:
+        return {}
+    return json_response
+
+
+def get_token_claims(access_token):
+    """ Claims of the token, verified locally if possible, otherwise by introspection """
+    try:
+        return verify_access_token(access_token)
+    except KeysUnavailableError:
+        LOGGER.warning("Realm keys not available, introspecting the token")
+        claims = introspect_token(access_token)
+        if not claims:
+            raise InvalidTokenError("Token not active")
+        return claims
+
+
+def get_token_user_name(access_token):
+    return get_token_claims(access_token)["preferred_username"]
+
+
+def get_user(user_name, email=""):
+    """ Stored user with the given name (created the first time), a new instance built from the fields cached per
+    process """
+    model = get_user_model()
+    fields = _users.get(user_name)
+    if fields is None:
+        user, created = model.objects.get_or_create(username=user_name, defaults={"email": email})
+        if created:
+            LOGGER.info("User Created: " + user_name)
+        _users.set(user_name, {field.attname: getattr(user, field.attname) for field in model._meta.concrete_fields})
+        return user
+    return model.from_db(DEFAULT_DB_ALIAS, list(fields), list(fields.values()))
+
+
+def forget_user(sender, instance, **kwargs):
+    """ post_save and post_delete receiver of the user model: the next request of the user reads it again """
+    _users.delete(instance.get_username())
+
+
+class KeycloakJWTAuthentication(BaseAuthentication):
+    """ Authenticates requests with a Keycloak access token verified locally (no call to Keycloak per request), or
+    introspected if the realm keys are not available. The identity is resolved once per request: views get the
+    stored user as request.user and the token as request.auth """
+
+    www_authenticate_realm = "api"
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if len(auth) != 2 or auth[0].lower() != b"bearer":
+            return None
+        access_token = auth[1].decode("utf-8", "replace")
+
+        try:
+            claims = get_token_claims(access_token)
+        except InvalidTokenError as err:
+            metrics.increment("auth_tokens_total", {"result": "invalid"})
+            raise exceptions.AuthenticationFailed(str(err))
+        except Exception as err:
+            LOGGER.error("Could not verify the token: " + str(err))
+            raise exceptions.AuthenticationFailed("Token could not be verified")
+        metrics.increment("auth_tokens_total", {"result": "valid"})
+
+        user_name = claims.get("preferred_username")
+        if not user_name:
+            raise exceptions.AuthenticationFailed("Token without user name")
+        routers.set_user(user_name)
+        return get_user(user_name, claims.get("email", "")), access_token
+
+    def authenticate_header(self, request):
+        return 'Bearer realm="%s"' % self.www_authenticate_realm
+
+
+class TokenIsActive(BasePermission):
+    """ Checks with Keycloak that the token has not been revoked, for endpoints where a token verified locally
+    (valid until it expires) is not enough """
+
+    message = "Token not active"
+
+    def has_permission(self, request, view):
+        if not request.auth:
+            return False
+        try:
+            return bool(introspect_token(request.auth))
+        except Exception as err:
+            LOGGER.error("Could not introspect the token: " + str(err))
+            return False
 
 
 class OIDCAuthBackend(OIDCAuthenticationBackend):